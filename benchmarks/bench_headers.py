@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+'''
+Microbenchmark for header decoding (decode_mime_words).
+
+Decodes the Subject/From/To/Cc of a synthetic mailbox where, like a
+real one, most mail comes from a few newsletters that repeat the same
+encoded headers, and some senders use odd charset labels
+(ks_c_5601-1987, x-unknown). Compares the old uncached decoder with
+decode_header_value() cold (empty cache) and warm, per message.
+
+    python3 benchmarks/bench_headers.py --messages 20000
+'''
+
+import argparse
+import os
+import random
+import sys
+import time
+from email.header import decode_header
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from run_benchmarks import load_retriever_module
+
+NEWSLETTERS = [
+    ("=?utf-8?q?Your_weekly_digest_=E2=80=93_5_new_photos?=", "=?utf-8?q?Flickr?= <no-reply@flickr.com>"),
+    ("=?iso-8859-1?q?R=E9duction_de_20=25_sur_tout?=", "=?iso-8859-1?q?Boutique_Caf=E9?= <news@cafe.example.fr>"),
+    ("=?ks_c_5601-1987?B?waS6uLO7v+sguMe4rg==?=", "=?ks_c_5601-1987?B?waS6uA==?= <mail@shop.example.kr>"),
+    ("=?UTF-8?B?0JLQsNGIINC30LDQutCw0Lcg0L7RgtC/0YDQsNCy0LvQtdC9?=", "=?UTF-8?B?0JzQsNCz0LDQt9C40L0=?= <shop@example.ru>"),
+    ("=?x-unknown?q?Special_offer?=", "Deals <deals@example.com>"),
+    ("=?gb2312?B?xPq1xLap taXS0b eiu/U=?=", "=?gb2312?B?zNSxpg==?= <service@example.cn>"),
+    ("Order confirmation #4471", "Amazon.de <versandbestaetigung@amazon.de>"),
+]
+
+
+def old_decode_mime_words(s):
+    """decode_mime_words as it was before the cache, for comparison"""
+    if s is None:
+        return ""
+    decoded_parts = []
+    for part, encoding in decode_header(s):
+        if isinstance(part, bytes):
+            if encoding:
+                try:
+                    decoded_parts.append(part.decode(encoding))
+                except (UnicodeDecodeError, LookupError):
+                    decoded_parts.append(part.decode('utf-8', errors='ignore'))
+            else:
+                decoded_parts.append(part.decode('utf-8', errors='ignore'))
+        else:
+            decoded_parts.append(str(part))
+    return ''.join(decoded_parts)
+
+
+def synthetic_headers(messages, newsletter_share, seed):
+    """Return a (subject, from, to, cc) tuple per message"""
+    rng = random.Random(seed)
+    headers = []
+    for n in range(messages):
+        if rng.random() < newsletter_share:
+            subject, sender = rng.choice(NEWSLETTERS)
+        else:
+            # One-off personal mail: unique subjects, some encoded
+            subject = f"Re: meeting notes {n}" if rng.random() < 0.7 else f"=?utf-8?q?Gr=C3=BC=C3=9Fe_{n}?="
+            sender = f"Person {n % 300} <person{n % 300}@example.org>"
+        cc = "" if rng.random() < 0.8 else "=?utf-8?q?J=C3=B6rg?= <joerg@example.de>"
+        headers.append((subject, sender, "me@yahoo.com", cc))
+    return headers
+
+
+def timed(decode, headers):
+    started = time.perf_counter()
+    for message in headers:
+        for value in message:
+            decode(value)
+    return time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark header decoding")
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--newsletters", type=float, default=0.7, help="share of messages with repeated newsletter headers")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    module = load_retriever_module()
+    retriever = module.YahooEmailRetriever()
+    headers = synthetic_headers(args.messages, args.newsletters, args.seed)
+
+    changed = sum(old_decode_mime_words(value) != retriever.decode_mime_words(value) for message in headers for value in message)
+    module.decode_header_value.cache_clear()
+    module.resolve_codec.cache_clear()
+
+    old = timed(old_decode_mime_words, headers)
+    cold = timed(retriever.decode_mime_words, headers)
+    warm = timed(retriever.decode_mime_words, headers)
+
+    per_message = 1e6 / args.messages
+    print(f"{args.messages} messages, {args.newsletters:.0%} newsletters")
+    print(f"old decoder        {old * per_message:8.2f} us/message")
+    print(f"cached, cold       {cold * per_message:8.2f} us/message  ({old / cold:.1f}x)")
+    print(f"cached, warm       {warm * per_message:8.2f} us/message  ({old / warm:.1f}x)")
+    print(f"cache: {module.decode_header_value.cache_info()}")
+    print(f"{changed} header values decode differently from the old decoder (charset aliases)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+'''
+Startup benchmark for the command line entry points.
+
+Times fresh interpreters that import each command's module (and, with
+--help, run its argument parser), minus the time of a bare interpreter,
+and lists the slowest imports reported by python -X importtime, leaving
+out what the bare interpreter imports anyway. Pass --script to time a
+loose script the old way (compiled from source on every run), e.g.
+get-yh-emails.py from before the yahoo_imap package:
+
+    python3 benchmarks/bench_startup.py
+    git show <commit>:get-yh-emails.py > /tmp/old.py && python3 benchmarks/bench_startup.py --script /tmp/old.py
+'''
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# name: code run by the fresh interpreter
+COMMANDS = {
+    "retriever": "import yahoo_imap.retriever",
+    "retriever --help": "import sys; sys.argv[1:] = ['--help']; from yahoo_imap.retriever import main; main()",
+    "getemail": "import yahoo_imap.getemail",
+    "batch (--config)": "import yahoo_imap.batch",
+}
+
+
+def run_python(code, env):
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], cwd=REPO_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+    return time.perf_counter() - started
+
+
+def median_ms(code, runs, env):
+    return statistics.median(run_python(code, env) for _ in range(runs)) * 1000
+
+
+def import_times(code, env):
+    """(depth, cumulative microseconds, module) for every import of code, from python -X importtime"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=REPO_DIR, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or line.count("|") != 2:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            # Nested imports are indented two spaces per level under the module that triggered them
+            imports.append(((len(name) - len(name.lstrip()) - 1) // 2, int(cumulative), name.strip()))
+    return imports
+
+
+def slowest_imports(code, env, count, startup):
+    """Slowest modules imported at the top level or directly by yahoo_imap, skipping interpreter startup"""
+    imports = [(cumulative, module) for depth, cumulative, module in import_times(code, env)
+               if depth <= 1 and module not in startup and not module.startswith("yahoo_imap")]
+    return sorted(imports, reverse=True)[:count]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark command startup time")
+    parser.add_argument("--runs", type=int, default=15, help="interpreters started per measurement (default 15)")
+    parser.add_argument("--top", type=int, default=8, help="slowest imports listed per command (default 8)")
+    parser.add_argument("--script", help="also time loading this loose script from source")
+    args = parser.parse_args(argv)
+
+    env = dict(os.environ, PYTHONPATH=REPO_DIR)
+    commands = dict(COMMANDS)
+    if args.script:
+        commands["script"] = ("import importlib.util; spec = importlib.util.spec_from_file_location('script', %r); "
+                              "spec.loader.exec_module(importlib.util.module_from_spec(spec))" % os.path.abspath(args.script))
+    # Write the bytecode caches first, as every run after the first one finds them
+    for code in commands.values():
+        run_python(code, env)
+
+    bare = median_ms("pass", args.runs, env)
+    print(f"bare interpreter   {bare:7.1f} ms (subtracted below)")
+    for name, code in commands.items():
+        print(f"{name:<18} {median_ms(code, args.runs, env) - bare:7.1f} ms")
+    startup = {module for _, _, module in import_times("pass", env)}
+    for name, code in commands.items():
+        print(f"\nslowest imports, {name}:")
+        for cumulative, module in slowest_imports(code, env, args.top, startup):
+            print(f"  {cumulative / 1000:7.1f} ms  {module}")
+
+
+if __name__ == "__main__":
+    main()
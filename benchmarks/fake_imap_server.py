@@ -0,0 +1,710 @@
+#!/usr/bin/env python3
+
+'''
+Local IMAP4rev1 stand-in used to exercise YahooEmailRetriever without
+touching the real Yahoo servers.
+
+Implements the subset of the protocol the retriever uses (LOGIN, LIST,
+SELECT/EXAMINE, STATUS, SEARCH, FETCH, UID, NOOP, IDLE, CLOSE, LOGOUT)
+over plain TCP on loopback, with optional injected per-command latency
+and a bandwidth cap. Like Yahoo, it can also refuse FETCHes of more
+than fetch_limit messages (NO [LIMIT]) and FETCHes beyond rate_limit
+bytes per second (NO [UNAVAILABLE]). Run it on its own to serve a
+directory written by generate_mailbox.py:
+
+    python3 benchmarks/fake_imap_server.py mailbox_dir --port 1143 --latency 0.05
+'''
+
+import argparse
+import email
+import email.utils
+import os
+import re
+import select
+import socketserver
+import threading
+import time
+from datetime import datetime, timezone
+from email import policy
+from email.header import decode_header, make_header
+
+
+def imap_quote(value):
+    """Render a string as an IMAP quoted string, literal or NIL"""
+    if value is None:
+        return b"NIL"
+    if isinstance(value, str):
+        value = value.encode('utf-8', errors='replace')
+    if all(32 <= b < 127 for b in value) and b'"' not in value and b'\\' not in value:
+        return b'"' + value + b'"'
+    return b"{" + str(len(value)).encode() + b"}\r\n" + value
+
+
+def address_list(header_value):
+    if not header_value:
+        return b"NIL"
+    addresses = email.utils.getaddresses([str(header_value)])
+    items = []
+    for name, addr in addresses:
+        mailbox, _, host = addr.partition('@')
+        items.append(b"(" + b" ".join([imap_quote(name or None), b"NIL", imap_quote(mailbox or None), imap_quote(host or None)]) + b")")
+    return b"(" + b"".join(items) + b")" if items else b"NIL"
+
+
+def build_envelope(msg):
+    """Build an ENVELOPE response for a parsed message"""
+    from_header = msg.get("From")
+    fields = [
+        imap_quote(msg.get("Date")),
+        imap_quote(msg.get("Subject")),
+        address_list(from_header),
+        address_list(msg.get("Sender") or from_header),
+        address_list(msg.get("Reply-To") or from_header),
+        address_list(msg.get("To")),
+        address_list(msg.get("Cc")),
+        address_list(msg.get("Bcc")),
+        imap_quote(msg.get("In-Reply-To")),
+        imap_quote(msg.get("Message-ID")),
+    ]
+    return b"(" + b" ".join(fields) + b")"
+
+
+def param_list(part):
+    params = part.get_params(header='content-type') or []
+    items = []
+    for key, value in params[1:]:
+        if isinstance(value, tuple):
+            value = email.utils.collapse_rfc2231_value(value)
+        items.append(imap_quote(key.upper()))
+        items.append(imap_quote(str(value)))
+    return b"(" + b" ".join(items) + b")" if items else b"NIL"
+
+
+def disposition_list(part):
+    disposition = part.get("Content-Disposition")
+    if not disposition:
+        return b"NIL"
+    params = part.get_params(header='content-disposition') or []
+    items = []
+    for key, value in params[1:]:
+        if isinstance(value, tuple):
+            value = email.utils.collapse_rfc2231_value(value)
+        items.append(imap_quote(key.upper()))
+        items.append(imap_quote(str(value)))
+    kind = str(disposition).split(';')[0].strip()
+    return b"(" + imap_quote(kind) + b" " + (b"(" + b" ".join(items) + b")" if items else b"NIL") + b")"
+
+
+def build_bodystructure(part):
+    """Build a BODYSTRUCTURE response for a parsed message (part)"""
+    if part.is_multipart():
+        children = b"".join(build_bodystructure(child) for child in part.get_payload())
+        return b"(" + children + b" " + imap_quote(part.get_content_subtype()) + b" " + param_list(part) + b" " + disposition_list(part) + b" NIL NIL)"
+
+    raw_payload = part.get_payload(decode=False)
+    if isinstance(raw_payload, str):
+        raw_payload = raw_payload.encode('utf-8', errors='surrogateescape')
+    elif not isinstance(raw_payload, bytes):
+        raw_payload = b""
+    size = len(raw_payload)
+    fields = [
+        imap_quote(part.get_content_maintype()),
+        imap_quote(part.get_content_subtype()),
+        param_list(part),
+        imap_quote(part.get("Content-ID")),
+        imap_quote(part.get("Content-Description")),
+        imap_quote((part.get("Content-Transfer-Encoding") or "7bit").strip()),
+        str(size).encode(),
+    ]
+    if part.get_content_maintype() == 'text':
+        fields.append(str(raw_payload.count(b"\n")).encode())
+    fields.extend([b"NIL", disposition_list(part), b"NIL", b"NIL"])
+    return b"(" + b" ".join(fields) + b")"
+
+
+class Mailbox:
+    """A folder held in memory"""
+
+    def __init__(self, name, uidvalidity=None):
+        self.name = name
+        self.uidvalidity = uidvalidity or int(time.time())
+        self.messages = []
+        self.next_uid = 1
+        self.highest_modseq = 1
+        self.lock = threading.RLock()
+        self.changed = threading.Condition(self.lock)
+
+    def append(self, raw, flags=(), internaldate=None):
+        with self.lock:
+            self.highest_modseq += 1
+            self.messages.append({
+                'uid': self.next_uid,
+                'raw': raw,
+                'flags': set(flags),
+                'internaldate': internaldate or datetime.now(timezone.utc),
+                'modseq': self.highest_modseq,
+                'parsed': None,
+            })
+            self.next_uid += 1
+            self.changed.notify_all()
+
+    def expunge_uid(self, uid):
+        with self.lock:
+            self.messages = [m for m in self.messages if m['uid'] != uid]
+            self.highest_modseq += 1
+            self.changed.notify_all()
+
+    def set_flags(self, uid, flags):
+        with self.lock:
+            for message in self.messages:
+                if message['uid'] == uid:
+                    self.highest_modseq += 1
+                    message['flags'] = set(flags)
+                    message['modseq'] = self.highest_modseq
+            self.changed.notify_all()
+
+
+def parsed_message(message):
+    if message['parsed'] is None:
+        message['parsed'] = email.message_from_bytes(message['raw'], policy=policy.compat32)
+    return message['parsed']
+
+
+def parse_sequence_set(spec, maximum):
+    """Parse an IMAP sequence set into a predicate"""
+    ranges = []
+    for item in spec.split(','):
+        if ':' in item:
+            a, b = item.split(':', 1)
+            a = maximum if a == '*' else int(a)
+            b = maximum if b == '*' else int(b)
+            ranges.append((min(a, b), max(a, b)))
+        else:
+            n = maximum if item == '*' else int(item)
+            ranges.append((n, n))
+    return lambda n: any(lo <= n <= hi for lo, hi in ranges)
+
+
+def tokenize_command(line):
+    """Split a command line into atoms, quoted strings and parenthesised groups"""
+    tokens = []
+    i = 0
+    while i < len(line):
+        c = line[i]
+        if c == ' ':
+            i += 1
+        elif c == '"':
+            j = i + 1
+            buf = []
+            while line[j] != '"':
+                if line[j] == '\\':
+                    j += 1
+                buf.append(line[j])
+                j += 1
+            tokens.append(''.join(buf))
+            i = j + 1
+        elif c == '(':
+            depth = 0
+            j = i
+            while True:
+                if line[j] == '(':
+                    depth += 1
+                elif line[j] == ')':
+                    depth -= 1
+                    if depth == 0:
+                        break
+                j += 1
+            tokens.append(line[i:j + 1])
+            i = j + 1
+        else:
+            j = i
+            depth = 0
+            while j < len(line) and (line[j] != ' ' or depth):
+                if line[j] == '[':
+                    depth += 1
+                elif line[j] == ']':
+                    depth -= 1
+                j += 1
+            tokens.append(line[i:j])
+            i = j
+    return tokens
+
+
+IMAP_MONTHS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+
+def parse_imap_date(value):
+    day, month, year = value.split('-')
+    return datetime(int(year), IMAP_MONTHS.index(month) + 1, int(day), tzinfo=timezone.utc)
+
+
+class IMAPHandler(socketserver.StreamRequestHandler):
+    """One client session"""
+
+    # Responses go out in several small writes; without this every
+    # round trip waits on delayed ACKs
+    disable_nagle_algorithm = True
+
+    def send(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        self.wfile.write(data)
+
+    def handle(self):
+        self.selected = None
+        self.send(b"* OK [CAPABILITY IMAP4rev1 IDLE CONDSTORE UIDPLUS] fake IMAP ready\r\n")
+        server = self.server
+        with server.lock:
+            server.active_sessions += 1
+            server.peak_sessions = max(server.peak_sessions, server.active_sessions)
+        try:
+            while True:
+                line = self.rfile.readline()
+                if not line:
+                    return
+                line = line.rstrip(b"\r\n")
+                # 8-bit data is only legal inside literals; real servers reject it inline
+                eight_bit = not line.isascii()
+                # Literals in commands (LOGIN with odd passwords, CHARSET UTF-8 searches)
+                while line.endswith(b"}") and b"{" in line:
+                    size = int(line[line.rindex(b"{") + 1:-1].rstrip(b"+"))
+                    if not line.endswith(b"+}"):
+                        self.send(b"+ go ahead\r\n")
+                    literal = self.rfile.read(size)
+                    rest = self.rfile.readline().rstrip(b"\r\n")
+                    eight_bit = eight_bit or not rest.isascii()
+                    line = line[:line.rindex(b"{")] + b'"' + literal.replace(b"\\", b"\\\\").replace(b'"', b'\\"') + b'"' + rest
+                text = line.decode('utf-8', errors='replace')
+                parts = text.split(' ', 2)
+                if len(parts) < 2:
+                    self.send(b"* BAD invalid command\r\n")
+                    continue
+                tag, command = parts[0], parts[1].upper()
+                args = parts[2] if len(parts) > 2 else ''
+                if eight_bit:
+                    self.send(f"{tag} BAD 8-bit data outside a literal\r\n")
+                    continue
+                if server.latency:
+                    time.sleep(server.latency)
+                if server.fail_after is not None:
+                    with server.lock:
+                        server.commands_seen += 1
+                        drop = server.commands_seen > server.fail_after
+                        if drop:
+                            server.fail_after = None
+                    if drop:
+                        return
+                handler = getattr(self, 'cmd_' + command.lower(), None)
+                if handler is None:
+                    self.send(f"{tag} BAD unknown command {command}\r\n")
+                    continue
+                try:
+                    if handler(tag, args) is False:
+                        return
+                except Exception as e:
+                    self.send(f"{tag} BAD {type(e).__name__}: {e}\r\n")
+                self.wfile.flush()
+        finally:
+            with server.lock:
+                server.active_sessions -= 1
+
+    def cmd_capability(self, tag, args):
+        self.send(b"* CAPABILITY IMAP4rev1 IDLE CONDSTORE UIDPLUS\r\n")
+        self.send(f"{tag} OK CAPABILITY completed\r\n")
+
+    def cmd_login(self, tag, args):
+        user, password = tokenize_command(args)[:2]
+        if self.server.credentials and self.server.credentials.get(user) != password:
+            self.send(f"{tag} NO [AUTHENTICATIONFAILED] invalid credentials\r\n")
+            return
+        self.send(f"{tag} OK LOGIN completed\r\n")
+
+    def cmd_logout(self, tag, args):
+        self.send(b"* BYE logging out\r\n")
+        self.send(f"{tag} OK LOGOUT completed\r\n")
+        self.wfile.flush()
+        return False
+
+    def cmd_noop(self, tag, args):
+        self.report_changes()
+        self.send(f"{tag} OK NOOP completed\r\n")
+
+    def cmd_enable(self, tag, args):
+        self.send(b"* ENABLED CONDSTORE\r\n")
+        self.send(f"{tag} OK ENABLE completed\r\n")
+
+    def cmd_list(self, tag, args):
+        for name in self.server.mailboxes:
+            self.send(f'* LIST (\\HasNoChildren) "/" "{name}"\r\n')
+        self.send(f"{tag} OK LIST completed\r\n")
+
+    def find_mailbox(self, name):
+        name = name.strip('"')
+        return self.server.mailboxes.get(name)
+
+    def cmd_select(self, tag, args, readonly=False):
+        name = tokenize_command(args)[0]
+        mailbox = self.find_mailbox(name)
+        if mailbox is None:
+            self.send(f"{tag} NO no such mailbox\r\n")
+            return
+        self.selected = mailbox
+        with mailbox.lock:
+            self.known_exists = len(mailbox.messages)
+            self.send(f"* {len(mailbox.messages)} EXISTS\r\n")
+            self.send(b"* 0 RECENT\r\n")
+            self.send(b"* FLAGS (\\Answered \\Flagged \\Deleted \\Seen \\Draft)\r\n")
+            self.send(f"* OK [UIDVALIDITY {mailbox.uidvalidity}] UIDs valid\r\n")
+            self.send(f"* OK [UIDNEXT {mailbox.next_uid}] next UID\r\n")
+            self.send(f"* OK [HIGHESTMODSEQ {mailbox.highest_modseq}] modseq\r\n")
+        self.send(f"{tag} OK [{'READ-ONLY' if readonly else 'READ-WRITE'}] SELECT completed\r\n")
+
+    def cmd_examine(self, tag, args):
+        self.cmd_select(tag, args, readonly=True)
+
+    def cmd_status(self, tag, args):
+        tokens = tokenize_command(args)
+        mailbox = self.find_mailbox(tokens[0])
+        if mailbox is None:
+            self.send(f"{tag} NO no such mailbox\r\n")
+            return
+        with mailbox.lock:
+            items = {
+                'MESSAGES': len(mailbox.messages),
+                'UIDNEXT': mailbox.next_uid,
+                'UIDVALIDITY': mailbox.uidvalidity,
+                'UNSEEN': sum(1 for m in mailbox.messages if '\\Seen' not in m['flags']),
+                'RECENT': 0,
+                'HIGHESTMODSEQ': mailbox.highest_modseq,
+            }
+        wanted = tokens[1].strip('()').split()
+        body = " ".join(f"{item.upper()} {items[item.upper()]}" for item in wanted)
+        self.send(f'* STATUS "{mailbox.name}" ({body})\r\n')
+        self.send(f"{tag} OK STATUS completed\r\n")
+
+    def cmd_close(self, tag, args):
+        self.selected = None
+        self.send(f"{tag} OK CLOSE completed\r\n")
+
+    def report_changes(self):
+        mailbox = self.selected
+        if mailbox is None:
+            return
+        with mailbox.lock:
+            if len(mailbox.messages) != self.known_exists:
+                self.known_exists = len(mailbox.messages)
+                self.send(f"* {self.known_exists} EXISTS\r\n")
+
+    def cmd_idle(self, tag, args):
+        self.send(b"+ idling\r\n")
+        self.wfile.flush()
+        mailbox = self.selected
+        while True:
+            if mailbox is not None:
+                with mailbox.lock:
+                    if len(mailbox.messages) != self.known_exists:
+                        self.report_changes()
+                        self.wfile.flush()
+            # A socket timeout would leave rfile unusable, so wait with select
+            if not select.select([self.connection], [], [], 0.05)[0]:
+                continue
+            line = self.rfile.readline()
+            if not line:
+                return False
+            if line.strip().upper() == b"DONE":
+                break
+        self.send(f"{tag} OK IDLE terminated\r\n")
+
+    def cmd_uid(self, tag, args):
+        sub, _, rest = args.partition(' ')
+        sub = sub.upper()
+        if sub == 'SEARCH':
+            return self.cmd_search(tag, rest, uid=True)
+        if sub == 'FETCH':
+            return self.cmd_fetch(tag, rest, uid=True)
+        self.send(f"{tag} BAD unsupported UID {sub}\r\n")
+
+    def matches(self, message, seq, criteria, uid_max):
+        i = 0
+        while i < len(criteria):
+            key = criteria[i].upper()
+            i += 1
+            if key in ('ALL', 'CHARSET'):
+                if key == 'CHARSET':
+                    i += 1
+                continue
+            if key == 'UID':
+                if not parse_sequence_set(criteria[i], uid_max)(message['uid']):
+                    return False
+                i += 1
+            elif key in ('SINCE', 'BEFORE'):
+                date = parse_imap_date(criteria[i])
+                i += 1
+                internal = message['internaldate']
+                if key == 'SINCE' and internal.date() < date.date():
+                    return False
+                if key == 'BEFORE' and internal.date() >= date.date():
+                    return False
+            elif key in ('FROM', 'SUBJECT', 'TO'):
+                needle = criteria[i].lower()
+                i += 1
+                header = parsed_message(message).get(key.title(), '')
+                if needle not in str(make_header(decode_header(header))).lower():
+                    return False
+            elif key == 'UNSEEN':
+                if '\\Seen' in message['flags']:
+                    return False
+            elif key == 'SEEN':
+                if '\\Seen' not in message['flags']:
+                    return False
+            elif key == 'FLAGGED':
+                if '\\Flagged' not in message['flags']:
+                    return False
+            elif key == 'LARGER':
+                if not len(message['raw']) > int(criteria[i]):
+                    return False
+                i += 1
+            elif key == 'SMALLER':
+                if not len(message['raw']) < int(criteria[i]):
+                    return False
+                i += 1
+            elif key == 'MODSEQ':
+                if not message['modseq'] > int(criteria[i]):
+                    return False
+                i += 1
+            elif re.match(r'^[\d:*,]+$', key):
+                if not parse_sequence_set(key, len(self.selected.messages))(seq):
+                    return False
+            else:
+                raise ValueError(f"unsupported search key {key}")
+        return True
+
+    def cmd_search(self, tag, args, uid=False):
+        mailbox = self.selected
+        criteria = tokenize_command(args)
+        with mailbox.lock:
+            uid_max = mailbox.messages[-1]['uid'] if mailbox.messages else 0
+            hits = [
+                str(m['uid'] if uid else seq)
+                for seq, m in enumerate(mailbox.messages, 1)
+                if self.matches(m, seq, criteria, uid_max)
+            ]
+        self.send(("* SEARCH " + " ".join(hits)).rstrip() + "\r\n")
+        self.send(f"{tag} OK SEARCH completed\r\n")
+
+    def fetch_item(self, message, seq, item):
+        raw = message['raw']
+        upper = item.upper()
+        if upper == 'UID':
+            return b"UID " + str(message['uid']).encode()
+        if upper == 'FLAGS':
+            return b"FLAGS (" + " ".join(sorted(message['flags'])).encode() + b")"
+        if upper == 'MODSEQ':
+            return b"MODSEQ (" + str(message['modseq']).encode() + b")"
+        if upper == 'RFC822.SIZE':
+            return b"RFC822.SIZE " + str(len(raw)).encode()
+        if upper == 'INTERNALDATE':
+            stamp = message['internaldate'].strftime('%d-%b-%Y %H:%M:%S +0000')
+            return b'INTERNALDATE "' + stamp.encode() + b'"'
+        if upper == 'ENVELOPE':
+            return b"ENVELOPE " + build_envelope(parsed_message(message))
+        if upper in ('BODYSTRUCTURE', 'BODY'):
+            return upper.encode() + b" " + build_bodystructure(parsed_message(message))
+        if upper in ('RFC822', 'BODY[]', 'BODY.PEEK[]'):
+            name = b"RFC822" if upper == 'RFC822' else b"BODY[]"
+            return name + b" {" + str(len(raw)).encode() + b"}\r\n" + raw
+        if upper == 'RFC822.HEADER':
+            header = raw.split(b"\r\n\r\n", 1)[0] + b"\r\n\r\n"
+            return b"RFC822.HEADER {" + str(len(header)).encode() + b"}\r\n" + header
+        match = re.match(r'^BODY(?:\.PEEK)?\[([^\]]*)\](?:<(\d+)\.(\d+)>)?$', item, re.I)
+        if match:
+            section, offset, length = match.group(1), match.group(2), match.group(3)
+            data = self.section_data(message, section)
+            label = f"BODY[{section}]"
+            if offset is not None:
+                data = data[int(offset):int(offset) + int(length)]
+                label += f"<{offset}>"
+            return label.encode() + b" {" + str(len(data)).encode() + b"}\r\n" + data
+        raise ValueError(f"unsupported fetch item {item}")
+
+    def section_data(self, message, section):
+        raw = message['raw']
+        upper = section.upper()
+        if upper == '':
+            return raw
+        if upper == 'HEADER':
+            return raw.split(b"\r\n\r\n", 1)[0] + b"\r\n\r\n"
+        if upper.startswith('HEADER.FIELDS'):
+            wanted = [f.lower() for f in section[section.index('(') + 1:section.index(')')].split()]
+            msg = parsed_message(message)
+            lines = []
+            for key, value in msg.items():
+                if key.lower() in wanted:
+                    lines.append(f"{key}: {value}")
+            return ("\r\n".join(lines) + "\r\n\r\n").encode('utf-8', errors='surrogateescape')
+        if upper == 'TEXT':
+            return raw.split(b"\r\n\r\n", 1)[1] if b"\r\n\r\n" in raw else b""
+        part = parsed_message(message)
+        numbers = section.split('.')
+        suffix = None
+        if numbers[-1].upper() in ('MIME', 'HEADER', 'TEXT'):
+            suffix = numbers.pop().upper()
+        for number in numbers:
+            if part.is_multipart():
+                part = part.get_payload()[int(number) - 1]
+            elif int(number) != 1:
+                raise ValueError(f"no such section {section}")
+        if suffix == 'MIME':
+            return "".join(f"{k}: {v}\r\n" for k, v in part.items()).encode() + b"\r\n"
+        payload = part.get_payload(decode=False)
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8', errors='surrogateescape')
+        if part.is_multipart():
+            payload = part.as_bytes().split(b"\n\n", 1)[1]
+        return payload
+
+    def cmd_fetch(self, tag, args, uid=False):
+        mailbox = self.selected
+        spec, _, items = args.partition(' ')
+        items = items.strip()
+        changedsince = None
+        modifier = re.search(r'\(CHANGEDSINCE (\d+)\)\s*$', items, re.I)
+        if modifier:
+            changedsince = int(modifier.group(1))
+            items = items[:modifier.start()].strip()
+        if items.startswith('('):
+            items = items[1:-1]
+        wanted = tokenize_command(items)
+        if uid and 'UID' not in [w.upper() for w in wanted]:
+            wanted.insert(0, 'UID')
+        if changedsince is not None and 'MODSEQ' not in [w.upper() for w in wanted]:
+            wanted.append('MODSEQ')
+        with mailbox.lock:
+            messages = list(enumerate(mailbox.messages, 1))
+            maximum = messages[-1][1]['uid' if uid else 'uid'] if messages else 0
+            if not uid:
+                maximum = len(messages)
+        in_set = parse_sequence_set(spec, maximum)
+        matching = [(seq, message) for seq, message in messages if in_set(message['uid'] if uid else seq)]
+        refusal = self.server.check_limits(len(matching))
+        if refusal:
+            self.send(f"{tag} NO {refusal}\r\n")
+            return
+        out = []
+        for seq, message in matching:
+            if changedsince is not None and message['modseq'] <= changedsince:
+                continue
+            body = b" ".join(self.fetch_item(message, seq, item) for item in wanted)
+            out.append(b"* " + str(seq).encode() + b" FETCH (" + body + b")\r\n")
+            if self.server.bytes_per_second:
+                time.sleep(len(body) / self.server.bytes_per_second)
+        self.server.charge(sum(len(line) for line in out))
+        self.send(b"".join(out))
+        self.send(f"{tag} OK FETCH completed\r\n")
+
+
+class FakeIMAPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address=("127.0.0.1", 0), latency=0.0, bytes_per_second=None, credentials=None, rate_limit=None,
+                 fetch_limit=None):
+        super().__init__(address, IMAPHandler)
+        self.latency = latency
+        self.bytes_per_second = bytes_per_second
+        # Throttling: FETCH bytes per second over all sessions (one second of burst) and messages per FETCH
+        self.rate_limit = rate_limit
+        self.fetch_limit = fetch_limit
+        self.rate_tokens = rate_limit or 0
+        self.rate_updated = time.monotonic()
+        self.throttled = 0
+        self.credentials = credentials
+        self.mailboxes = {}
+        self.lock = threading.Lock()
+        self.active_sessions = 0
+        self.peak_sessions = 0
+        self.fail_after = None
+        self.commands_seen = 0
+        # Failure injection: the next this many FETCHes get a plain NO (no throttling code)
+        self.fail_fetches = 0
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def check_limits(self, messages):
+        """Response text refusing a FETCH of messages messages, or None to serve it"""
+        with self.lock:
+            if self.fail_fetches:
+                self.fail_fetches -= 1
+                return "Internal server error"
+            if self.fetch_limit and messages > self.fetch_limit:
+                self.throttled += 1
+                return f"[LIMIT] at most {self.fetch_limit} messages per FETCH"
+            if self.rate_limit:
+                now = time.monotonic()
+                self.rate_tokens = min(self.rate_limit, self.rate_tokens + (now - self.rate_updated) * self.rate_limit)
+                self.rate_updated = now
+                if self.rate_tokens < 0:
+                    self.throttled += 1
+                    return "[UNAVAILABLE] Server busy, try again later"
+        return None
+
+    def charge(self, nbytes):
+        """Count FETCH bytes against rate_limit"""
+        if self.rate_limit:
+            with self.lock:
+                self.rate_tokens -= nbytes
+
+    def add_mailbox(self, name, uidvalidity=None):
+        self.mailboxes[name] = Mailbox(name, uidvalidity)
+        return self.mailboxes[name]
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def load_mailbox_dir(server, path):
+    """Load a directory of <folder>/<n>.eml files into the server"""
+    for folder in sorted(os.listdir(path)):
+        folder_path = os.path.join(path, folder)
+        if not os.path.isdir(folder_path):
+            continue
+        mailbox = server.add_mailbox(folder)
+        for name in sorted(os.listdir(folder_path)):
+            if name.endswith('.eml'):
+                with open(os.path.join(folder_path, name), 'rb') as f:
+                    mailbox.append(f.read())
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a directory of .eml files over IMAP on loopback")
+    parser.add_argument("mailbox_dir", help="directory of <folder>/<n>.eml files (see generate_mailbox.py)")
+    parser.add_argument("--port", type=int, default=1143)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every command")
+    parser.add_argument("--bandwidth", type=int, help="FETCH bytes per second")
+    parser.add_argument("--rate-limit", type=int, help="refuse FETCHes with [UNAVAILABLE] beyond this many bytes per second")
+    parser.add_argument("--fetch-limit", type=int, help="refuse FETCHes of more messages than this with [LIMIT]")
+    args = parser.parse_args(argv)
+
+    server = load_mailbox_dir(FakeIMAPServer(("127.0.0.1", args.port), args.latency, args.bandwidth, rate_limit=args.rate_limit,
+                                             fetch_limit=args.fetch_limit), args.mailbox_dir)
+    print(f"Serving {sum(len(m.messages) for m in server.mailboxes.values())} messages in {len(server.mailboxes)} folders "
+          f"on 127.0.0.1:{server.port} (any login)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
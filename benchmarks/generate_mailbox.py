@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+'''
+Synthetic mailbox generator for the benchmarks.
+
+Builds RFC822 messages with roughly the mix a real Yahoo mailbox has:
+log-normal body and attachment sizes, plain/HTML/alternative bodies,
+a spread of charsets and transfer encodings, encoded-word subjects and
+a share of attachments repeated across messages (logos, signatures).
+The same seed always gives the same mailbox.
+
+    python3 benchmarks/generate_mailbox.py mailbox_dir --messages 2000 --folders INBOX Archive
+'''
+
+import argparse
+import os
+import random
+from email.message import EmailMessage
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+
+# (charset, transfer encoding, share of messages, sample text)
+CHARSETS = [
+    ("utf-8", "quoted-printable", 0.40, "Grüße aus Köln – das Angebot gilt bis Freitag. Café, naïve, señor. "),
+    ("utf-8", "base64", 0.10, "Ваш заказ отправлен. 注文は発送されました。 Ihre Bestellung ist unterwegs. "),
+    ("us-ascii", "7bit", 0.15, "Your order has shipped and should arrive within three business days. "),
+    ("iso-8859-1", "quoted-printable", 0.12, "Réunion à 15h, n'oubliez pas le café. Número de pedido: "),
+    ("windows-1252", "quoted-printable", 0.10, "Don’t miss our “biggest” sale — 20% off everything. "),
+    ("iso-2022-jp", "7bit", 0.05, "ご注文ありがとうございます。商品は明日発送されます。"),
+    ("gb2312", "base64", 0.04, "您的订单已发货，预计三天内送达。"),
+    ("koi8-r", "8bit", 0.04, "Спасибо за покупку, ваш заказ уже в пути. "),
+]
+
+# (maintype, subtype, extension, share of attachments)
+ATTACHMENT_TYPES = [
+    ("application", "pdf", "pdf", 0.35),
+    ("image", "jpeg", "jpg", 0.25),
+    ("image", "png", "png", 0.15),
+    ("application", "vnd.openxmlformats-officedocument.wordprocessingml.document", "docx", 0.10),
+    ("application", "zip", "zip", 0.10),
+    ("text", "calendar", "ics", 0.05),
+]
+
+SENDERS = ["Flickr <no-reply@flickr.com>", "Yahoo <no-reply@cc.yahoo-inc.com>", "Amazon.de <versandbestaetigung@amazon.de>",
+           "Jörg Müller <joerg@example.de>", "山田太郎 <taro@example.jp>", "Newsletter <news@shop.example.com>",
+           "Alice <alice@example.org>", "Bob Smith <bob@example.net>"]
+
+
+def pick(rng, choices, weight_index):
+    return rng.choices(choices, weights=[choice[weight_index] for choice in choices])[0]
+
+
+def lognormal_size(rng, median, sigma, maximum):
+    return max(16, min(maximum, int(rng.lognormvariate(0, sigma) * median)))
+
+
+def body_text(rng, sample, size):
+    """Repeat a sample sentence (with a little variation) up to about size characters"""
+    lines = []
+    length = 0
+    while length < size:
+        line = sample * rng.randint(1, 3) + str(rng.randint(1000, 99999))
+        lines.append(line)
+        length += len(line) + 1
+    return "\n".join(lines) + "\n"
+
+
+def generate_message(rng, n, shared_attachments, start=datetime(2024, 1, 1, tzinfo=timezone.utc)):
+    """Build one message and return its bytes (CRLF line endings)"""
+    charset, encoding, _, sample = pick(rng, CHARSETS, 2)
+    text = body_text(rng, sample, lognormal_size(rng, 1500, 1.0, 200_000))
+
+    msg = EmailMessage()
+    subject = (sample.split(".")[0] or sample)[:60].strip() + f" #{n}"
+    msg['Subject'] = subject
+    msg['From'] = rng.choice(SENDERS)
+    msg['To'] = "me@yahoo.com"
+    if rng.random() < 0.2:
+        msg['Cc'] = rng.choice(SENDERS)
+    msg['Date'] = format_datetime(start + timedelta(minutes=37 * n + rng.randint(0, 30)))
+    msg['Message-ID'] = f"<{n}.{rng.getrandbits(40):x}@bench.example.com>"
+
+    layout = rng.random()
+    if layout < 0.6:
+        msg.set_content(text, charset=charset, cte=encoding)
+        html = "<html><body>" + "".join(f"<p>{line}</p>" for line in text.splitlines()) + "</body></html>"
+        msg.add_alternative(html, subtype='html', charset=charset, cte=encoding)
+    elif layout < 0.9:
+        msg.set_content(text, charset=charset, cte=encoding)
+    else:
+        html = "<html><body><p>" + text.replace("\n", "<br>") + "</p></body></html>"
+        msg.set_content(html, subtype='html', charset=charset, cte=encoding)
+
+    if rng.random() < 0.25:
+        for _ in range(rng.choice((1, 1, 1, 2, 3))):
+            if rng.random() < 0.1:
+                maintype, subtype, filename, data = rng.choice(shared_attachments)
+            else:
+                maintype, subtype, extension, _ = pick(rng, ATTACHMENT_TYPES, 3)
+                data = rng.randbytes(lognormal_size(rng, 80_000, 1.3, 20_000_000))
+                filename = f"{subtype.split('.')[-1][:8]}-{n}.{extension}"
+            msg.add_attachment(data, maintype=maintype, subtype=subtype, filename=filename)
+
+    return msg.as_bytes().replace(b"\r\n", b"\n").replace(b"\n", b"\r\n")
+
+
+def generate_mailbox(messages=1000, seed=1, folders=("INBOX",)):
+    """Return {folder: [raw message bytes]} with messages spread over the folders"""
+    rng = random.Random(seed)
+    shared_attachments = [
+        ("image", "png", "logo.png", rng.randbytes(12_000)),
+        ("image", "gif", "spacer.gif", rng.randbytes(43)),
+        ("application", "pdf", "terms.pdf", rng.randbytes(150_000)),
+    ]
+    mailbox = {folder: [] for folder in folders}
+    for n in range(1, messages + 1):
+        mailbox[folders[n % len(folders)]].append(generate_message(rng, n, shared_attachments))
+    return mailbox
+
+
+def write_mailbox_dir(mailbox, path):
+    """Write {folder: [raw]} as <path>/<folder>/<n>.eml (see fake_imap_server.load_mailbox_dir)"""
+    for folder, raws in mailbox.items():
+        os.makedirs(os.path.join(path, folder), exist_ok=True)
+        for n, raw in enumerate(raws, 1):
+            with open(os.path.join(path, folder, f"{n:06d}.eml"), 'wb') as f:
+                f.write(raw)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic mailbox for the benchmarks")
+    parser.add_argument("output_dir")
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--folders", nargs="+", default=["INBOX"])
+    args = parser.parse_args(argv)
+
+    mailbox = generate_mailbox(args.messages, args.seed, tuple(args.folders))
+    write_mailbox_dir(mailbox, args.output_dir)
+    total = sum(len(raw) for raws in mailbox.values() for raw in raws)
+    print(f"Wrote {args.messages} messages ({total / 1e6:.1f} MB) to {args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
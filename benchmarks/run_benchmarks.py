@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+
+'''
+Benchmark runner for get-yh-emails.py.
+
+Generates a synthetic mailbox (or loads one written by
+generate_mailbox.py), serves it from fake_imap_server.py on loopback and
+runs each download mode against it. Every scenario runs in its own
+process so peak RSS is measured per scenario. Reported per scenario:
+messages/sec, MB/sec on the wire, peak RSS and the time spent in each
+stage (fetch, parse_message, get_email_content or extract_streaming,
+save_email which is the JSON/archive writer, and retrieve_emails as a
+whole). parse_message includes get_email_content/extract_streaming.
+Stage times are summed across threads, so they can add up to
+more than the wall time when stages overlap; parsing done in worker
+processes (the staged scenario) is not included. With --rate-limit
+or --fetch-limit the server throttles like Yahoo does, and the number
+of refused FETCHes is reported too (the adaptive scenario tunes its
+batch size to them).
+
+    python3 benchmarks/run_benchmarks.py --messages 500 --latency 0.02
+    python3 benchmarks/run_benchmarks.py --scenarios batch100 adaptive --latency 0.05 --fetch-limit 50 --rate-limit 2000000
+    python3 benchmarks/run_benchmarks.py --json > baseline.json
+    python3 benchmarks/run_benchmarks.py --compare baseline.json --threshold 0.15
+'''
+
+import argparse
+import asyncio
+import contextlib
+import importlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCHMARK_DIR)
+# The yahoo_imap package of this checkout, installed or not
+sys.path.insert(1, os.path.dirname(BENCHMARK_DIR))
+
+from fake_imap_server import FakeIMAPServer, load_mailbox_dir
+from generate_mailbox import generate_mailbox
+
+# name: (runner, keyword arguments)
+SCENARIOS = {
+    "batch1": ("sync", {"batch_size": 1}),
+    "batch100": ("sync", {"batch_size": 100}),
+    "streaming": ("sync", {"batch_size": 100, "streaming": True}),
+    "text": ("sync", {"batch_size": 100, "parse_mode": "text"}),
+    "headers": ("sync", {"batch_size": 100, "parse_mode": "headers"}),
+    "segments": ("sync", {"batch_size": 100, "archive_format": "segments"}),
+    "staged": ("sync", {"batch_size": 100, "workers": 2}),
+    "adaptive": ("sync", {"batch_size": 10, "adaptive": True}),
+    "partial": ("partial", {"batch_size": 100}),
+    "async": ("async", {"batch_size": 100}),
+}
+
+STAGES = ["fetch", "parse_message", "get_email_content", "extract_streaming", "save_email", "retrieve_emails"]
+
+
+def load_retriever_module():
+    return importlib.import_module("yahoo_imap.retriever")
+
+
+class CountingReader:
+    """Wraps imaplib's socket file and counts the bytes read from it"""
+
+    def __init__(self, file):
+        self.file = file
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self.file.read(size)
+        self.bytes_read += len(data)
+        return data
+
+    def readline(self, size=-1):
+        data = self.file.readline(size)
+        self.bytes_read += len(data)
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+
+def instrument(retriever, timings):
+    """Wrap the retriever's stage methods so each call's time is added to timings"""
+    def timed(name, method):
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                timings[name] += time.perf_counter() - started
+        return wrapper
+
+    def timed_fetch(*args, **kwargs):
+        messages = iter(fetch_messages(*args, **kwargs))
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(messages)
+            except StopIteration:
+                return
+            finally:
+                timings["fetch"] += time.perf_counter() - started
+            yield item
+
+    # The asyncio backend parses and saves through its threaded client
+    client = getattr(retriever, "client", retriever)
+    for name in ("parse_message", "get_email_content", "extract_streaming", "save_email"):
+        setattr(client, name, timed(name, getattr(client, name)))
+    if not asyncio.iscoroutinefunction(retriever.connect):
+        fetch_messages = retriever.fetch_messages
+        retriever.fetch_messages = timed_fetch
+
+
+def run_scenario(name, port, output_dir):
+    """Run one scenario in this process and return its measurements"""
+    module = load_retriever_module()
+    kind, options = SCENARIOS[name]
+    options = dict(options)
+    # Retriever settings rather than retrieve_emails() arguments
+    parse_mode = options.pop("parse_mode", "full")
+    adaptive = options.pop("adaptive", False)
+    timings = defaultdict(float)
+    retrieved = 0
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        if kind == "async":
+            retriever = module.AsyncYahooEmailRetriever(4, "127.0.0.1", port, use_ssl=False, parse_mode=parse_mode)
+            instrument(retriever, timings)
+
+            async def run():
+                await retriever.connect("bench", "bench")
+                started = time.perf_counter()
+                emails = await retriever.retrieve_emails("INBOX", output_dir=output_dir, **options)
+                timings["retrieve_emails"] = time.perf_counter() - started
+                await retriever.disconnect()
+                return emails
+
+            wall_started = time.perf_counter()
+            retrieved = len(asyncio.run(run()))
+            wall = time.perf_counter() - wall_started
+            wire_bytes = retriever.bytes_received
+        else:
+            retriever = module.YahooEmailRetriever("127.0.0.1", port, use_ssl=False, parse_mode=parse_mode)
+            if adaptive:
+                retriever.controller = module.AdaptiveFetchController(options["batch_size"], max_in_flight=1, metrics=retriever.metrics)
+            instrument(retriever, timings)
+            retriever.connect("bench", "bench")
+            counter = retriever.connection.file = CountingReader(retriever.connection.file)
+            started = time.perf_counter()
+            if kind == "partial":
+                emails = retriever.retrieve_partial("INBOX", output_dir=output_dir, **options)
+            else:
+                emails = retriever.retrieve_emails("INBOX", output_dir=output_dir, **options)
+            wall = timings["retrieve_emails"] = time.perf_counter() - started
+            retrieved = len(emails)
+            wire_bytes = counter.bytes_read
+            retriever.disconnect()
+
+    return {
+        "scenario": name,
+        "messages": retrieved,
+        "seconds": round(wall, 3),
+        "messages_per_sec": round(retrieved / wall, 1) if wall else 0,
+        "mb_per_sec": round(wire_bytes / 1e6 / wall, 2) if wall else 0,
+        "wire_mb": round(wire_bytes / 1e6, 2),
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1e6 if sys.platform == "darwin" else 1e3), 1),
+        "stages": {stage: round(timings[stage], 3) for stage in STAGES if stage in timings},
+        "throttled": retriever.metrics.total("throttled_total"),
+    }
+
+
+def run_child(name, port):
+    """Run a scenario in a fresh interpreter and return its result dict"""
+    with tempfile.TemporaryDirectory() as output_dir:
+        result = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", name, "--port", str(port),
+                                 "--output-dir", output_dir], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Scenario {name} failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def print_table(results):
+    print(f"{'scenario':<10} {'msgs':>6} {'secs':>7} {'msg/s':>8} {'MB/s':>7} {'RSS MB':>7} {'thrott':>6}  stages (s)")
+    for r in results:
+        stages = " ".join(f"{stage}={seconds}" for stage, seconds in r["stages"].items())
+        print(f"{r['scenario']:<10} {r['messages']:>6} {r['seconds']:>7} {r['messages_per_sec']:>8} {r['mb_per_sec']:>7} "
+              f"{r['peak_rss_mb']:>7} {r.get('throttled', 0):>6}  {stages}")
+
+
+def compare(results, baseline_path, threshold):
+    """Print regressions against a baseline --json file and return how many there were"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {r["scenario"]: r for r in json.load(f)["results"]}
+    regressions = 0
+    for r in results:
+        before = baseline.get(r["scenario"])
+        if not before or not before["messages_per_sec"]:
+            continue
+        change = r["messages_per_sec"] / before["messages_per_sec"] - 1
+        marker = ""
+        if change < -threshold:
+            marker = "  REGRESSION"
+            regressions += 1
+        print(f"{r['scenario']:<10} {before['messages_per_sec']:>8} -> {r['messages_per_sec']:>8} msg/s ({change:+.1%}){marker}")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark get-yh-emails.py against a local fake IMAP server")
+    parser.add_argument("--messages", type=int, default=300, help="messages in the generated mailbox")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--mailbox", help="serve a directory from generate_mailbox.py instead of generating one")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds the server adds to every command")
+    parser.add_argument("--bandwidth", type=int, help="server FETCH bytes per second")
+    parser.add_argument("--rate-limit", type=int, help="server refuses FETCHes beyond this many bytes per second ([UNAVAILABLE])")
+    parser.add_argument("--fetch-limit", type=int, help="server refuses FETCHes of more messages than this ([LIMIT])")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--json", action="store_true", help="print the results as JSON (usable as a --compare baseline)")
+    parser.add_argument("--compare", metavar="BASELINE", help="compare messages/sec with an earlier --json run")
+    parser.add_argument("--threshold", type=float, default=0.10, help="slowdown that counts as a regression (default 0.10)")
+    parser.add_argument("--child", choices=list(SCENARIOS), help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--output-dir", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.child:
+        print(json.dumps(run_scenario(args.child, args.port, args.output_dir)))
+        return 0
+
+    server = FakeIMAPServer(latency=args.latency, bytes_per_second=args.bandwidth, rate_limit=args.rate_limit, fetch_limit=args.fetch_limit)
+    if args.mailbox:
+        load_mailbox_dir(server, args.mailbox)
+    else:
+        mailbox = server.add_mailbox("INBOX")
+        for raw in generate_mailbox(args.messages, args.seed)["INBOX"]:
+            mailbox.append(raw)
+    server.start()
+    try:
+        results = [run_child(name, server.port) for name in args.scenarios]
+    finally:
+        server.stop()
+
+    if args.json:
+        print(json.dumps({"messages": args.messages, "latency": args.latency, "bandwidth": args.bandwidth,
+                          "rate_limit": args.rate_limit, "fetch_limit": args.fetch_limit, "results": results}, indent=2))
+    else:
+        print_table(results)
+    if args.compare:
+        return 1 if compare(results, args.compare, args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
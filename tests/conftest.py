@@ -0,0 +1,46 @@
+import os
+import sys
+from email.message import EmailMessage
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "benchmarks")]
+
+from fake_imap_server import FakeIMAPServer  # noqa: E402
+from yahoo_imap.client import YahooEmailRetriever  # noqa: E402
+
+MESSAGE_COUNT = 12
+
+
+def make_message(i):
+    """A small multipart message; every third one has a non-ASCII subject"""
+    msg = EmailMessage()
+    msg['Subject'] = f"Réunion café {i}" if i % 3 == 0 else f"Test message {i}"
+    msg['From'] = f"Sender {i} <sender{i}@example.com>"
+    msg['To'] = "me@example.com"
+    msg['Date'] = "Fri, 30 Aug 2024 22:22:42 -0400"
+    msg['Message-ID'] = f"<msg{i}@example.com>"
+    msg.set_content(f"Hello body {i}\n")
+    if i % 4 == 0:
+        msg.add_attachment(b"%PDF-1.4 " + bytes(range(256)), maintype='application', subtype='pdf', filename=f"invoice-{i}.pdf")
+    return msg.as_bytes().replace(b"\r\n", b"\n").replace(b"\n", b"\r\n")
+
+
+@pytest.fixture
+def server():
+    server = FakeIMAPServer()
+    inbox = server.add_mailbox("INBOX")
+    for i in range(1, MESSAGE_COUNT + 1):
+        inbox.append(make_message(i))
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def retriever(server):
+    retriever = YahooEmailRetriever("127.0.0.1", server.port, use_ssl=False)
+    assert retriever.connect("user@example.com", "password")
+    yield retriever
+    retriever.disconnect()
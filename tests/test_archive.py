@@ -0,0 +1,55 @@
+import os
+
+import pytest
+
+from conftest import MESSAGE_COUNT, make_message
+from yahoo_imap.archive import ARCHIVE_INDEX_FILE, ArchiveReader, ArchiveWriter
+
+
+def test_download_into_segments(retriever, tmp_path):
+    emails = retriever.retrieve_emails("INBOX", output_dir=str(tmp_path), batch_size=5, archive_format="segments")
+    assert len(emails) == MESSAGE_COUNT
+    assert not list(tmp_path.glob("email_0*.json"))
+    reader = ArchiveReader(str(tmp_path / "archive"))
+    assert len(reader) == MESSAGE_COUNT
+    assert reader.get("3")['subject'] == "Réunion café 3"
+    assert reader.get("4")['content']['attachments'][0]['filename'] == "invoice-4.pdf"
+
+
+def test_segments_roll_over_and_reopen(tmp_path):
+    archive_dir = str(tmp_path / "archive")
+    writer = ArchiveWriter(archive_dir, segment_size=200)
+    for i in range(5):
+        location = writer.append(i, email_data={'id': i, 'body': os.urandom(60).hex()})
+    writer.close()
+    assert location == f"{archive_dir}#4"
+    assert len([name for name in os.listdir(archive_dir) if name.startswith("segment_")]) > 1
+
+    # A reopened writer carries on in the last segment; the newer copy of a key wins
+    writer = ArchiveWriter(archive_dir, segment_size=200)
+    writer.append(2, email_data={'id': 2, 'body': "again"})
+    writer.close()
+    with open(os.path.join(archive_dir, ARCHIVE_INDEX_FILE), 'a', encoding='utf-8') as f:
+        f.write("9\t1\t0")  # torn by a crash
+    reader = ArchiveReader(archive_dir)
+    assert reader.keys() == ["0", "1", "2", "3", "4"]
+    assert reader.get(2)['body'] == "again"
+    assert [data['id'] for _, data in reader] == [0, 1, 2, 3, 4]
+
+
+@pytest.mark.parametrize("archive_format", ["mbox", "maildir"])
+def test_raw_formats_round_trip(tmp_path, archive_format):
+    raw = make_message(1).replace(b"Hello body 1", b"Hello body 1\r\nFrom the desk of\r\n>From quoted")
+    writer = ArchiveWriter(str(tmp_path), archive_format)
+    writer.append("a", raw_email=raw)
+    writer.append("b", raw_email=make_message(2))
+    writer.close()
+    reader = ArchiveReader(str(tmp_path))
+    assert reader.get("a").replace(b"\r\n", b"\n") == raw.replace(b"\r\n", b"\n")
+    assert b"Test message 2" in reader.get("b")
+
+
+def test_format_mismatch(tmp_path):
+    ArchiveWriter(str(tmp_path), "segments").close()
+    with pytest.raises(ValueError):
+        ArchiveWriter(str(tmp_path), "mbox")
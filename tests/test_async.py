@@ -0,0 +1,56 @@
+import asyncio
+import json
+import os
+
+from conftest import MESSAGE_COUNT
+from yahoo_imap.batch import AsyncYahooEmailRetriever
+from yahoo_imap.client import YahooEmailRetriever
+from yahoo_imap.pacing import AdaptiveFetchController
+
+
+def download(server, output_dir, controller=None, **options):
+    """Run one async download against the fake server and return (retriever, emails)"""
+    retriever = AsyncYahooEmailRetriever(4, "127.0.0.1", server.port, use_ssl=False, controller=controller)
+
+    async def run():
+        assert await retriever.connect("user@example.com", "password")
+        try:
+            return await retriever.retrieve_emails("INBOX", output_dir=output_dir, **options)
+        finally:
+            await retriever.disconnect()
+
+    return retriever, asyncio.run(run())
+
+
+def test_async_download(server, tmp_path):
+    retriever, emails = download(server, str(tmp_path), batch_size=5)
+    assert not isinstance(retriever, YahooEmailRetriever)
+    assert [email['id'] for email in emails] == [str(i) for i in range(1, MESSAGE_COUNT + 1)]
+    assert emails[2]['subject'] == "Réunion café 3"
+    with open(tmp_path / "email_summary.json", encoding='utf-8') as f:
+        assert json.load(f)['total_emails'] == MESSAGE_COUNT
+    attachments = [attachment for email in emails for attachment in email['content']['attachments']]
+    assert len(attachments) == MESSAGE_COUNT // 4
+    assert all(os.path.exists(attachment['saved_path']) for attachment in attachments)
+    assert retriever.bytes_received > 0
+
+
+def test_async_throttled_pipeline_keeps_order(server, tmp_path):
+    # Every pipelined FETCH is refused; the ones behind the first are drained and sent again
+    server.fetch_limit = 3
+    controller = AdaptiveFetchController(4, max_in_flight=4)
+    controller.in_flight = 4
+    _, emails = download(server, str(tmp_path), controller=controller, batch_size=4)
+    assert [email['id'] for email in emails] == [str(i) for i in range(1, MESSAGE_COUNT + 1)]
+    assert controller.throttles >= 1
+    assert controller.batch_size <= 3
+
+
+def test_async_connection_drop_ends_download(server, tmp_path, capsys):
+    # LOGIN, SELECT, SEARCH and the first FETCH are answered, then the connection drops
+    server.fail_after = 4
+    _, emails = download(server, str(tmp_path), batch_size=4)
+    assert [email['id'] for email in emails] == ["1", "2", "3", "4"]
+    assert "Connection lost" in capsys.readouterr().out
+    with open(tmp_path / "email_summary.json", encoding='utf-8') as f:
+        assert json.load(f)['total_emails'] == 4
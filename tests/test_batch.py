@@ -0,0 +1,60 @@
+import asyncio
+import json
+
+import pytest
+
+from conftest import MESSAGE_COUNT
+from yahoo_imap.batch import BATCH_REPORT_FILE, BatchRunner
+
+
+def run_config(server, tmp_path, accounts, **config):
+    config = {
+        'output_dir': str(tmp_path / "out"),
+        'defaults': {'server': "127.0.0.1", 'port': server.port, 'ssl': False, 'batch_size': 5},
+        'accounts': accounts,
+        **config
+    }
+    runner = BatchRunner(config)
+    results = asyncio.run(runner.run())
+    with open(tmp_path / "out" / BATCH_REPORT_FILE, encoding='utf-8') as f:
+        return results, json.load(f)
+
+
+def test_accounts_and_report(server, tmp_path, monkeypatch):
+    server.credentials = {"one@example.com": "secret1", "two@example.com": "secret2", "three@example.com": "secret3"}
+    monkeypatch.setenv("TWO_PASSWORD", "secret2")
+    (tmp_path / "three.txt").write_text("secret3\n")
+    accounts = [
+        {'username': "one@example.com", 'password': "secret1"},
+        {'username': "two@example.com", 'password_env': "TWO_PASSWORD", 'filters': {'subject': "café"}},
+        {'username': "three@example.com", 'password_file': str(tmp_path / "three.txt"), 'limit': 2, 'archive_format': "segments"},
+        {'username': "bad@example.com", 'password': "wrong"},
+        {'username': "nopass@example.com"},
+    ]
+    results, report = run_config(server, tmp_path, accounts, max_connections=2)
+
+    assert [result['status'] for result in results] == ["ok", "ok", "ok", "login failed", "error"]
+    assert [result['messages'] for result in results] == [MESSAGE_COUNT, MESSAGE_COUNT // 3, 2, 0, 0]
+    assert "password" in results[4]['error']
+    assert report['accounts_ok'] == 3 and report['accounts_failed'] == 2
+    assert report['messages'] == MESSAGE_COUNT + MESSAGE_COUNT // 3 + 2
+    assert results[0]['folders'] == {'INBOX': {'messages': MESSAGE_COUNT, 'attachments': MESSAGE_COUNT // 4}}
+    assert len(list((tmp_path / "out" / "one@example.com" / "INBOX").glob("email_0*.json"))) == MESSAGE_COUNT
+    assert (tmp_path / "out" / "three@example.com" / "INBOX" / "archive").is_dir()
+    assert (tmp_path / "out" / "metrics.json").exists()
+
+
+def test_bad_settings_fail_only_their_account(server, tmp_path):
+    accounts = [
+        {'username': "user@example.com", 'password': "password", 'parse_mode': "nonsense"},
+        {'username': "user@example.com", 'password': "password", 'folders': ["INBOX"], 'save_attachments': False},
+    ]
+    results, _ = run_config(server, tmp_path, accounts)
+    assert results[0]['status'] == "error" and "parse_mode" in results[0]['error']
+    assert results[1]['status'] == "ok" and results[1]['messages'] == MESSAGE_COUNT
+
+
+@pytest.mark.parametrize("config", [{}, {'accounts': []}, {'accounts': [{}], 'postprocess': ["nonsense"]}])
+def test_invalid_config(config):
+    with pytest.raises(ValueError):
+        BatchRunner(config)
@@ -0,0 +1,80 @@
+import json
+import os
+import re
+import sqlite3
+
+import pytest
+
+from conftest import MESSAGE_COUNT, make_message
+from yahoo_imap.index import DedupIndex
+from yahoo_imap.retriever import parse_args
+from yahoo_imap.store import ATTACHMENT_INDEX_FILE
+
+
+def load_summary(output_dir):
+    with open(os.path.join(output_dir, "email_summary.json"), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def test_dedup_across_runs(retriever, tmp_path):
+    dedup = DedupIndex(str(tmp_path / "dedup.sqlite"))
+    try:
+        first = retriever.retrieve_resumable("INBOX", str(tmp_path / "run1"), batch_size=5, dedup=dedup)
+        second = retriever.retrieve_resumable("INBOX", str(tmp_path / "run2"), batch_size=5, dedup=dedup)
+    finally:
+        dedup.close()
+
+    assert len(first) == MESSAGE_COUNT
+    assert not any('duplicate_of' in email for email in first)
+    assert not list((tmp_path / "run2").glob("email_0*.json"))
+
+    # The second run saves nothing, but its summary points at the first run's copies
+    summary = load_summary(str(tmp_path / "run2"))
+    assert summary['total_emails'] == MESSAGE_COUNT
+    locations = {entry['duplicate_of'] for entry in summary['emails']}
+    assert len(locations) == MESSAGE_COUNT
+    assert all(location.startswith(str(tmp_path / "run1")) and os.path.exists(location) for location in locations)
+    assert all(email.get('duplicate_of') for email in second)
+
+
+def test_dedup_redownloads_deleted_copies(retriever, tmp_path):
+    dedup = DedupIndex(str(tmp_path / "dedup.sqlite"))
+    try:
+        retriever.retrieve_resumable("INBOX", str(tmp_path / "run1"), batch_size=5, dedup=dedup)
+        os.remove(next((tmp_path / "run1").glob("email_0001_*.json")))
+        retriever.retrieve_resumable("INBOX", str(tmp_path / "run2"), batch_size=5, dedup=dedup)
+    finally:
+        dedup.close()
+
+    summary = load_summary(str(tmp_path / "run2"))
+    assert [entry['id'] for entry in summary['emails'] if 'duplicate_of' not in entry] == ["1"]
+
+
+def attachment_refs(output_dir):
+    db = sqlite3.connect(os.path.join(output_dir, "attachments", ATTACHMENT_INDEX_FILE))
+    try:
+        return [ref for (ref,) in db.execute("SELECT ref FROM refs")]
+    finally:
+        db.close()
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_late_duplicate_keeps_no_attachment_refs(retriever, server, tmp_path, workers):
+    # Without a Message-ID the duplicate is only found by its hash, after the attachments are parsed
+    server.add_mailbox("NoId").append(re.sub(rb"Message-ID: [^\r]*\r\n", b"", make_message(4)))
+    dedup = DedupIndex(str(tmp_path / "dedup.sqlite"))
+    try:
+        retriever.retrieve_resumable("NoId", str(tmp_path / "run1"), dedup=dedup, workers=workers)
+        second = retriever.retrieve_resumable("NoId", str(tmp_path / "run2"), dedup=dedup, workers=workers)
+    finally:
+        dedup.close()
+
+    assert second[0]['duplicate_of'].startswith(str(tmp_path / "run1"))
+    assert len(attachment_refs(str(tmp_path / "run1"))) == 1
+    assert attachment_refs(str(tmp_path / "run2")) == []
+
+
+def test_dedup_is_opt_in():
+    assert parse_args([]).dedup is False
+    assert parse_args(["--dedup"]).dedup is True
+    assert parse_args(["--no-dedup"]).dedup is False
@@ -0,0 +1,34 @@
+from email.header import Header
+
+from yahoo_imap.client import YahooEmailRetriever
+from yahoo_imap.mime import HEADER_CACHE_SIZE, decode_header_value, resolve_codec
+
+
+def test_resolve_codec_aliases():
+    assert resolve_codec("KS_C_5601-1987") == "cp949"
+    assert resolve_codec(' "GB2312" ') == "gbk"
+    assert resolve_codec("iso-8859-1") == "iso8859-1"
+    assert resolve_codec("x-bogus-charset") is None
+    assert resolve_codec("unknown-8bit") is None
+    assert resolve_codec(None) is None
+
+
+def test_decode_encoded_words():
+    decode = YahooEmailRetriever().decode_mime_words
+    assert decode("=?utf-8?q?R=C3=A9union_caf=C3=A9?=") == "Réunion café"
+    assert decode("=?ks_c_5601-1987?B?vsiz58fPvLy/5A==?=") == "안녕하세요"
+    assert decode("=?gb2312?B?xOO6ww==?= there") == "你好 there"
+    # An unknown charset, or bytes that are not valid in theirs, fall back to UTF-8
+    assert decode("=?x-bogus?q?caf=C3=A9?=") == "café"
+    assert decode("Plain subject") == "Plain subject"
+    assert decode(None) == ""
+    assert decode(Header("Überweisung", "utf-8")) == "Überweisung"
+
+
+def test_decoded_values_are_cached():
+    decode_header_value.cache_clear()
+    value = "=?utf-8?b?Q2FjaGVkIHN1YmplY3Q=?="
+    for _ in range(5):
+        assert decode_header_value(value) == "Cached subject"
+    info = decode_header_value.cache_info()
+    assert (info.hits, info.misses, info.maxsize) == (4, 1, HEADER_CACHE_SIZE)
@@ -0,0 +1,37 @@
+from yahoo_imap.client import YahooEmailRetriever
+
+
+def test_tokenize_imap():
+    retriever = YahooEmailRetriever()
+    tokens = retriever.tokenize_imap(b'(FLAGS (\\Seen) BODY[HEADER.FIELDS (SUBJECT)] "a \\"q\\" b" NIL \x000\x00)', [b"literal"])
+    assert tokens == ['(', 'FLAGS', '(', '\\Seen', ')', 'BODY[HEADER.FIELDS (SUBJECT)]', b'a "q" b', None, b"literal", ')']
+
+
+def test_parse_fetch_response():
+    retriever = YahooEmailRetriever()
+    msg_data = [
+        (b'1 (UID 7 RFC822.SIZE 120 BODY[HEADER.FIELDS (MESSAGE-ID)] {27}', b'Message-ID: <a@example.com>'),
+        b' FLAGS (\\Seen \\Flagged))',
+        (b'2 (UID 9 ENVELOPE ("Fri, 30 Aug 2024" "Caf\xc3\xa9" (("Ann" NIL "ann" "example.com")) NIL NIL NIL NIL NIL NIL NIL) '
+         b'BODY[] {5}', b'hello'),
+        b')',
+    ]
+    first, second = retriever.parse_fetch_response(msg_data)
+    assert first['SEQ'] == 1 and first['UID'] == '7' and first['RFC822.SIZE'] == '120'
+    assert first['BODY[HEADER.FIELDS (MESSAGE-ID)]'] == b'Message-ID: <a@example.com>'
+    assert first['FLAGS'] == ['\\Seen', '\\Flagged']
+    assert second['UID'] == '9' and second['BODY[]'] == b'hello'
+    envelope = second['ENVELOPE']
+    assert retriever.imap_string(envelope[1]) == "Café"
+    assert envelope[2] == [[b"Ann", None, b"ann", b"example.com"]]
+    assert envelope[3] is None
+
+
+def test_parse_fetch_response_from_server(retriever):
+    retriever.select_folder("INBOX")
+    status, msg_data = retriever.connection.uid('FETCH', '1:3', '(UID FLAGS BODY.PEEK[HEADER.FIELDS (MESSAGE-ID)])')
+    assert status == 'OK'
+    messages = retriever.parse_fetch_response(msg_data)
+    assert [message['UID'] for message in messages] == ['1', '2', '3']
+    assert all(message['FLAGS'] == [] for message in messages)
+    assert b"<msg2@example.com>" in messages[1]['BODY[HEADER.FIELDS (MESSAGE-ID)]']
@@ -0,0 +1,79 @@
+import json
+import urllib.error
+import urllib.request
+
+import pytest
+
+from conftest import MESSAGE_COUNT
+from yahoo_imap.metrics import Metrics
+
+
+def test_counters_histograms_and_merge():
+    metrics = Metrics()
+    metrics.inc("errors_total", stage="parse")
+    metrics.inc("errors_total", 2, stage="fetch")
+    metrics.observe("imap_command_seconds", 0.003, command="FETCH")
+    metrics.observe("imap_command_seconds", 0.2, command="FETCH")
+    metrics.observe("imap_command_seconds", 100, command="SELECT")
+    assert metrics.total("errors_total") == 3
+    assert metrics.total("errors_total", stage="fetch") == 2
+    assert metrics.total("imap_command_seconds", command="FETCH") == pytest.approx(0.203)
+
+    other = Metrics()
+    other.merge(metrics.state())
+    other.merge(metrics.state())
+    assert other.total("errors_total") == 6
+    report = other.report()
+    assert report['counters'] == {'errors_total{stage="fetch"}': 4, 'errors_total{stage="parse"}': 2}
+    fetch = report['histograms']['imap_command_seconds{command="FETCH"}']
+    assert (fetch['count'], fetch['max'], fetch['p50_le'], fetch['p95_le']) == (4, 0.2, 0.005, 0.25)
+    # Above the last bucket the percentiles fall back to the maximum
+    assert report['histograms']['imap_command_seconds{command="SELECT"}']['p95_le'] == 100
+
+
+def test_prometheus_text():
+    metrics = Metrics()
+    metrics.inc("messages_total", 5)
+    metrics.observe("save_seconds", 0.02)
+    metrics.observe("save_seconds", 3)
+    lines = metrics.prometheus_text().splitlines()
+    assert lines[:2] == ["# TYPE yahoo_email_messages_total counter", "yahoo_email_messages_total 5"]
+    assert "# TYPE yahoo_email_save_seconds histogram" in lines
+    assert 'yahoo_email_save_seconds_bucket{le="0.025"} 1' in lines
+    assert 'yahoo_email_save_seconds_bucket{le="5"} 2' in lines
+    assert 'yahoo_email_save_seconds_bucket{le="+Inf"} 2' in lines
+    assert "yahoo_email_save_seconds_count 2" in lines
+    assert "custom_messages_total 5" in metrics.prometheus_text(prefix="custom_")
+
+
+def test_download_is_instrumented(retriever, tmp_path):
+    retriever.retrieve_resumable("INBOX", str(tmp_path / "mail"), batch_size=5)
+    metrics = retriever.metrics
+    assert metrics.total("messages_total") == MESSAGE_COUNT
+    assert metrics.total("bytes_received_total") > 0
+    assert metrics.total("errors_total") == 0
+    assert metrics.histograms[("imap_command_seconds", (("command", "FETCH"),))]['count'] >= 1
+    assert set(metrics.time_split()) == {'network', 'parse', 'disk'}
+
+    with open(metrics.write_json(str(tmp_path / "out" / "metrics.json")), encoding='utf-8') as f:
+        report = json.load(f)
+    assert report['counters']['messages_total'] == MESSAGE_COUNT
+    with open(metrics.write_prometheus(str(tmp_path / "out" / "metrics.prom")), encoding='utf-8') as f:
+        assert f"yahoo_email_messages_total {MESSAGE_COUNT}" in f.read().splitlines()
+
+
+def test_serve():
+    metrics = Metrics()
+    metrics.inc("retries_total")
+    server = metrics.serve(0)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+        with urllib.request.urlopen(url + "/metrics", timeout=5) as response:
+            assert response.headers["Content-Type"].startswith("text/plain")
+            assert "yahoo_email_retries_total 1" in response.read().decode().splitlines()
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(url + "/other", timeout=5)
+        assert error.value.code == 404
+    finally:
+        server.shutdown()
+        server.server_close()
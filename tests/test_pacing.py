@@ -0,0 +1,58 @@
+import asyncio
+import time
+
+from conftest import MESSAGE_COUNT
+from yahoo_imap.pacing import RECONNECT_BASE_DELAY, AdaptiveFetchController, TokenBucket
+
+
+def test_token_bucket_burst_then_rate():
+    bucket = TokenBucket(1000, burst=500)
+    assert bucket.take(500) == 0
+    assert abs(bucket.take(500) - 0.5) < 0.05
+    started = time.monotonic()
+    asyncio.run(bucket.consume(50))
+    assert time.monotonic() - started >= 0.5
+
+
+def test_controller_grows_and_shrinks():
+    controller = AdaptiveFetchController(4, max_batch=100, max_in_flight=4)
+    # Slow start doubles the batch while FETCHes are quick
+    controller.record(4, 4000, 0.1)
+    controller.record(8, 8000, 0.1)
+    assert controller.batch_size == 16
+    # A LIMIT refusal halves the batch and caps it below the refused size, without pausing
+    controller.throttled("LIMIT", 16)
+    assert (controller.batch_size, controller.max_batch, controller.pause()) == (8, 15, 0)
+    # Past the threshold the batch grows by a tenth at a time
+    controller.record(8, 8000, 0.1)
+    assert controller.batch_size == 9
+    # A FETCH slower than the target shrinks the batch so the next one takes about the target
+    controller.record(9, 9000, controller.target_seconds * 2)
+    assert controller.batch_size == 4
+
+
+def test_controller_backs_off_on_throttling():
+    controller = AdaptiveFetchController(40, max_in_flight=4)
+    controller.in_flight = 4
+    controller.throttled("UNAVAILABLE", 40)
+    assert (controller.batch_size, controller.in_flight) == (20, 2)
+    assert RECONNECT_BASE_DELAY - 0.5 < controller.pause() <= RECONNECT_BASE_DELAY
+    controller.throttled("UNAVAILABLE", 20)
+    assert controller.pause() > RECONNECT_BASE_DELAY
+    assert controller.throttles == 2
+
+
+def test_throttle_reason():
+    assert AdaptiveFetchController.throttle_reason("[UNAVAILABLE] Server busy") == "UNAVAILABLE"
+    assert AdaptiveFetchController.throttle_reason([b"[LIMIT] at most 3 messages per FETCH"]) == "LIMIT"
+    assert AdaptiveFetchController.throttle_reason(b"Internal server error") is None
+
+
+def test_refused_batches_are_sent_again_smaller(retriever, server, tmp_path):
+    server.fetch_limit = 3
+    retriever.controller = AdaptiveFetchController(10, max_in_flight=1, metrics=retriever.metrics)
+    emails = retriever.retrieve_emails("INBOX", output_dir=str(tmp_path), batch_size=10)
+    assert [email['id'] for email in emails] == [str(i) for i in range(1, MESSAGE_COUNT + 1)]
+    assert server.throttled >= 1
+    assert retriever.controller.max_batch <= 3
+    assert retriever.metrics.total("throttled_total", reason="LIMIT") == server.throttled
@@ -0,0 +1,46 @@
+import json
+
+from conftest import MESSAGE_COUNT
+from yahoo_imap.client import AttachmentRules
+from yahoo_imap.getemail import YahooEmailRetriever as TextRetriever
+
+PDF_SIZE = len(b"%PDF-1.4 " + bytes(range(256)))
+
+
+def test_partial_skips_attachments(retriever, server, tmp_path):
+    emails = retriever.retrieve_partial("INBOX", output_dir=str(tmp_path), batch_size=5)
+    assert len(emails) == MESSAGE_COUNT
+    assert emails[0]['partial'] is True
+    assert emails[0]['content']['text'] == "Hello body 1\r\n"
+    assert emails[2]['subject'] == "Réunion café 3"
+    attachment = emails[3]['content']['attachments'][0]
+    assert attachment['filename'] == "invoice-4.pdf"
+    assert attachment['downloaded'] is False
+    # Estimated from the encoded BODYSTRUCTURE size
+    assert abs(attachment['size'] - PDF_SIZE) <= 3
+    assert not (tmp_path / "attachments").exists()
+
+
+def test_partial_downloads_matching_attachments(retriever, tmp_path):
+    rules = AttachmentRules(content_types=["application/pdf"])
+    emails = retriever.retrieve_partial("INBOX", output_dir=str(tmp_path), rules=rules)
+    attachments = [attachment for email in emails for attachment in email['content']['attachments']]
+    assert len(attachments) == MESSAGE_COUNT // 4
+    assert all(attachment['downloaded'] and attachment['size'] == PDF_SIZE for attachment in attachments)
+    with open(attachments[0]['saved_path'], 'rb') as f:
+        assert f.read() == b"%PDF-1.4 " + bytes(range(256))
+
+
+def test_getemail_fetches_text_only(server, tmp_path):
+    retriever = TextRetriever("127.0.0.1", server.port, use_ssl=False)
+    assert retriever.connect("user@example.com", "password")
+    try:
+        emails = retriever.retrieve_text_emails("INBOX", limit=5, output_dir=str(tmp_path))
+    finally:
+        retriever.disconnect()
+    assert [email['id'] for email in emails] == ["8", "9", "10", "11", "12"]
+    assert emails[0]['content']['text'] == "Hello body 8\r\n"
+    attachment = emails[0]['content']['attachments'][0]
+    assert attachment['filename'] == "invoice-8.pdf" and abs(attachment['size'] - PDF_SIZE) <= 3
+    with open(tmp_path / "email_summary.json", encoding='utf-8') as f:
+        assert json.load(f)['total_emails'] == 5
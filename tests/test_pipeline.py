@@ -0,0 +1,41 @@
+import json
+import threading
+import time
+
+from conftest import MESSAGE_COUNT
+
+
+def saved_emails(output_dir):
+    """The saved JSON files by name, without the paths that differ between directories"""
+    emails = {}
+    for path in sorted(output_dir.glob("email_0*.json")):
+        with open(path, encoding='utf-8') as f:
+            email_data = json.load(f)
+        for attachment in email_data['content']['attachments']:
+            attachment.pop('saved_path')
+        emails[path.name] = email_data
+    return emails
+
+
+def test_staged_matches_in_process(retriever, tmp_path):
+    in_process = retriever.retrieve_emails("INBOX", output_dir=str(tmp_path / "inline"), batch_size=5)
+    staged = retriever.retrieve_emails("INBOX", output_dir=str(tmp_path / "staged"), batch_size=5, workers=2, streaming=True)
+    # Yielded in fetch order, whatever order the workers finish in
+    assert [email['id'] for email in staged] == [email['id'] for email in in_process]
+    assert saved_emails(tmp_path / "staged") == saved_emails(tmp_path / "inline")
+    # Worker metrics are merged into the retriever's
+    assert retriever.metrics.total("parse_seconds") > 0
+    assert retriever.metrics.total("messages_total") == 2 * MESSAGE_COUNT
+
+
+def test_closing_early_stops_every_stage(retriever, tmp_path):
+    threads = threading.active_count()
+    emails = retriever.iter_emails("INBOX", output_dir=str(tmp_path), batch_size=2, workers=2)
+    first = [next(emails)['id'] for _ in range(3)]
+    emails.close()
+    with open(tmp_path / "email_summary.json", encoding='utf-8') as f:
+        assert [entry['id'] for entry in json.load(f)['emails']] == first
+    deadline = time.monotonic() + 10
+    while threading.active_count() > threads and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert threading.active_count() <= threads
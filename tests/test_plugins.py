@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+from yahoo_imap import plugins
+from yahoo_imap.plugins import AttachmentPlugin, AttachmentPostProcessor
+from yahoo_imap.retriever import main
+
+
+class SizePlugin(AttachmentPlugin):
+    name = "size"
+    content_types = ("application/*",)
+
+    def process(self, data, info):
+        return len(data)
+
+
+def test_plugin_needs_process():
+    class Incomplete(AttachmentPlugin):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_postprocessor_runs_matching_plugins():
+    postprocessor = AttachmentPostProcessor([SizePlugin()], workers=2)
+    try:
+        pdf = {'filename': "a.pdf", 'content_type': "application/pdf", 'sha256': "1"}
+        image = {'filename': "b.png", 'content_type': "image/png", 'sha256': "2"}
+        assert postprocessor.wants(pdf) and not postprocessor.wants(image)
+        postprocessor.submit(pdf, b"12345")
+        postprocessor.submit(image, b"123")
+        postprocessor.resolve([pdf, image])
+    finally:
+        postprocessor.close()
+    assert pdf['processed'] == {'size': 5}
+    assert 'processed' not in image
+
+
+def test_plugin_runs_under_config(server, tmp_path, monkeypatch):
+    monkeypatch.setitem(plugins.ATTACHMENT_PLUGINS, "size", SizePlugin)
+    config = {
+        'output_dir': str(tmp_path / "out"),
+        'postprocess': ["size", "sha1"],
+        'defaults': {'server': "127.0.0.1", 'port': server.port, 'ssl': False, 'batch_size': 5},
+        'accounts': [{'username': "user@example.com", 'password': "password"}]
+    }
+    config_file = tmp_path / "config.json"
+    config_file.write_text(json.dumps(config))
+    main(["--config", str(config_file)])
+
+    with open(tmp_path / "out" / "batch_report.json", encoding='utf-8') as f:
+        assert json.load(f)['accounts'][0]['status'] == "ok"
+    saved = sorted((tmp_path / "out" / "user@example.com" / "INBOX").glob("email_0004_*.json"))
+    with open(saved[0], encoding='utf-8') as f:
+        attachment = json.load(f)['content']['attachments'][0]
+    assert attachment['processed']['size'] == attachment['size']
+    assert len(attachment['processed']['sha1']) == 40
@@ -0,0 +1,47 @@
+from conftest import MESSAGE_COUNT
+
+
+def reconcile(retriever, tmp_path):
+    result = retriever.reconcile_folder("INBOX", str(tmp_path))
+    return result, retriever.load_flag_state(str(tmp_path / "INBOX"))
+
+
+def test_condstore_passes(retriever, server, tmp_path):
+    inbox = server.mailboxes["INBOX"]
+    result, state = reconcile(retriever, tmp_path)
+    assert (result['mode'], result['messages'], result['expunged']) == ("full", MESSAGE_COUNT, 0)
+    assert state['messages'][1] == [] and state['highestmodseq'] == inbox.highest_modseq
+
+    inbox.set_flags(3, ["\\Seen", "\\Flagged"])
+    inbox.expunge_uid(5)
+    result, state = reconcile(retriever, tmp_path)
+    assert (result['mode'], result['changed'], result['expunged']) == ("changedsince", 1, 1)
+    assert state['messages'][3] == ["\\Flagged", "\\Seen"]
+    assert 5 not in state['messages'] and 5 in state['expunged']
+
+    # Nothing moved: not even a FETCH
+    result, _ = reconcile(retriever, tmp_path)
+    assert (result['mode'], result['changed'], result['messages']) == ("unchanged", 0, MESSAGE_COUNT - 1)
+
+
+def test_without_condstore_every_flag_is_fetched(retriever, server, tmp_path):
+    retriever.connection.capabilities = tuple(c for c in retriever.connection.capabilities if c != 'CONDSTORE')
+    reconcile(retriever, tmp_path)
+    server.mailboxes["INBOX"].set_flags(2, ["\\Answered"])
+    server.mailboxes["INBOX"].expunge_uid(12)
+    result, state = reconcile(retriever, tmp_path)
+    assert (result['mode'], result['changed'], result['expunged']) == ("full", 1, 1)
+    assert state['messages'][2] == ["\\Answered"] and 12 in state['expunged']
+
+
+def test_uidvalidity_change_rebuilds(retriever, server, tmp_path):
+    reconcile(retriever, tmp_path)
+    retriever.disconnect()
+    server.mailboxes["INBOX"].uidvalidity += 1
+    server.mailboxes["INBOX"].expunge_uid(1)
+    assert retriever.connect("user@example.com", "password")
+    result, state = reconcile(retriever, tmp_path)
+    assert result['mode'] == "full"
+    assert state['uidvalidity'] == server.mailboxes["INBOX"].uidvalidity
+    # A new UIDVALIDITY means the old UIDs are meaningless, not expunged
+    assert state['expunged'] == {} and len(state['messages']) == MESSAGE_COUNT - 1
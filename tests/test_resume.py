@@ -0,0 +1,53 @@
+import json
+import os
+
+from conftest import MESSAGE_COUNT
+from yahoo_imap import client as client_module
+
+
+def test_resume_after_dropped_connection(retriever, server, tmp_path, monkeypatch):
+    monkeypatch.setattr(client_module, "RECONNECT_BASE_DELAY", 0)
+    output_dir = str(tmp_path / "emails")
+    # LOGIN is already done; drop the connection part way through the FETCHes
+    server.fail_after = 6
+    server.commands_seen = 0
+    emails = retriever.retrieve_resumable("INBOX", output_dir, batch_size=2)
+
+    assert server.fail_after is None, "the connection was never dropped"
+    assert retriever.metrics.total("retries_total") == 1
+    assert sorted(email['uid'] for email in emails) == list(range(1, MESSAGE_COUNT + 1))
+    with open(os.path.join(output_dir, "email_summary.json"), encoding='utf-8') as f:
+        summary = json.load(f)
+    assert summary['total_emails'] == MESSAGE_COUNT
+    assert len({entry['id'] for entry in summary['emails']}) == MESSAGE_COUNT
+
+
+def test_resume_interrupted_download(retriever, server, tmp_path, monkeypatch):
+    output_dir = str(tmp_path / "emails")
+    downloaded = retriever.iter_resumable("INBOX", output_dir, batch_size=2)
+    first = [next(downloaded) for _ in range(5)]
+    downloaded.close()
+
+    # A new run picks the journal up and only fetches what is missing
+    emails = retriever.retrieve_resumable(output_dir=output_dir)
+    uids = [email['uid'] for email in first + emails]
+    assert sorted(uids) == list(range(1, MESSAGE_COUNT + 1))
+    assert len(emails) < MESSAGE_COUNT
+
+
+def test_refused_fetch_is_fetched_on_resume(retriever, server, tmp_path, capsys):
+    output_dir = str(tmp_path / "emails")
+    # The first UID FETCH (UIDs 1-4) gets a plain NO
+    server.fail_fetches = 1
+    emails = retriever.retrieve_resumable("INBOX", output_dir, batch_size=4)
+    assert sorted(email['uid'] for email in emails) == list(range(5, MESSAGE_COUNT + 1))
+    assert "Download incomplete" in capsys.readouterr().out
+    with open(os.path.join(output_dir, "progress.json"), encoding='utf-8') as f:
+        assert json.load(f)['missing'] == [1, 2, 3, 4]
+
+    emails = retriever.retrieve_resumable(output_dir=output_dir)
+    assert sorted(email['uid'] for email in emails) == [1, 2, 3, 4]
+    assert "Download incomplete" not in capsys.readouterr().out
+    with open(os.path.join(output_dir, "email_summary.json"), encoding='utf-8') as f:
+        summary = json.load(f)
+    assert sorted(int(entry['id']) for entry in summary['emails']) == list(range(1, MESSAGE_COUNT + 1))
@@ -0,0 +1,35 @@
+import json
+import os
+
+from conftest import MESSAGE_COUNT
+
+
+def test_non_ascii_criterion_goes_last(retriever):
+    criteria = retriever.build_search_criteria(since="2024-08-01", subject="café", sender="example.com", unseen=True)
+    assert criteria[-2:] == ['SUBJECT', "café".encode('utf-8')]
+    assert all(isinstance(c, str) for c in criteria[:-1])
+    assert criteria[criteria.index('FROM') + 1] == '"example.com"'
+
+
+def test_two_non_ascii_criteria_rejected(retriever):
+    try:
+        retriever.build_search_criteria(subject="café", sender="zoë")
+    except ValueError:
+        return
+    raise AssertionError("expected ValueError")
+
+
+def test_non_ascii_search(retriever):
+    assert retriever.select_folder("INBOX") is not None
+    uids = retriever.search_messages(retriever.build_search_criteria(subject="café"), use_uid=True)
+    assert sorted(int(uid) for uid in uids) == [i for i in range(1, MESSAGE_COUNT + 1) if i % 3 == 0]
+
+
+def test_resumable_non_ascii_search(retriever, server, tmp_path):
+    # The UID range is added to the criteria; the UTF-8 literal still has to be the last one
+    output_dir = str(tmp_path / "emails")
+    criteria = retriever.build_search_criteria(subject="café")
+    emails = retriever.retrieve_resumable("INBOX", output_dir, criteria=criteria, batch_size=2)
+    assert sorted(email['uid'] for email in emails) == [i for i in range(1, MESSAGE_COUNT + 1) if i % 3 == 0]
+    with open(os.path.join(output_dir, "email_summary.json"), encoding='utf-8') as f:
+        assert all("café" in entry['subject'] for entry in json.load(f)['emails'])
@@ -0,0 +1,40 @@
+import sqlite3
+
+from conftest import MESSAGE_COUNT
+from yahoo_imap.index import MailSearchIndex
+
+
+def test_same_folder_and_id_in_two_output_dirs(retriever, tmp_path):
+    # Two accounts (or two runs) with the same folder and UIDs must not replace each other's entries
+    index = MailSearchIndex(str(tmp_path / "search.sqlite"))
+    try:
+        for run in ("account1", "account2"):
+            retriever.retrieve_resumable("INBOX", str(tmp_path / run), batch_size=5, search_index=index)
+        results = index.search('"Test message 1"', limit=50)
+        assert {result['location'].split("/")[-2] for result in results if result['subject'] == "Test message 1"} == {"account1", "account2"}
+        assert index.index_directory(str(tmp_path / "account1")) == 0
+        assert index.index_directory(str(tmp_path / "account2")) == 0
+        assert index.db.execute("SELECT COUNT(*) FROM messages").fetchone()[0] == 2 * MESSAGE_COUNT
+    finally:
+        index.close()
+
+
+def test_index_without_source_is_migrated(retriever, tmp_path):
+    db_path = str(tmp_path / "search.sqlite")
+    db = sqlite3.connect(db_path)
+    db.execute("CREATE TABLE messages (rowid INTEGER PRIMARY KEY, folder TEXT NOT NULL, email_id TEXT NOT NULL, "
+               "subject TEXT, sender TEXT, date TEXT, location TEXT, UNIQUE (folder, email_id))")
+    db.execute("CREATE VIRTUAL TABLE mail USING fts5(subject, sender, recipients, cc, body, attachments)")
+    db.execute("INSERT INTO messages VALUES (7, 'INBOX', '1', 'Old', 'a@example.com', '', ?)", (str(tmp_path / "old" / "email_0001_1.json"),))
+    db.execute("INSERT INTO mail (rowid, subject, body) VALUES (7, 'Old', 'kept after migration')")
+    db.commit()
+    db.close()
+
+    index = MailSearchIndex(db_path)
+    try:
+        assert index.contains("INBOX", "1", str(tmp_path / "old" / "email_0001_1.json"))
+        assert [result['subject'] for result in index.search("migration")] == ["Old"]
+        retriever.retrieve_resumable("INBOX", str(tmp_path / "new"), batch_size=5, search_index=index)
+        assert index.db.execute("SELECT COUNT(*) FROM messages").fetchone()[0] == MESSAGE_COUNT + 1
+    finally:
+        index.close()
@@ -0,0 +1,33 @@
+import json
+import os
+import subprocess
+import sys
+
+from conftest import ROOT
+
+# Imported by main() or the classes that need them, never at startup
+HEAVY_MODULES = ["imaplib", "ssl", "sqlite3", "concurrent.futures", "asyncio", "email.parser", "email.policy"]
+
+
+def imported_modules(code):
+    """Which HEAVY_MODULES a fresh interpreter has imported after running code"""
+    script = f"{code}\nimport json, sys\nprint(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    result = subprocess.run([sys.executable, "-c", script], cwd=ROOT, env=dict(os.environ, PYTHONPATH=ROOT),
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def test_import_skips_heavy_modules():
+    assert imported_modules("import yahoo_imap.retriever") == []
+
+
+def test_help_skips_heavy_modules():
+    code = ("from yahoo_imap.retriever import parse_args\n"
+            "try:\n    parse_args(['--help'])\nexcept SystemExit:\n    pass")
+    assert imported_modules(code) == []
+
+
+def test_moved_names_still_importable():
+    assert imported_modules("from yahoo_imap.retriever import YahooEmailRetriever") != []
+    from yahoo_imap import client, retriever
+    assert retriever.YahooEmailRetriever is client.YahooEmailRetriever
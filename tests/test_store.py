@@ -0,0 +1,69 @@
+import os
+
+from conftest import MESSAGE_COUNT
+from yahoo_imap.store import AttachmentStore
+
+
+def refcount(store, sha256):
+    return store.db.execute("SELECT refcount FROM blobs WHERE sha256 = ?", (sha256,)).fetchone()[0]
+
+
+def test_identical_content_is_stored_once(tmp_path):
+    store = AttachmentStore(str(tmp_path))
+    try:
+        sha256, path, stored = store.put(b"same bytes", ref="a.json")
+        again, again_path, stored_again = store.put(b"same bytes", ref="b.json")
+        assert (stored, stored_again) == (True, False)
+        assert (again, again_path) == (sha256, path)
+        assert path == os.path.join(str(tmp_path), sha256[:2], sha256[2:4], sha256)
+        with open(path, 'rb') as f:
+            assert f.read() == b"same bytes"
+        assert refcount(store, sha256) == 2
+        # The same ref twice counts once
+        store.add_ref(sha256, 10, "a.json")
+        assert refcount(store, sha256) == 2
+        assert not os.listdir(tmp_path / "tmp")
+    finally:
+        store.close()
+
+
+def test_release_and_gc(tmp_path):
+    store = AttachmentStore(str(tmp_path))
+    try:
+        kept, kept_path, _ = store.put(b"kept", ref=str(tmp_path / "exists.json"))
+        dropped, dropped_path, _ = store.put(b"dropped", ref="a.json")
+        orphan, orphan_path, _ = store.put(b"orphan", ref=str(tmp_path / "deleted.json"))
+        (tmp_path / "exists.json").write_text("{}")
+        assert store.release("a.json") == 1
+        assert store.gc() == 1
+        assert not os.path.exists(dropped_path) and os.path.exists(orphan_path)
+        # check_refs releases refs whose email file no longer exists
+        assert store.gc(check_refs=True) == 1
+        assert not os.path.exists(orphan_path) and os.path.exists(kept_path)
+    finally:
+        store.close()
+
+
+def test_aborted_writer_leaves_nothing(tmp_path):
+    store = AttachmentStore(str(tmp_path))
+    try:
+        writer = store.open_writer()
+        writer.write(b"partial")
+        writer.abort()
+        assert not os.listdir(tmp_path / "tmp")
+        assert store.db.execute("SELECT COUNT(*) FROM blobs").fetchone()[0] == 0
+    finally:
+        store.close()
+
+
+def test_download_shares_blobs(retriever, tmp_path):
+    emails = retriever.retrieve_emails("INBOX", output_dir=str(tmp_path), batch_size=5)
+    attachments = [attachment for email in emails for attachment in email['content']['attachments']]
+    assert len(attachments) == MESSAGE_COUNT // 4
+    # Every invoice has the same bytes
+    assert len({attachment['sha256'] for attachment in attachments}) == 1
+    store = AttachmentStore(str(tmp_path / "attachments"))
+    try:
+        assert refcount(store, attachments[0]['sha256']) == MESSAGE_COUNT // 4
+    finally:
+        store.close()
@@ -0,0 +1,65 @@
+import base64
+import binascii
+import email
+import os
+from email.message import EmailMessage
+
+import pytest
+
+from conftest import make_message
+from yahoo_imap import client as client_module
+from yahoo_imap.client import YahooEmailRetriever
+from yahoo_imap.mime import TransferDecoder
+from yahoo_imap.store import AttachmentStore
+
+
+def big_message():
+    """multipart/mixed holding multipart/alternative, a large binary and a quoted-printable text attachment"""
+    msg = EmailMessage()
+    msg['Subject'] = "Big"
+    msg['From'] = "a@example.com"
+    msg.set_content("plain body\n")
+    msg.add_alternative("<p>html body</p>", subtype='html')
+    msg.add_attachment(os.urandom(300_000), maintype='application', subtype='octet-stream', filename="blob.bin")
+    msg.add_attachment("café = 1\n" * 200, subtype='plain', cte='quoted-printable', filename="notes.txt")
+    return msg.as_bytes()
+
+
+@pytest.mark.parametrize("encoding, data", [
+    ("base64", base64.encodebytes(bytes(range(256)) * 20)),
+    ("quoted-printable", binascii.b2a_qp("café = ok, long line ".encode() * 30)),
+])
+def test_transfer_decoder_any_split(encoding, data):
+    whole = TransferDecoder(encoding)
+    expected = whole.decode(data) + whole.flush()
+    for split in range(0, len(data), 37):
+        decoder = TransferDecoder(encoding)
+        assert decoder.decode(data[:split]) + decoder.decode(data[split:]) + decoder.flush() == expected
+
+
+@pytest.mark.parametrize("raw", [make_message(4), big_message()], ids=["small", "big"])
+def test_streaming_matches_tree_parser(raw, tmp_path, monkeypatch):
+    # A tiny buffer makes every line of a big part arrive in pieces
+    monkeypatch.setattr(client_module, "STREAM_BUFFER_SIZE", 1000)
+    retriever = YahooEmailRetriever()
+    tree_store = AttachmentStore(str(tmp_path / "tree"))
+    stream_store = AttachmentStore(str(tmp_path / "stream"))
+    try:
+        tree = retriever.get_email_content(email.message_from_bytes(raw), "1", store=tree_store)
+        _, streamed = retriever.extract_streaming(raw, "1", store=stream_store)
+    finally:
+        tree_store.close()
+        stream_store.close()
+    assert streamed['text'] == tree['text']
+    assert streamed['html'] == tree['html']
+    fields = ('filename', 'content_type', 'size', 'sha256')
+    assert [{key: a[key] for key in fields} for a in streamed['attachments']] == [{key: a[key] for key in fields} for a in tree['attachments']]
+    for attachment in streamed['attachments']:
+        with open(attachment['saved_path'], 'rb') as f:
+            assert len(f.read()) == attachment['size']
+
+
+def test_streaming_text_mode_skips_attachments_without_store():
+    _, content = YahooEmailRetriever().extract_streaming(big_message(), "1", mode="text")
+    assert content['text'] == "plain body\n"
+    assert content['attachments'] == []
@@ -0,0 +1,84 @@
+import json
+
+from conftest import MESSAGE_COUNT
+from yahoo_imap.archive import SummaryWriter
+
+
+def email_data(i, attachments=0, **extra):
+    data = {
+        'id': i,
+        'subject': f"Subject {i} " + "x" * 200,
+        'from': f"sender{i}@example.com",
+        'date': "Fri, 30 Aug 2024 22:22:42 -0400",
+        'content': {'text': "", 'html': "", 'attachments': [{'filename': f"f{n}"} for n in range(attachments)]}
+    }
+    data.update(extra)
+    return data
+
+
+def test_summary_layout(tmp_path):
+    writer = SummaryWriter(str(tmp_path), "INBOX")
+    writer.add(email_data(1, attachments=2, uid=11))
+    writer.add(email_data(2, duplicate_of="/elsewhere/email_5.json"))
+    path = writer.close()
+
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+    summary = json.loads(text)
+    assert text == json.dumps(summary, indent=2, ensure_ascii=False)
+    assert summary['total_emails'] == 2
+    assert summary['total_attachments'] == 2
+    assert summary['folder'] == "INBOX"
+    assert summary['attachments_saved'] is True
+    first, second = summary['emails']
+    assert first == {'id': 1, 'subject': email_data(1)['subject'][:100], 'from': "sender1@example.com",
+                     'date': "Fri, 30 Aug 2024 22:22:42 -0400", 'attachment_count': 2, 'uid': 11}
+    assert second['duplicate_of'] == "/elsewhere/email_5.json"
+
+
+def test_empty_summary(tmp_path):
+    path = SummaryWriter(str(tmp_path), "INBOX").close()
+    with open(path, encoding='utf-8') as f:
+        assert json.load(f)['emails'] == []
+
+
+def test_append_keeps_earlier_runs(tmp_path):
+    writer = SummaryWriter(str(tmp_path), "INBOX")
+    writer.add(email_data(1))
+    writer.add(email_data(2, attachments=1))
+    writer.close()
+    with open(tmp_path / "email_summary.jsonl", 'a', encoding='utf-8') as f:
+        f.write('{"id": 9, "subj')  # torn by a crash
+
+    writer = SummaryWriter(str(tmp_path), "INBOX", append=True)
+    writer.add(email_data(2, attachments=3))
+    writer.add(email_data(3))
+    with open(writer.close(), encoding='utf-8') as f:
+        summary = json.load(f)
+    # The last entry for an id wins and keeps its place in the file
+    assert [entry['id'] for entry in summary['emails']] == [1, 2, 3]
+    assert summary['emails'][1]['attachment_count'] == 3
+    assert summary['total_attachments'] == 3
+
+
+def test_without_append_starts_afresh(tmp_path):
+    writer = SummaryWriter(str(tmp_path), "INBOX")
+    writer.add(email_data(1))
+    writer.close()
+    writer = SummaryWriter(str(tmp_path), "INBOX")
+    writer.add(email_data(2))
+    with open(writer.close(), encoding='utf-8') as f:
+        assert [entry['id'] for entry in json.load(f)['emails']] == [2]
+
+
+def test_partial_download_streams_summary(retriever, tmp_path):
+    emails = retriever.iter_partial("INBOX", output_dir=str(tmp_path), batch_size=5)
+    first = [next(emails)['uid'] for _ in range(3)]
+    # Stopping early still leaves a summary of the messages saved so far
+    emails.close()
+    with open(tmp_path / "email_summary.json", encoding='utf-8') as f:
+        assert [entry['uid'] for entry in json.load(f)['emails']] == first
+
+    assert sum(1 for _ in retriever.iter_partial("INBOX", output_dir=str(tmp_path), batch_size=5)) == MESSAGE_COUNT
+    with open(tmp_path / "email_summary.json", encoding='utf-8') as f:
+        assert [entry['uid'] for entry in json.load(f)['emails']] == list(range(1, MESSAGE_COUNT + 1))
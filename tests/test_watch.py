@@ -0,0 +1,61 @@
+import threading
+import time
+
+from conftest import MESSAGE_COUNT, make_message
+from yahoo_imap.client import YahooEmailRetriever
+from yahoo_imap.pool import SyncDaemon
+
+
+def wait_until(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.05)
+
+
+def test_idle_wakes_on_new_mail(server, retriever):
+    assert retriever.select_folder("INBOX") == MESSAGE_COUNT
+    timer = threading.Timer(0.3, server.mailboxes["INBOX"].append, args=(make_message(MESSAGE_COUNT + 1),))
+    timer.start()
+    try:
+        started = time.monotonic()
+        assert retriever.wait_for_mail(idle_timeout=10) is True
+        assert time.monotonic() - started < 5
+    finally:
+        timer.cancel()
+    # The connection is usable again after DONE
+    assert retriever.select_folder("INBOX") == MESSAGE_COUNT + 1
+
+
+def test_idle_timeout_and_stop(retriever):
+    retriever.select_folder("INBOX")
+    assert retriever.wait_for_mail(idle_timeout=0.3) is False
+    stop = threading.Event()
+    threading.Timer(0.2, stop.set).start()
+    started = time.monotonic()
+    assert retriever.wait_for_mail(idle_timeout=30, stop=stop) is False
+    assert time.monotonic() - started < 5
+    assert retriever.select_folder("INBOX") == MESSAGE_COUNT
+
+
+def test_daemon_syncs_new_mail(server, tmp_path, monkeypatch):
+    output_dir = str(tmp_path / "mail")
+    daemon = SyncDaemon("user@example.com", "password", ["INBOX"], output_dir=output_dir, idle_timeout=1, batch_size=5)
+    monkeypatch.setattr(daemon, "create_retriever", lambda: YahooEmailRetriever("127.0.0.1", server.port, use_ssl=False,
+                                                                                  metrics=daemon.metrics))
+    reader = YahooEmailRetriever()
+
+    def synced_uid():
+        return reader.load_sync_state(output_dir).get("INBOX", {}).get("last_uid", 0)
+
+    thread = threading.Thread(target=daemon.run, daemon=True)
+    thread.start()
+    try:
+        wait_until(lambda: synced_uid() == MESSAGE_COUNT)
+        server.mailboxes["INBOX"].append(make_message(MESSAGE_COUNT + 1))
+        wait_until(lambda: synced_uid() == MESSAGE_COUNT + 1)
+        assert reader.load_sync_state(output_dir)["INBOX"]["message_count"] == MESSAGE_COUNT + 1
+    finally:
+        daemon.stop()
+        thread.join(10)
+    assert not thread.is_alive()
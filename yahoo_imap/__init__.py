@@ -0,0 +1,14 @@
+'''
+Download Yahoo mail over IMAP.
+
+The commands live in yahoo_imap.retriever (get-yh-emails) and
+yahoo_imap.getemail (getemail); yahoo_imap.batch holds the asyncio
+backend used by --config. The IMAP client is yahoo_imap.client, with
+the pieces it writes through in their own modules: archive (summary and
+archives), store (attachments), index (search and dedup indexes),
+journal (resume and sync state), metrics, plugins (attachment
+post-processing), pacing (adaptive fetching and backoff), mime (header
+and transfer decoding) and pool (parallel downloads and --watch).
+Importing the package itself imports nothing else, so the commands
+start quickly.
+'''
@@ -0,0 +1,3 @@
+from .retriever import main
+
+main()
@@ -0,0 +1,265 @@
+'''
+Folder output besides the per-message JSON files: the email_summary.json
+writer and the segment/mbox/maildir archives with their offset index.
+'''
+
+import json
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+from datetime import datetime
+
+# On-disk archive formats; "json" is one pretty-printed file per message
+ARCHIVE_FORMATS = ("segments", "mbox", "maildir")
+ARCHIVE_SEGMENT_SIZE = 64 * 1024 * 1024
+ARCHIVE_INDEX_FILE = "archive.idx"
+ARCHIVE_MANIFEST_FILE = "archive.json"
+
+
+class SummaryWriter:
+    """Incremental writer for a folder's email_summary.json
+
+    Every saved email's summary entry is appended to email_summary.jsonl
+    as it comes in, so no list of emails is needed and an interrupted run
+    keeps the entries written so far. close() rebuilds
+    email_summary.json from the JSON Lines file without loading it whole;
+    when an id occurs more than once the last entry wins. With append the
+    entries of earlier runs are kept, otherwise the folder starts afresh.
+    add() can be called from several threads.
+    """
+
+    def __init__(self, output_dir, folder, save_attachments=True, append=False):
+        self.folder = folder
+        self.save_attachments = save_attachments
+        self.summary_file = os.path.join(output_dir, "email_summary.json")
+        self.lines_file = os.path.join(output_dir, "email_summary.jsonl")
+        os.makedirs(output_dir, exist_ok=True)
+        if append and not os.path.exists(self.lines_file) and os.path.exists(self.summary_file):
+            # Summary written before the JSON Lines file existed
+            with open(self.summary_file, 'r', encoding='utf-8') as f:
+                entries = json.load(f).get('emails', [])
+            with open(self.lines_file, 'w', encoding='utf-8') as f:
+                for entry in entries:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self.file = open(self.lines_file, 'a' if append else 'w', encoding='utf-8')
+        if append and self.file.tell() and not self.ends_with_newline():
+            # Finish a line torn by a crash so the next entry is not glued onto it
+            self.file.write("\n")
+        self.lock = threading.Lock()
+
+    def ends_with_newline(self):
+        with open(self.lines_file, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def entry(self, email_data):
+        """The summary entry for one email_data dict"""
+        entry = {
+            'id': email_data['id'],
+            'subject': email_data['subject'][:100],
+            'from': email_data['from'],
+            'date': email_data['date'],
+            'attachment_count': len(email_data['content']['attachments'])
+        }
+        if 'uid' in email_data:
+            entry['uid'] = email_data['uid']
+        if 'duplicate_of' in email_data:
+            entry['duplicate_of'] = email_data['duplicate_of']
+        return entry
+
+    def add(self, email_data):
+        line = json.dumps(self.entry(email_data), ensure_ascii=False) + "\n"
+        with self.lock:
+            self.file.write(line)
+
+    def entries(self):
+        """Yield (line number, entry) from the JSON Lines file, skipping a torn last line"""
+        with open(self.lines_file, 'r', encoding='utf-8') as f:
+            for number, line in enumerate(f):
+                try:
+                    yield number, json.loads(line)
+                except ValueError:
+                    continue
+
+    def close(self):
+        """Write email_summary.json and return its path"""
+        self.file.close()
+        latest = {}
+        for number, entry in self.entries():
+            latest[entry['id']] = (number, entry['attachment_count'])
+        header = {
+            'total_emails': len(latest),
+            'total_attachments': sum(count for _, count in latest.values()),
+            'folder': self.folder,
+            'retrieved_at': datetime.now().isoformat(),
+            'attachments_saved': self.save_attachments
+        }
+        keep = {number for number, _ in latest.values()}
+        del latest
+        # Same layout as json.dump(summary, f, indent=2), one entry at a time
+        tmp_file = self.summary_file + ".tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            f.write("{\n")
+            for key, value in header.items():
+                f.write(f"  {json.dumps(key)}: {json.dumps(value, ensure_ascii=False)},\n")
+            f.write('  "emails": [')
+            separator = "\n    "
+            for number, entry in self.entries():
+                if number in keep:
+                    f.write(separator + json.dumps(entry, indent=2, ensure_ascii=False).replace("\n", "\n    "))
+                    separator = ",\n    "
+            f.write("\n  ]\n}" if separator != "\n    " else "]\n}")
+        os.replace(tmp_file, self.summary_file)
+        return self.summary_file
+
+
+class ArchiveWriter:
+    """Append-only archive of downloaded messages in a single directory
+
+    Formats:
+      segments - each email_data dict as a zlib-compressed JSON record,
+                 length-prefixed, appended to segment_NNNNNN.dat files that
+                 roll over at segment_size bytes
+      mbox     - the raw RFC822 messages appended to messages.mbox
+      maildir  - the raw RFC822 messages as a maildir
+
+    Every append adds a line to the sidecar archive.idx, so ArchiveReader
+    can seek straight to any message by key. Appends are serialised with a
+    lock, so one writer can be shared by several threads.
+    """
+
+    def __init__(self, archive_dir, archive_format="segments", segment_size=ARCHIVE_SEGMENT_SIZE):
+        if archive_format not in ARCHIVE_FORMATS:
+            raise ValueError(f"Unknown archive format {archive_format}")
+        self.archive_dir = archive_dir
+        self.segment_size = segment_size
+        self.lock = threading.Lock()
+        os.makedirs(archive_dir, exist_ok=True)
+
+        manifest_file = os.path.join(archive_dir, ARCHIVE_MANIFEST_FILE)
+        if os.path.exists(manifest_file):
+            with open(manifest_file, 'r', encoding='utf-8') as f:
+                existing_format = json.load(f)['format']
+            if existing_format != archive_format:
+                raise ValueError(f"{archive_dir} already holds a {existing_format} archive")
+        else:
+            with open(manifest_file, 'w', encoding='utf-8') as f:
+                json.dump({'format': archive_format, 'version': 1}, f)
+        self.archive_format = archive_format
+
+        self.index = open(os.path.join(archive_dir, ARCHIVE_INDEX_FILE), 'a', encoding='utf-8')
+        self.data = None
+        self.maildir = None
+        if archive_format == "segments":
+            segments = sorted(name for name in os.listdir(archive_dir) if name.startswith("segment_") and name.endswith(".dat"))
+            self.segment = int(segments[-1][8:14]) if segments else 1
+            self.open_segment()
+        elif archive_format == "mbox":
+            self.segment = 0
+            self.data = open(os.path.join(archive_dir, "messages.mbox"), 'ab')
+        else:
+            import mailbox
+            self.maildir = mailbox.Maildir(os.path.join(archive_dir, "maildir"), create=True)
+
+    def segment_path(self, segment):
+        return os.path.join(self.archive_dir, f"segment_{segment:06d}.dat")
+
+    def open_segment(self):
+        if self.data:
+            self.data.close()
+        self.data = open(self.segment_path(self.segment), 'ab')
+
+    def append(self, key, email_data=None, raw_email=None):
+        """Append a message under key ('segments' stores email_data, 'mbox'/'maildir' store raw_email)"""
+        key = str(key)
+        with self.lock:
+            if self.archive_format == "maildir":
+                location = self.maildir.add(raw_email)
+            else:
+                if self.archive_format == "segments":
+                    payload = zlib.compress(json.dumps(email_data, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+                    if self.data.tell() and self.data.tell() + len(payload) > self.segment_size:
+                        self.segment += 1
+                        self.open_segment()
+                    record = struct.pack('>I', len(payload)) + payload
+                else:
+                    # mboxo: escape body lines that would look like a separator
+                    body = re.sub(rb'(?m)^(>*From )', rb'>\1', raw_email.replace(b'\r\n', b'\n'))
+                    if not body.endswith(b'\n'):
+                        body += b'\n'
+                    record = b"From MAILER-DAEMON " + time.asctime(time.gmtime()).encode() + b"\n" + body + b"\n"
+                offset = self.data.tell()
+                self.data.write(record)
+                self.data.flush()
+                location = f"{self.segment}\t{offset}\t{len(record)}"
+            # The data is written before the index line, so a crash never leaves
+            # an index entry pointing at missing data
+            self.index.write(f"{key}\t{location}\n")
+            self.index.flush()
+        return f"{self.archive_dir}#{key}"
+
+    def close(self):
+        with self.lock:
+            if self.data:
+                self.data.close()
+                self.data = None
+            self.index.close()
+
+
+class ArchiveReader:
+    """Random access to an ArchiveWriter directory by message key"""
+
+    def __init__(self, archive_dir):
+        self.archive_dir = archive_dir
+        with open(os.path.join(archive_dir, ARCHIVE_MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            self.archive_format = json.load(f)['format']
+        self.maildir = None
+        if self.archive_format == "maildir":
+            import mailbox
+            self.maildir = mailbox.Maildir(os.path.join(archive_dir, "maildir"), create=False)
+
+        # Later entries win, so a message fetched again replaces the older copy
+        self.locations = {}
+        index_file = os.path.join(archive_dir, ARCHIVE_INDEX_FILE)
+        if os.path.exists(index_file):
+            with open(index_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if not line.endswith("\n"):
+                        break
+                    key, location = line.rstrip("\n").split("\t", 1)
+                    self.locations[key] = location
+
+    def keys(self):
+        return list(self.locations)
+
+    def __len__(self):
+        return len(self.locations)
+
+    def __contains__(self, key):
+        return str(key) in self.locations
+
+    def read_record(self, location):
+        segment, offset, length = (int(value) for value in location.split("\t"))
+        path = os.path.join(self.archive_dir, f"segment_{segment:06d}.dat" if segment else "messages.mbox")
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def get(self, key):
+        """Return the stored message: the email_data dict for 'segments', raw RFC822 bytes otherwise"""
+        location = self.locations[str(key)]
+        if self.archive_format == "maildir":
+            return self.maildir.get_bytes(location)
+        record = self.read_record(location)
+        if self.archive_format == "segments":
+            length = struct.unpack('>I', record[:4])[0]
+            return json.loads(zlib.decompress(record[4:4 + length]).decode('utf-8'))
+        body = record.split(b"\n", 1)[1][:-1]
+        return re.sub(rb'(?m)^>(>*From )', rb'\1', body)
+
+    def __iter__(self):
+        for key in self.locations:
+            yield key, self.get(key)
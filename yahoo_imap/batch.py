@@ -0,0 +1,744 @@
+'''
+asyncio backend and unattended multi-account batch runs (--config).
+
+Kept apart so that the interactive and single-folder runs do not
+import asyncio at startup; yahoo_imap.retriever still provides these
+names and imports this module the first time one of them is used.
+'''
+
+import asyncio
+import imaplib
+import json
+import os
+import re
+import ssl
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+from .archive import ARCHIVE_FORMATS, ArchiveWriter, SummaryWriter
+from .client import DEDUP_HEADER_BATCH_SIZE, DEDUP_HEADER_FIELDS, YahooEmailRetriever
+from .index import DedupIndex, MailSearchIndex
+from .metrics import METRICS_FILE, Metrics
+from .mime import EMAIL_POLICIES, PARSE_MODES
+from .pacing import RECONNECT_MAX_RETRIES, AdaptiveFetchController, TokenBucket
+from .plugins import ATTACHMENT_PLUGINS, AttachmentPostProcessor
+from .store import AttachmentStore
+
+# Written next to the downloads by the --config batch runner
+BATCH_REPORT_FILE = "batch_report.json"
+
+# Longest response line the asyncio backend accepts (SEARCH results of a huge folder)
+ASYNC_LINE_LIMIT = 16 * 1024 * 1024
+
+
+class AsyncYahooEmailRetriever:
+    """asyncio backend with the same connect/list_folders/retrieve_emails surface
+
+    Only the connection is async. Parsing and saving are done in worker
+    threads by client, a YahooEmailRetriever that never connects, so no
+    blocking method of the threaded client is reachable from here.
+    Commands are tagged and pipelined: up to pipeline_depth FETCH commands
+    are in flight on the connection while earlier responses are parsed and
+    written in worker threads, so receiving, parsing and disk writes
+    overlap. The coroutine methods are connect, list_folders,
+    select_folder, search_messages, fetch_messages, retrieve_emails and
+    disconnect, plus the async generator iter_emails; many instances can share one event loop (see
+    archive_accounts). throttle is an optional TokenBucket shared between
+    connections to cap the total download rate. With a controller
+    (AdaptiveFetchController) the batch size and pipeline depth are tuned
+    as the download goes, pipeline_depth being the most FETCH commands
+    in flight. Command latencies are
+    measured from send to completion, so pipelined FETCHes include the
+    time spent queued behind earlier ones.
+    """
+
+    def __init__(self, pipeline_depth=4, imap_server="imap.mail.yahoo.com", imap_port=993, use_ssl=True, *, throttle=None, metrics=None,
+                 parse_mode="full", email_policy="compat32", controller=None, postprocessor=None):
+        self.client = YahooEmailRetriever(imap_server, imap_port, use_ssl, metrics=metrics, parse_mode=parse_mode, email_policy=email_policy,
+                                          postprocessor=postprocessor, controller=controller)
+        self.imap_server = imap_server
+        self.imap_port = imap_port
+        self.metrics = self.client.metrics
+        self.controller = controller
+        self.connection = None
+        self.selected_folder = None
+        self.selected_count = 0
+        self.pipeline_depth = max(1, pipeline_depth)
+        self.ssl_context = ssl.create_default_context() if use_ssl else None
+        self.throttle = throttle
+        self.bytes_received = 0
+        self.reader = None
+        self.writer = None
+        self.reader_task = None
+        self.send_lock = None
+        self.continuation = None
+        self.tag_counter = 0
+        self.tag_prefix = f"Y{id(self) % 10000:04d}".encode()
+        self.pending = deque()
+        self.untagged = {}
+
+    async def connect(self, username, password):
+        """Connect to Yahoo IMAP server"""
+        try:
+            self.reader, self.writer = await asyncio.open_connection(self.imap_server, self.imap_port, ssl=self.ssl_context,
+                                                                     limit=ASYNC_LINE_LIMIT)
+            greeting = await self.reader.readuntil(b"\r\n")
+            if not greeting.startswith(b"* OK") and not greeting.startswith(b"* PREAUTH"):
+                raise ConnectionError(f"Unexpected greeting: {greeting.decode(errors='replace').strip()}")
+            self.send_lock = asyncio.Lock()
+            self.reader_task = asyncio.create_task(self.read_responses())
+            status, _, text = await self.command(b"LOGIN", self.quote(username), self.quote(password))
+            if status != 'OK':
+                raise imaplib.IMAP4.error(text)
+            self.connection = self.writer
+            self.selected_folder = None
+            print("Successfully connected to Yahoo IMAP server")
+            return True
+        except imaplib.IMAP4.error as e:
+            print(f"IMAP Error: {e}")
+            await self.close_transport()
+            return False
+        except Exception as e:
+            print(f"Connection error: {e}")
+            await self.close_transport()
+            return False
+
+    def quote(self, value):
+        """Render a string as an IMAP quoted string"""
+        return b'"' + value.replace('\\', '\\\\').replace('"', '\\"').encode() + b'"'
+
+    async def read_responses(self):
+        """Read responses for the whole connection and hand them to the waiting commands
+
+        Untagged responses belong to the oldest command still in flight;
+        servers answer pipelined commands in order. Items are shaped like
+        imaplib's: literals come as (prefix, bytes) tuples.
+        """
+        try:
+            while True:
+                line = await self.reader.readuntil(b"\r\n")
+                received = len(line)
+                parts = []
+                match = re.search(rb'\{(\d+)\}\r\n$', line)
+                while match:
+                    literal = await self.reader.readexactly(int(match.group(1)))
+                    parts.append((line[:-2], literal))
+                    line = await self.reader.readuntil(b"\r\n")
+                    received += len(literal) + len(line)
+                    match = re.search(rb'\{(\d+)\}\r\n$', line)
+                line = line[:-2]
+                self.bytes_received += received
+                self.metrics.inc("bytes_received_total", received)
+                if self.throttle:
+                    await self.throttle.consume(received)
+
+                if line.startswith(b"+"):
+                    if self.continuation and not self.continuation.done():
+                        self.continuation.set_result(line)
+                elif line.startswith(b"* ") or (parts and parts[0][0].startswith(b"* ")):
+                    self.store_untagged(parts, line)
+                else:
+                    tag, _, rest = line.partition(b" ")
+                    status, _, text = rest.partition(b" ")
+                    for entry in self.pending:
+                        if entry[0] == tag:
+                            self.pending.remove(entry)
+                            if not entry[2].done():
+                                entry[2].set_result((status.decode(), entry[1], text.decode(errors='replace')))
+                            break
+        except (asyncio.IncompleteReadError, ConnectionError, OSError) as e:
+            error = ConnectionError(f"Connection lost: {e}")
+        except asyncio.CancelledError:
+            error = ConnectionError("Connection closed")
+        except Exception as e:
+            error = e
+        for _, _, future in self.pending:
+            if not future.done():
+                future.set_exception(error)
+        self.pending.clear()
+        if self.continuation and not self.continuation.done():
+            self.continuation.set_exception(error)
+
+    def store_untagged(self, parts, line):
+        """File an untagged response under its type, the way imaplib does"""
+        untagged = self.pending[0][1] if self.pending else self.untagged
+        text = parts[0][0] if parts else line
+        match = re.match(rb'\* (\d+) ([A-Z-]+)(?: (.*))?$', text, re.S)
+        if match:
+            typ, data = match.group(2), match.group(1) + (b" " + match.group(3) if match.group(3) is not None else b"")
+        else:
+            match = re.match(rb'\* ([A-Z-]+)(?: (.*))?$', text, re.S)
+            if not match:
+                return
+            typ, data = match.group(1), match.group(2) or b""
+        typ = typ.decode()
+        if typ in ('OK', 'NO', 'BAD', 'BYE'):
+            code = re.match(rb'\[([A-Z-]+)(?: ([^\]]*))?\]', data)
+            if code:
+                untagged.setdefault(code.group(1).decode(), []).append(code.group(2))
+        items = untagged.setdefault(typ, [])
+        if parts:
+            items.append((data, parts[0][1]))
+            items.extend(parts[1:])
+            if line:
+                items.append(line)
+        else:
+            items.append(data)
+
+    async def send(self, name, *args, literal=None):
+        """Send a tagged command and return a future for (status, untagged, text)
+
+        The caller can send more commands before awaiting the future.
+        literal (bytes) is sent as a synchronizing literal after args.
+        """
+        if not self.writer or not self.reader_task or self.reader_task.done():
+            raise ConnectionError("Not connected to server")
+        async with self.send_lock:
+            self.tag_counter += 1
+            tag = self.tag_prefix + str(self.tag_counter).encode()
+            future = asyncio.get_running_loop().create_future()
+            started = time.perf_counter()
+            future.add_done_callback(lambda _: self.metrics.observe("imap_command_seconds", time.perf_counter() - started,
+                                                                    command=name.split()[-1].decode()))
+            self.pending.append((tag, {}, future))
+            line = b" ".join([tag, name] + [arg if isinstance(arg, bytes) else str(arg).encode() for arg in args])
+            if literal is not None:
+                self.continuation = asyncio.get_running_loop().create_future()
+                self.writer.write(line + b" {%d}\r\n" % len(literal))
+                await self.writer.drain()
+                await self.continuation
+                self.writer.write(literal + b"\r\n")
+            else:
+                self.writer.write(line + b"\r\n")
+            await self.writer.drain()
+        return future
+
+    async def command(self, name, *args, literal=None):
+        """Send a command and wait for its completion"""
+        return await (await self.send(name, *args, literal=literal))
+
+    async def list_folders(self):
+        """List all available folders/mailboxes"""
+        if not self.connection:
+            print("Not connected to server")
+            return []
+
+        try:
+            status, untagged, _ = await self.command(b"LIST", b'""', b'"*"')
+            folder_list = []
+            if status == 'OK':
+                for folder in untagged.get('LIST', []):
+                    folder_name = folder.decode().split('"')[-2]
+                    folder_list.append(folder_name)
+            return folder_list
+        except Exception as e:
+            print(f"Error listing folders: {e}")
+            return []
+
+    async def select_folder(self, folder, reuse=False):
+        """SELECT a folder and return its message count (None on error)"""
+        if reuse and self.selected_folder == folder:
+            return self.selected_count
+
+        status, untagged, _ = await self.command(b"SELECT", self.quote(folder))
+        if status != 'OK':
+            self.selected_folder = None
+            return None
+        self.selected_folder = folder
+        self.selected_count = int(untagged.get('EXISTS', [b"0"])[-1])
+        uidvalidity = untagged.get('UIDVALIDITY')
+        # Recorded with the saved messages by the client's save_email()
+        self.client.selected_uidvalidity = int(uidvalidity[-1]) if uidvalidity and uidvalidity[-1] else None
+        return self.selected_count
+
+    async def search_messages(self, criteria=None, use_uid=False):
+        """Run SEARCH (or UID SEARCH) on the selected folder; see YahooEmailRetriever.search_messages"""
+        criteria = list(criteria or [])
+        literal = None
+        if criteria and isinstance(criteria[-1], bytes):
+            literal = criteria.pop()
+            criteria = ['CHARSET', 'UTF-8'] + criteria
+        if not criteria:
+            criteria = ["ALL"]
+
+        name = b"UID SEARCH" if use_uid else b"SEARCH"
+        status, untagged, _ = await self.command(name, *criteria, literal=literal)
+        if status != 'OK':
+            return None
+        return b" ".join(untagged.get('SEARCH', [])).split()
+
+    async def skip_duplicates(self, message_ids, folder, dedup, use_uid=False):
+        """Drop the messages dedup already has before fetching bodies; see YahooEmailRetriever.skip_duplicates"""
+        message_ids = [msg_id if isinstance(msg_id, bytes) else str(msg_id).encode() for msg_id in message_ids]
+        name = b"UID FETCH" if use_uid else b"FETCH"
+        items = f"({'UID ' if use_uid else ''}BODY.PEEK[HEADER.FIELDS ({DEDUP_HEADER_FIELDS})])"
+        remaining = []
+        duplicates = []
+        for start in range(0, len(message_ids), DEDUP_HEADER_BATCH_SIZE):
+            batch = message_ids[start:start + DEDUP_HEADER_BATCH_SIZE]
+            status, untagged, _ = await self.command(name, self.client.build_sequence_set(batch), items)
+            headers = self.client.index_fetch_literals(untagged.get('FETCH', []), use_uid) if status == 'OK' else {}
+            fetch, skipped = await asyncio.to_thread(self.client.sort_duplicates, batch, headers, folder, dedup, use_uid)
+            remaining += fetch
+            duplicates += skipped
+        await asyncio.to_thread(dedup.commit)
+        if duplicates:
+            print(f"Skipping {len(duplicates)} messages already downloaded (same Message-ID)")
+            self.metrics.inc("duplicates_total", len(duplicates))
+        return remaining, duplicates
+
+    async def fetch_messages(self, message_ids, batch_size=1, use_uid=False):
+        """Fetch raw messages, keeping up to pipeline_depth FETCH commands in flight
+
+        An async generator yielding (msg_id, raw_email) in the order of
+        message_ids. With a controller, batches refused with a throttling
+        code are sent again (smaller) after the controller's pause, and
+        out-of-order results are held back until the earlier batches are in.
+        """
+        batch_size = max(1, batch_size or 1)
+        # (start, ids) still to send; a throttled batch goes back to the front
+        queued = deque([(0, list(message_ids))]) if message_ids else deque()
+        in_flight = deque()
+        retries = 0
+        last_done = time.perf_counter()
+        try:
+            while queued or in_flight:
+                # Top up the pipeline before waiting on the oldest command
+                depth = min(self.pipeline_depth, self.controller.in_flight) if self.controller else self.pipeline_depth
+                while queued and len(in_flight) < depth:
+                    if self.controller:
+                        batch_size = self.controller.batch_size
+                        if self.controller.pause():
+                            if in_flight:
+                                break
+                            await asyncio.sleep(self.controller.pause())
+                    start, ids = queued.popleft()
+                    batch = ids[:batch_size]
+                    if len(ids) > batch_size:
+                        queued.appendleft((start + batch_size, ids[batch_size:]))
+                    if use_uid:
+                        future = await self.send(b"UID FETCH", self.client.build_sequence_set(batch), b"(UID RFC822)")
+                    else:
+                        future = await self.send(b"FETCH", self.client.build_sequence_set(batch), b"(RFC822)")
+                    in_flight.append((start, batch, future, time.perf_counter()))
+
+                start, batch, future, sent = in_flight.popleft()
+                try:
+                    status, untagged, text = await future
+                except ConnectionError:
+                    # BYE, or the server dropped the connection
+                    if self.controller:
+                        self.controller.throttled("BYE")
+                    raise
+                # Time this command had the connection to itself, not the time spent queued behind earlier ones
+                now = time.perf_counter()
+                seconds = now - max(sent, last_done)
+                last_done = now
+                if status != 'OK':
+                    reason = self.controller.throttle_reason(text) if self.controller else None
+                    if reason and retries < RECONNECT_MAX_RETRIES:
+                        self.controller.throttled(reason, len(batch))
+                        retries += 1
+                        # Commands sent after this one are answered but re-sent, to keep the messages in order
+                        for later in reversed(in_flight):
+                            queued.appendleft((later[0], later[1]))
+                        queued.appendleft((start, batch))
+                        try:
+                            # An error here means the connection is gone; the next send() reports it
+                            await asyncio.gather(*(later[2] for later in in_flight), return_exceptions=True)
+                        finally:
+                            for later in in_flight:
+                                later[2].cancel()
+                            in_flight.clear()
+                        continue
+                    print(f"Error fetching messages {start + 1}-{start + len(batch)}: {text}")
+                    self.metrics.inc("errors_total", stage="fetch")
+                    continue
+                retries = 0
+
+                raw_by_id = self.client.index_fetch_literals(untagged.get('FETCH', []), use_uid)
+                if self.controller:
+                    received = sum(len(raw) for raw in raw_by_id.values())
+                    self.controller.record(len(batch), received, seconds)
+                    if self.controller.bucket:
+                        await self.controller.bucket.consume(received)
+                for msg_id in batch:
+                    msg_id = msg_id if isinstance(msg_id, bytes) else str(msg_id).encode()
+                    raw_email = raw_by_id.pop(msg_id, None)
+                    if raw_email is None:
+                        print(f"Message {msg_id.decode()} missing from FETCH response")
+                        continue
+                    yield msg_id, raw_email
+        finally:
+            # Answers nobody will read: the connection dropped or the caller stopped early
+            for later in in_flight:
+                if later[2].done() and not later[2].cancelled():
+                    later[2].exception()
+                later[2].cancel()
+
+    async def retrieve_emails(self, folder="INBOX", limit=None, **options):
+        """iter_emails() collected into a list"""
+        return [email_data async for email_data in self.iter_emails(folder, limit, **options)]
+
+    async def iter_emails(self, folder="INBOX", limit=None, *, save_to_file=True, output_dir="emails", save_attachments=True, batch_size=100,
+                          uids=None, start_index=1, append_summary=False, save_summary=True, streaming=False, store=None,
+                          criteria=None, archive_format="json", archive=None, search_index=None, dedup=None):
+        """Retrieve emails from specified folder; see YahooEmailRetriever.iter_emails
+
+        An async generator: each message is parsed and saved in a worker
+        thread while the next FETCH responses are still arriving, and is
+        yielded once saved. The summary is written as the emails come in.
+        dedup works as in the threaded version; there is no journal, as
+        resumable downloads (--resume) are not supported here.
+        """
+        if not self.connection:
+            print("Not connected to server")
+            return
+
+        own_store = None
+        own_archive = None
+        summary = None
+        try:
+            num_messages = await self.select_folder(folder, reuse=uids is not None)
+            if num_messages is None:
+                print(f"Error selecting folder {folder}")
+                return
+            print(f"Found {num_messages} messages in {folder}")
+
+            if uids is not None:
+                message_ids = [str(uid).encode() for uid in uids]
+            else:
+                message_ids = await self.search_messages(criteria)
+                if message_ids is None:
+                    print("Error searching for messages")
+                    return
+            if limit:
+                message_ids = message_ids[-limit:]
+
+            use_uid = uids is not None
+            duplicates = []
+            if dedup and save_to_file:
+                message_ids, duplicates = await self.skip_duplicates(message_ids, folder, dedup, use_uid)
+
+            if save_to_file:
+                os.makedirs(output_dir, exist_ok=True)
+                if save_attachments and store is None:
+                    store = own_store = await asyncio.to_thread(AttachmentStore, os.path.join(output_dir, "attachments"))
+                if archive is None and archive_format != "json":
+                    archive = own_archive = await asyncio.to_thread(ArchiveWriter, os.path.join(output_dir, "archive"), archive_format)
+                if save_summary:
+                    summary = await asyncio.to_thread(SummaryWriter, output_dir, folder, save_attachments, append_summary)
+                    for duplicate in duplicates:
+                        summary.add(duplicate)
+            if not (save_to_file and save_attachments):
+                store = None
+            if store is not None and store.metrics is None:
+                store.metrics = self.metrics
+
+            print(f"Retrieving {len(message_ids)} messages...")
+
+            i = start_index
+            retrieved = 0
+            total_attachments = 0
+            started = time.perf_counter()
+            async for msg_id, raw_email in self.fetch_messages(message_ids, batch_size, use_uid=use_uid):
+                try:
+                    email_data = await asyncio.to_thread(self.client.process_message, i, msg_id, raw_email, folder, output_dir,
+                                                         save_to_file=save_to_file, streaming=streaming, store=store, archive=archive,
+                                                         search_index=search_index, use_uid=use_uid, dedup=dedup)
+                    if i % 10 == 0:
+                        print(self.metrics.progress_line(i - start_index + 1, len(message_ids), started))
+                except Exception as e:
+                    print(f"Error processing message {i}: {e}")
+                    self.metrics.inc("errors_total", stage="parse")
+                    continue
+                finally:
+                    i += 1
+                retrieved += 1
+                total_attachments += len(email_data['content']['attachments'])
+                if summary:
+                    summary.add(email_data)
+                yield email_data
+
+            print(f"Successfully retrieved {retrieved} emails")
+            if total_attachments > 0:
+                print(f"Downloaded {total_attachments} attachments")
+            if summary:
+                print(f"Emails saved to {output_dir} directory")
+                print(f"Summary saved to {summary.summary_file}")
+
+        except Exception as e:
+            print(f"Error retrieving emails: {e}")
+
+        finally:
+            if search_index:
+                await asyncio.to_thread(search_index.commit)
+            if dedup:
+                await asyncio.to_thread(dedup.commit)
+            if summary:
+                await asyncio.to_thread(summary.close)
+            if own_store:
+                own_store.close()
+            if own_archive:
+                own_archive.close()
+
+    async def disconnect(self):
+        """Disconnect from server"""
+        if self.connection:
+            try:
+                if self.selected_folder:
+                    await self.command(b"CLOSE")
+                await self.command(b"LOGOUT")
+            except Exception:
+                pass
+            await self.close_transport()
+            print("Disconnected from Yahoo IMAP server")
+
+    async def close_transport(self):
+        if self.reader_task:
+            self.reader_task.cancel()
+            try:
+                await self.reader_task
+            except asyncio.CancelledError:
+                pass
+        if self.writer:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except Exception:
+                pass
+        self.connection = self.writer = self.reader = self.reader_task = None
+        self.selected_folder = None
+
+
+async def archive_accounts(accounts, output_dir, folders=None, max_concurrent=50, pipeline_depth=4, **options):
+    """Archive many accounts from one event loop
+
+    accounts is a list of (username, password) pairs. Each account uses
+    one AsyncYahooEmailRetriever connection and is written to
+    output_dir/<username>/<folder>; at most max_concurrent accounts are
+    connected at once. folders defaults to every folder of the account and
+    options are passed on to retrieve_emails(). Returns a dict of
+    username -> {folder: number of emails}, or None for accounts that
+    failed to connect.
+    """
+    semaphore = asyncio.Semaphore(max_concurrent)
+
+    async def archive_account(username, password):
+        async with semaphore:
+            retriever = AsyncYahooEmailRetriever(pipeline_depth)
+            if not await retriever.connect(username, password):
+                return None
+            try:
+                counts = {}
+                for folder in folders or await retriever.list_folders():
+                    counts[folder] = 0
+                    async for _ in retriever.iter_emails(
+                        folder=folder,
+                        output_dir=os.path.join(output_dir, username, retriever.client.folder_dir_name(folder)),
+                        **options
+                    ):
+                        counts[folder] += 1
+                return counts
+            finally:
+                await retriever.disconnect()
+
+    results = await asyncio.gather(*(archive_account(username, password) for username, password in accounts))
+    return {username: counts for (username, _), counts in zip(accounts, results)}
+
+
+class BatchRunner:
+    """Unattended download of many accounts driven by a JSON config file
+
+    Accounts run concurrently on the asyncio backend, limited to
+    max_connections open connections and max_bytes_per_second in total,
+    and a report with the outcome of every account is written at the end,
+    together with the Metrics of the whole run. Each account entry is
+    merged over "defaults"; see the README for the keys.
+    """
+
+    def __init__(self, config):
+        if not isinstance(config.get('accounts'), list) or not config['accounts']:
+            raise ValueError("Config needs a non-empty \"accounts\" list")
+        self.config = config
+        self.output_dir = config.get('output_dir') or f"yahoo_emails_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        self.report_file = config.get('report') or os.path.join(self.output_dir, BATCH_REPORT_FILE)
+        unknown = [name for name in config.get('postprocess', []) if name not in ATTACHMENT_PLUGINS]
+        if unknown:
+            raise ValueError(f"Unknown postprocess plugin(s): {', '.join(unknown)}")
+        self.metrics = Metrics()
+        self.results = []
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def account_password(self, settings):
+        """Password from "password", "password_env" or "password_file" """
+        if settings.get('password'):
+            return settings['password']
+        if settings.get('password_env'):
+            password = os.environ.get(settings['password_env'])
+            if not password:
+                raise ValueError(f"Environment variable {settings['password_env']} is not set")
+            return password
+        if settings.get('password_file'):
+            with open(os.path.expanduser(settings['password_file']), 'r', encoding='utf-8') as f:
+                return f.read().strip()
+        raise ValueError("No password, password_env or password_file given")
+
+    def account_criteria(self, retriever, filters):
+        """Turn a "filters" dict (same names as the command line flags) into SEARCH criteria"""
+        since = filters.get('since')
+        if filters.get('last_days'):
+            since = datetime.now() - timedelta(days=filters['last_days'])
+        return retriever.client.build_search_criteria(
+            since=since,
+            before=filters.get('before'),
+            sender=filters.get('from'),
+            subject=filters.get('subject'),
+            unseen=filters.get('unseen', False),
+            flagged=filters.get('flagged', False),
+            min_size=filters.get('min_size'),
+            max_size=filters.get('max_size')
+        )
+
+    async def archive_account(self, account):
+        """Download one account and return its report entry"""
+        settings = {**self.config.get('defaults', {}), **account}
+        result = {'username': settings.get('username'), 'status': "ok", 'error': None, 'folders': {}, 'messages': 0, 'attachments': 0,
+                  'bytes': 0, 'seconds': 0}
+        retriever = None
+        started = time.time()
+        try:
+            username = settings['username']
+            password = self.account_password(settings)
+            archive_format = settings.get('archive_format', "json")
+            if archive_format != "json" and archive_format not in ARCHIVE_FORMATS:
+                raise ValueError(f"Unknown archive_format {archive_format}")
+            parse_mode = settings.get('parse_mode', "full")
+            if parse_mode not in PARSE_MODES:
+                raise ValueError(f"Unknown parse_mode {parse_mode}")
+            email_policy = settings.get('email_policy', "compat32")
+            if email_policy not in EMAIL_POLICIES:
+                raise ValueError(f"Unknown email_policy {email_policy}")
+            output_dir = settings.get('output_dir') or os.path.join(self.output_dir, username)
+
+            controller = None
+            if settings.get('adaptive') or settings.get('account_bytes_per_second'):
+                rate = settings.get('account_bytes_per_second')
+                controller = AdaptiveFetchController(settings.get('batch_size', 100), max_in_flight=settings.get('pipeline_depth', 4),
+                                                     bucket=TokenBucket(rate) if rate else None, metrics=self.metrics)
+
+            async with self.connections:
+                started = time.time()
+                retriever = AsyncYahooEmailRetriever(
+                    settings.get('pipeline_depth', 4),
+                    imap_server=settings.get('server', "imap.mail.yahoo.com"),
+                    imap_port=settings.get('port', 993),
+                    use_ssl=settings.get('ssl', True),
+                    throttle=self.throttle,
+                    metrics=self.metrics,
+                    parse_mode=parse_mode,
+                    email_policy=email_policy,
+                    controller=controller,
+                    postprocessor=self.postprocessor
+                )
+                if not await retriever.connect(username, password):
+                    result['status'] = "login failed"
+                    result['seconds'] = round(time.time() - started, 2)
+                    return result
+                try:
+                    criteria = self.account_criteria(retriever, settings.get('filters', {}))
+                    folders = settings.get('folders', ["INBOX"])
+                    if folders == "all":
+                        folders = await retriever.list_folders()
+                    for folder in folders:
+                        messages = attachments = 0
+                        async for email_data in retriever.iter_emails(
+                            folder=folder,
+                            limit=settings.get('limit'),
+                            output_dir=os.path.join(output_dir, retriever.client.folder_dir_name(folder)),
+                            save_attachments=settings.get('save_attachments', True),
+                            batch_size=settings.get('batch_size', 100),
+                            streaming=settings.get('streaming', True),
+                            criteria=criteria,
+                            archive_format=archive_format,
+                            search_index=self.search_index,
+                            dedup=self.dedup
+                        ):
+                            messages += 1
+                            attachments += len(email_data['content']['attachments'])
+                        if not retriever.connection or retriever.reader_task.done():
+                            raise ConnectionError(f"Connection lost while downloading {folder}")
+                        result['folders'][folder] = {'messages': messages, 'attachments': attachments}
+                        result['messages'] += messages
+                        result['attachments'] += attachments
+                finally:
+                    result['bytes'] = retriever.bytes_received
+                    if controller:
+                        result['throttled'] = controller.throttles
+                        result['batch_size'] = controller.batch_size
+                    await retriever.disconnect()
+        except Exception as e:
+            result['status'] = "error"
+            result['error'] = str(e)
+        result['seconds'] = round(time.time() - started, 2)
+        return result
+
+    async def run(self):
+        """Download every account and write the report; returns the report entries"""
+        rate = self.config.get('max_bytes_per_second')
+        self.connections = asyncio.Semaphore(self.config.get('max_connections', 10))
+        self.throttle = TokenBucket(rate) if rate else None
+        self.search_index = MailSearchIndex(self.config['search_index']) if self.config.get('search_index') else None
+        self.dedup = DedupIndex(self.config['dedup_index']) if self.config.get('dedup_index') else None
+        self.postprocessor = None
+        if self.config.get('postprocess'):
+            self.postprocessor = AttachmentPostProcessor.from_names(self.config['postprocess'], workers=self.config.get('postprocess_workers', 4),
+                                                                    processes=self.config.get('postprocess_processes', False),
+                                                                    metrics=self.metrics)
+        metrics_server = self.metrics.serve(self.config['metrics_port']) if self.config.get('metrics_port') else None
+        started = datetime.now()
+        try:
+            self.results = await asyncio.gather(*(self.archive_account(account) for account in self.config['accounts']))
+        finally:
+            if self.search_index:
+                self.search_index.close()
+            if self.dedup:
+                self.dedup.close()
+            if self.postprocessor:
+                self.postprocessor.close()
+            if metrics_server:
+                metrics_server.shutdown()
+        self.write_report(started)
+        return self.results
+
+    def write_report(self, started):
+        """Write the per-account results as JSON and print a short table"""
+        finished = datetime.now()
+        report = {
+            'started': started.isoformat(timespec='seconds'),
+            'finished': finished.isoformat(timespec='seconds'),
+            'seconds': round((finished - started).total_seconds(), 2),
+            'accounts_ok': sum(result['status'] == "ok" for result in self.results),
+            'accounts_failed': sum(result['status'] != "ok" for result in self.results),
+            'messages': sum(result['messages'] for result in self.results),
+            'bytes': sum(result['bytes'] for result in self.results),
+            'accounts': self.results
+        }
+        os.makedirs(os.path.dirname(self.report_file) or ".", exist_ok=True)
+        with open(self.report_file, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+        print(f"\n{'account':40} {'status':14} {'messages':>9} {'MB':>9} {'seconds':>8}")
+        for result in self.results:
+            print(f"{str(result['username']):40} {result['status']:14} {result['messages']:>9} {result['bytes'] / 1e6:>9.1f} "
+                  f"{result['seconds']:>8}")
+        print(f"Report saved to {self.report_file}")
+        print(f"Metrics saved to {self.metrics.write_json(os.path.join(os.path.dirname(self.report_file), METRICS_FILE))}")
+        if self.config.get('metrics_file'):
+            self.metrics.write_prometheus(self.config['metrics_file'])
+        return self.report_file
@@ -0,0 +1,2155 @@
+'''
+The IMAP client behind every download: connecting, SEARCH, batched and
+partial FETCH, MIME parsing, and saving messages with their attachments.
+'''
+
+import email
+import binascii
+import fnmatch
+import imaplib
+import io
+import os
+import re
+import json
+import queue
+import random
+import select
+import ssl
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+from datetime import datetime
+from email.parser import BytesHeaderParser
+
+from .archive import ArchiveWriter, SummaryWriter
+from .journal import FLAGS_FILE, SYNC_STATE_FILE, DownloadJournal
+from .metrics import Metrics
+from .mime import TransferDecoder, decode_encoded_words, decode_header_value, load_email_policy, resolve_codec
+from .pacing import (IDLE_RESPONSE_TIMEOUT, IDLE_TIMEOUT, POLL_INTERVAL, RECONNECT_BASE_DELAY, RECONNECT_MAX_DELAY, RECONNECT_MAX_RETRIES,
+                     AdaptiveFetchController)
+from .plugins import AttachmentPostProcessor
+from .store import AttachmentStore, DeferredRefStore
+
+# Batch size of the Message-ID pre-fetch used for deduplication
+DEDUP_HEADER_BATCH_SIZE = 500
+# Header fields fetched for the duplicate check and the summary stub of a skipped message
+DEDUP_HEADER_FIELDS = "MESSAGE-ID SUBJECT FROM DATE"
+
+# Read/decode buffer for streaming MIME extraction
+STREAM_BUFFER_SIZE = 64 * 1024
+
+# Range size for BODY[section]<offset.length> fetches of big parts
+PARTIAL_CHUNK_SIZE = 1024 * 1024
+
+# Headers fetched by iter_partial() in place of the full message
+PARTIAL_HEADER_FIELDS = "SUBJECT FROM TO CC DATE MESSAGE-ID"
+
+# Month names for IMAP SEARCH dates (not locale dependent)
+IMAP_MONTHS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+
+class YahooEmailRetriever:
+    # sync_state.json is shared by the folders synced from several threads (SyncDaemon)
+    sync_state_lock = threading.Lock()
+
+    def __init__(self, imap_server="imap.mail.yahoo.com", imap_port=993, use_ssl=True, *, metrics=None, parse_mode="full",
+                 email_policy="compat32", postprocessor=None, controller=None):
+        self.imap_server = imap_server
+        self.imap_port = imap_port
+        self.use_ssl = use_ssl
+        self.metrics = metrics or Metrics()
+        # See PARSE_MODES and EMAIL_POLICIES
+        self.parse_mode = parse_mode
+        self.email_policy = email_policy
+        # AttachmentPostProcessor, or None to save attachments as they are
+        self.postprocessor = postprocessor
+        # AdaptiveFetchController shared by the account's connections, or None for fixed batch sizes
+        self.controller = controller
+        self.credentials = None
+        self.connection = None
+        self.selected_folder = None
+        self.selected_count = 0
+        self.selected_uidvalidity = None
+        self.idle_count = 0
+    
+    def connect(self, username, password):
+        """Connect to Yahoo IMAP server"""
+        try:
+            if self.use_ssl:
+                self.connection = imaplib.IMAP4_SSL(self.imap_server, self.imap_port)
+            else:
+                self.connection = imaplib.IMAP4(self.imap_server, self.imap_port)
+            with self.metrics.timer("imap_command_seconds", command="LOGIN"):
+                self.connection.login(username, password)
+            self.credentials = (username, password)
+            self.selected_folder = None
+            print("Successfully connected to Yahoo IMAP server")
+            return True
+        except imaplib.IMAP4.error as e:
+            print(f"IMAP Error: {e}")
+            return False
+        except Exception as e:
+            print(f"Connection error: {e}")
+            return False
+    
+    def list_folders(self):
+        """List all available folders/mailboxes"""
+        if not self.connection:
+            print("Not connected to server")
+            return []
+        
+        try:
+            status, folders = self.connection.list()
+            folder_list = []
+            if status == 'OK':
+                for folder in folders:
+                    folder_name = folder.decode().split('"')[-2]
+                    folder_list.append(folder_name)
+            return folder_list
+        except Exception as e:
+            print(f"Error listing folders: {e}")
+            return []
+    
+    def decode_mime_words(self, s):
+        """Decode MIME encoded words in headers (see decode_header_value)"""
+        if s is None:
+            return ""
+        if isinstance(s, str):
+            return decode_header_value(s)
+        # Header objects (headers with raw 8-bit bytes) are not hashable
+        return decode_encoded_words(s)
+    
+    def get_email_content(self, msg, email_id=None, attachments_dir=None, store=None, ref=None):
+        """Extract email content from message object
+
+        Attachments are saved to store (an AttachmentStore, created at
+        attachments_dir if only that is given) and referenced by ref, which
+        defaults to email_id.
+        """
+        if store is None and attachments_dir:
+            store = AttachmentStore(attachments_dir)
+        ref = ref or email_id
+        content = {
+            'text': '',
+            'html': '',
+            'attachments': []
+        }
+        
+        if msg.is_multipart():
+            for part in msg.walk():
+                content_type = part.get_content_type()
+                content_disposition = str(part.get("Content-Disposition"))
+                
+                # Skip multipart containers
+                if content_type.startswith('multipart/'):
+                    continue
+                
+                # Handle attachments
+                if "attachment" in content_disposition or part.get_filename():
+                    filename = part.get_filename()
+                    if filename:
+                        decoded_filename = self.decode_mime_words(filename)
+                        attachment_data = part.get_payload(decode=True)
+                        
+                        attachment_info = {
+                            'filename': decoded_filename,
+                            'content_type': content_type,
+                            'size': len(attachment_data) if attachment_data else 0,
+                            'saved_path': None
+                        }
+                        
+                        # Save attachment to the store if one was provided
+                        if store and attachment_data:
+                            try:
+                                sha256, attachment_path, stored = store.put(attachment_data, ref=ref)
+                                
+                                attachment_info['sha256'] = sha256
+                                attachment_info['saved_path'] = attachment_path
+                                if stored:
+                                    print(f"  Saved attachment: {decoded_filename} ({len(attachment_data)} bytes)")
+                                else:
+                                    print(f"  Attachment already stored: {decoded_filename} ({len(attachment_data)} bytes)")
+                                
+                            except Exception as e:
+                                print(f"  Error saving attachment {decoded_filename}: {e}")
+                        
+                        if self.postprocessor and attachment_data:
+                            self.postprocessor.submit(attachment_info, attachment_data)
+                        content['attachments'].append(attachment_info)
+                    continue
+                
+                # Get email body
+                try:
+                    body = part.get_payload(decode=True)
+                    if body:
+                        charset = resolve_codec(part.get_content_charset()) or 'utf-8'
+                        body_text = body.decode(charset, errors='ignore')
+                        
+                        if content_type == "text/plain":
+                            content['text'] = body_text
+                        elif content_type == "text/html":
+                            content['html'] = body_text
+                except Exception as e:
+                    print(f"Error decoding email part: {e}")
+        else:
+            # Single part message
+            try:
+                body = msg.get_payload(decode=True)
+                if body:
+                    charset = resolve_codec(msg.get_content_charset()) or 'utf-8'
+                    content['text'] = body.decode(charset, errors='ignore')
+            except Exception as e:
+                print(f"Error decoding single part message: {e}")
+        
+        return content
+
+    def extract_streaming(self, source, email_id=None, attachments_dir=None, store=None, ref=None, mode="full"):
+        """Extract headers and content from a raw message without building a message tree
+
+        source is the raw message as bytes or a binary file object. Parts are
+        read line by line and base64/quoted-printable attachments are decoded
+        in STREAM_BUFFER_SIZE chunks straight into their files, so no decoded
+        copy of an attachment is ever held in memory. Returns (headers,
+        content) where headers is a headers-only Message and content has the
+        same shape as get_email_content()'s result.
+
+        With mode "text" HTML is only decoded while no text/plain part has
+        been seen, attachments are only read when there is a store to save
+        them to, and without a store reading stops after the first
+        text/plain part.
+        """
+        if store is None and attachments_dir:
+            store = AttachmentStore(attachments_dir)
+        fp = io.BytesIO(source) if isinstance(source, (bytes, bytearray, memoryview)) else source
+        content = {
+            'text': '',
+            'html': '',
+            'attachments': []
+        }
+        headers = self.read_header_block(fp)
+        self.stream_entity(fp, headers, [], content, store, ref or email_id, top=True, mode=mode)
+        return headers, content
+
+    def read_header_block(self, fp):
+        """Read one MIME header block from fp and parse it into a headers-only Message"""
+        lines = []
+        while True:
+            line = fp.readline(STREAM_BUFFER_SIZE)
+            if not line or line in (b'\r\n', b'\n'):
+                break
+            lines.append(line)
+        return BytesHeaderParser(policy=load_email_policy(self.email_policy)).parsebytes(b''.join(lines))
+
+    def match_boundary(self, line, delimiters):
+        """Return (delimiter, is_close) if line is a boundary line of one of delimiters"""
+        if not line.startswith(b'--'):
+            return None
+        stripped = line.rstrip(b' \t\r\n')
+        for delimiter in reversed(delimiters):
+            if stripped == delimiter:
+                return delimiter, False
+            if stripped == delimiter + b'--':
+                return delimiter, True
+        return None
+
+    def stream_entity(self, fp, headers, delimiters, content, store, ref, top=False, mode="full"):
+        """Stream the body of the entity whose headers were just read
+
+        Returns the boundary match that ended the entity, or None at EOF
+        (or once mode "text" has what it needs).
+        """
+        if headers.get_content_maintype() == 'multipart' and headers.get_boundary():
+            delimiter = b'--' + headers.get_boundary().encode('ascii', errors='replace')
+            inner = delimiters + [delimiter]
+
+            # Skip the preamble
+            match = None
+            while match is None:
+                line = fp.readline(STREAM_BUFFER_SIZE)
+                if not line:
+                    return None
+                match = self.match_boundary(line, inner)
+
+            while match and match == (delimiter, False):
+                match = self.stream_entity(fp, self.read_header_block(fp), inner, content, store, ref, mode=mode)
+                if mode == "text" and not store and content['text']:
+                    return None
+
+            if match != (delimiter, True):
+                return match
+
+            # Skip the epilogue up to the enclosing boundary
+            while True:
+                line = fp.readline(STREAM_BUFFER_SIZE)
+                if not line:
+                    return None
+                match = self.match_boundary(line, delimiters)
+                if match:
+                    return match
+
+        if headers.get_content_type() == 'message/rfc822':
+            # Attached message: its headers and body follow directly
+            return self.stream_entity(fp, self.read_header_block(fp), delimiters, content, store, ref, mode=mode)
+
+        content_type = headers.get_content_type()
+        filename = headers.get_filename()
+        is_attachment = not top and ("attachment" in str(headers.get("Content-Disposition")) or filename)
+        decoded_filename = self.decode_mime_words(filename) if filename else None
+
+        # Pick where the decoded bytes go
+        sink = None
+        attachment_info = None
+        if is_attachment:
+            if decoded_filename and (mode == "full" or store):
+                attachment_info = {
+                    'filename': decoded_filename,
+                    'content_type': content_type,
+                    'size': 0,
+                    'saved_path': None
+                }
+                if store:
+                    try:
+                        sink = store.open_writer()
+                    except OSError as e:
+                        print(f"  Error saving attachment {decoded_filename}: {e}")
+        elif top or content_type == "text/plain" or (content_type == "text/html" and (mode == "full" or not content['text'])):
+            sink = io.BytesIO()
+        # Parts nobody reads are only scanned for the next boundary
+        scan_only = sink is None and attachment_info is None
+        # Decoded attachment bytes for the post-processor, dropped if they grow too big
+        captured = None
+        if attachment_info and self.postprocessor and self.postprocessor.wants(attachment_info):
+            captured = bytearray()
+
+        encoding = str(headers.get("Content-Transfer-Encoding", "7bit")).strip().lower()
+        size = 0
+        leftover = b''
+        newline = b''
+        match = None
+        try:
+            while True:
+                line = fp.readline(STREAM_BUFFER_SIZE)
+                if not line:
+                    break
+                match = self.match_boundary(line, delimiters)
+                if match:
+                    break
+
+                if scan_only:
+                    continue
+                body = line.rstrip(b'\r\n')
+                line_end = line[len(body):]
+                if encoding == 'base64':
+                    data = leftover + body.translate(None, b' \t')
+                    usable = len(data) - len(data) % 4
+                    leftover = data[usable:]
+                    chunk = binascii.a2b_base64(data[:usable]) if usable else b''
+                elif encoding == 'quoted-printable':
+                    if body.endswith(b'='):
+                        # Soft line break
+                        chunk = binascii.a2b_qp(newline + body[:-1])
+                        line_end = b''
+                    else:
+                        chunk = binascii.a2b_qp(newline + body)
+                    newline = line_end
+                else:
+                    # The line break before a boundary belongs to the boundary
+                    chunk = newline + body
+                    newline = line_end
+
+                size += len(chunk)
+                if sink and chunk:
+                    sink.write(chunk)
+                if captured is not None:
+                    captured += chunk
+                    if len(captured) > self.postprocessor.max_size:
+                        captured = None
+
+            if match is None and newline:
+                # Without a closing boundary the last line break is part of the body
+                size += len(newline)
+                if sink:
+                    sink.write(newline)
+                if captured is not None:
+                    captured += newline
+
+            if encoding == 'base64' and leftover and not scan_only:
+                try:
+                    chunk = binascii.a2b_base64(leftover + b'=' * (-len(leftover) % 4))
+                except binascii.Error:
+                    chunk = b''
+                size += len(chunk)
+                if sink and chunk:
+                    sink.write(chunk)
+                if captured is not None:
+                    captured += chunk
+        except Exception:
+            if attachment_info and sink:
+                sink.abort()
+            raise
+
+        if attachment_info:
+            attachment_info['size'] = size
+            if sink and size:
+                sha256, attachment_path, stored = sink.commit()
+                if ref:
+                    store.add_ref(sha256, size, ref)
+                attachment_info['sha256'] = sha256
+                attachment_info['saved_path'] = attachment_path
+                if stored:
+                    print(f"  Saved attachment: {decoded_filename} ({size} bytes)")
+                else:
+                    print(f"  Attachment already stored: {decoded_filename} ({size} bytes)")
+            elif sink:
+                sink.abort()
+            if captured:
+                self.postprocessor.submit(attachment_info, bytes(captured))
+            content['attachments'].append(attachment_info)
+        elif sink and size:
+            charset = resolve_codec(headers.get_content_charset()) or 'utf-8'
+            body_text = sink.getvalue().decode(charset, errors='ignore')
+            if top and headers.get_content_maintype() != 'multipart':
+                content['text'] = body_text
+            elif content_type == "text/plain":
+                content['text'] = body_text
+            elif content_type == "text/html":
+                content['html'] = body_text
+        return match
+    
+    def build_sequence_set(self, message_ids):
+        """Collapse message ids into a compact IMAP sequence set (e.g. 1:500,502)"""
+        numbers = [int(m) for m in message_ids]
+        ranges = []
+        for n in numbers:
+            if ranges and n == ranges[-1][1] + 1:
+                ranges[-1][1] = n
+            else:
+                ranges.append([n, n])
+        return ",".join(f"{a}:{b}" if a != b else str(a) for a, b in ranges)
+
+    def index_fetch_literals(self, msg_data, use_uid=False):
+        """Map message id (or UID) -> raw message from a FETCH response"""
+        # Responses are (b'<seq> (RFC822 {size}', raw_bytes) tuples separated by b')'
+        raw_by_id = {}
+        for item in msg_data:
+            if isinstance(item, tuple):
+                if use_uid:
+                    match = re.search(rb'UID (\d+)', item[0])
+                    if not match:
+                        continue
+                    key = match.group(1)
+                else:
+                    key = item[0].split(b' ', 1)[0]
+                raw_by_id[key] = item[1]
+        return raw_by_id
+
+    def fetch_messages(self, message_ids, batch_size=1, use_uid=False, failed=None):
+        """Fetch raw messages, batch_size messages per FETCH round trip
+
+        Yields (msg_id, raw_email) in the order of message_ids. With use_uid
+        the ids are UIDs and are fetched with UID FETCH. With a controller
+        the batch size comes from the controller, and a batch the server
+        refuses with a throttling code is fetched again (smaller) once the
+        controller's pause is over. The ids of messages that could not be
+        fetched (a refused batch, or missing from the response) are
+        appended to failed, when given, before any later message is yielded.
+        """
+        batch_size = max(1, batch_size or 1)
+        start = 0
+        retries = 0
+        while start < len(message_ids):
+            if self.controller:
+                batch_size = self.controller.batch_size
+            batch = message_ids[start:start + batch_size]
+            error = None
+            try:
+                with self.controller.slot() if self.controller else nullcontext():
+                    fetch_started = time.perf_counter()
+                    with self.metrics.timer("imap_command_seconds", command="FETCH"):
+                        if use_uid:
+                            status, msg_data = self.connection.uid('FETCH', self.build_sequence_set(batch), "(UID RFC822)")
+                        else:
+                            status, msg_data = self.connection.fetch(self.build_sequence_set(batch), "(RFC822)")
+                    seconds = time.perf_counter() - fetch_started
+            except imaplib.IMAP4.abort:
+                # BYE, or the server dropped the connection
+                if self.controller:
+                    self.controller.throttled("BYE")
+                raise
+            except imaplib.IMAP4.error as e:
+                status, msg_data, error = 'NO', [str(e)], e
+            if status != 'OK':
+                reason = AdaptiveFetchController.throttle_reason(msg_data)
+                if self.controller and reason and retries < RECONNECT_MAX_RETRIES:
+                    self.controller.throttled(reason, len(batch))
+                    retries += 1
+                    continue
+                print(f"Error fetching messages {start + 1}-{start + len(batch)}" + (f": {error}" if error else ""))
+                self.metrics.inc("errors_total", stage="fetch")
+                if failed is not None:
+                    failed.extend(msg_id if isinstance(msg_id, bytes) else str(msg_id).encode() for msg_id in batch)
+                start += len(batch)
+                continue
+            start += len(batch)
+            retries = 0
+
+            raw_by_id = self.index_fetch_literals(msg_data, use_uid)
+            received = sum(len(raw) for raw in raw_by_id.values())
+            self.metrics.inc("bytes_received_total", received)
+            if self.controller:
+                self.controller.record(len(batch), received, seconds)
+                if self.controller.bucket:
+                    self.controller.bucket.wait(received)
+            for msg_id in batch:
+                msg_id = msg_id if isinstance(msg_id, bytes) else str(msg_id).encode()
+                raw_email = raw_by_id.pop(msg_id, None)
+                if raw_email is None:
+                    print(f"Message {msg_id.decode()} missing from FETCH response")
+                    if failed is not None:
+                        failed.append(msg_id)
+                    continue
+                yield msg_id, raw_email
+
+    def select_folder(self, folder, reuse=False):
+        """SELECT a folder and return its message count (None on error)
+
+        With reuse, a folder that is already selected on this connection is
+        not selected again.
+        """
+        if reuse and self.selected_folder == folder:
+            return self.selected_count
+
+        with self.metrics.timer("imap_command_seconds", command="SELECT"):
+            status, messages = self.connection.select(folder)
+        if status != 'OK':
+            self.selected_folder = None
+            return None
+        self.selected_folder = folder
+        self.selected_count = int(messages[0])
+        uidvalidity = self.connection.response('UIDVALIDITY')[1]
+        self.selected_uidvalidity = int(uidvalidity[0]) if uidvalidity and uidvalidity[0] else None
+        return self.selected_count
+
+    def build_search_criteria(self, since=None, before=None, sender=None, subject=None, unseen=False, flagged=False,
+                              min_size=None, max_size=None):
+        """Compile filters into IMAP SEARCH criteria so the server does the filtering
+
+        since/before are dates (or YYYY-MM-DD strings), sender and subject
+        are substrings, min_size/max_size are inclusive byte sizes. Returns
+        a list of criteria for search_messages(); an empty list means ALL.
+        """
+        criteria = []
+        text_values = []
+        for key, value in (('SINCE', since), ('BEFORE', before)):
+            if value:
+                if isinstance(value, str):
+                    value = datetime.strptime(value, "%Y-%m-%d")
+                criteria += [key, f"{value.day:02d}-{IMAP_MONTHS[value.month - 1]}-{value.year}"]
+        for key, value in (('FROM', sender), ('SUBJECT', subject)):
+            if value:
+                text_values.append((key, value))
+        if unseen:
+            criteria.append('UNSEEN')
+        if flagged:
+            criteria.append('FLAGGED')
+        if min_size:
+            criteria += ['LARGER', str(int(min_size) - 1)]
+        if max_size:
+            criteria += ['SMALLER', str(int(max_size) + 1)]
+
+        # Non-ASCII text has to go last, as a UTF-8 literal
+        text_values.sort(key=lambda item: not item[1].isascii())
+        if sum(not value.isascii() for _, value in text_values) > 1:
+            raise ValueError("Only one non-ASCII search value is supported")
+        for key, value in text_values:
+            if value.isascii():
+                criteria += [key, '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"']
+            else:
+                criteria += [key, value.encode('utf-8')]
+        return criteria
+
+    def search_messages(self, criteria=None, use_uid=False):
+        """Run SEARCH (or UID SEARCH) on the selected folder
+
+        criteria is a list from build_search_criteria() (plus any raw
+        criteria such as 'UID 10:*'); a bytes item is sent as a UTF-8
+        literal. Returns the matching ids as a list of bytes, or None on
+        error.
+        """
+        criteria = list(criteria or [])
+        charset = None
+        if criteria and isinstance(criteria[-1], bytes):
+            charset = 'UTF-8'
+            self.connection.literal = criteria.pop()
+        if not criteria:
+            criteria = ["ALL"]
+
+        with self.metrics.timer("imap_command_seconds", command="SEARCH"):
+            if use_uid:
+                status, data = self.connection.uid('SEARCH', *(['CHARSET', charset] if charset else []), *criteria)
+            else:
+                status, data = self.connection.search(charset, *criteria)
+        if status != 'OK':
+            return None
+        return data[0].split()
+
+    def retrieve_emails(self, folder="INBOX", limit=None, **options):
+        """Retrieve emails from specified folder and return them as a list
+
+        See iter_emails() for the options; that is the version to use
+        for big folders, since this keeps every email in memory.
+        """
+        return list(self.iter_emails(folder, limit, **options))
+
+    def iter_emails(self, folder="INBOX", limit=None, *, save_to_file=True, output_dir="emails", save_attachments=True, batch_size=1,
+                    uids=None, start_index=1, append_summary=False, save_summary=True, streaming=False, store=None,
+                    criteria=None, archive_format="json", archive=None, search_index=None, workers=0, journal=None, dedup=None):
+        """Retrieve emails from specified folder, yielding each email_data dict once it is saved
+
+        Everything after limit is keyword-only. Nothing is kept after it has been yielded and the summary is
+        written incrementally (see SummaryWriter), so memory use does not
+        grow with the folder; the summary file is complete once the
+        generator is exhausted or closed.
+
+        When uids is given only those UIDs are fetched (with UID FETCH) and
+        each email's id is its UID. start_index numbers the saved files and
+        append_summary merges the new emails into an existing summary file.
+        streaming parses with extract_streaming() so attachments are decoded
+        straight to disk instead of through a full message tree. Attachments
+        go to store, an AttachmentStore that defaults to output_dir/attachments.
+        criteria (see build_search_criteria) limits the messages on the server.
+        Any archive_format other than "json" appends the messages to an
+        ArchiveWriter in output_dir/archive (or to archive) instead of
+        writing one JSON file per message. Each saved email is also added to
+        search_index (a MailSearchIndex) when one is given. Timings, sizes
+        and errors are recorded in self.metrics. With workers,
+        messages go through iter_staged() and are parsed in that many
+        processes while the next ones are fetched and earlier ones written.
+        journal (a DownloadJournal) gets a commit for every message handled
+        when fetching by UID. With dedup (a DedupIndex), messages whose
+        Message-ID was already downloaded are skipped before their bodies
+        are fetched (see skip_duplicates) and are not yielded; the summary
+        lists them with a 'duplicate_of' key, like the duplicates found
+        when saving (see save_email).
+        If the connection drops, the generator ends after the emails saved so far.
+        """
+        if not self.connection:
+            print("Not connected to server")
+            return
+        
+        own_store = None
+        own_archive = None
+        summary = None
+        try:
+            # Select folder (an explicit UID list does not need a fresh message count)
+            num_messages = self.select_folder(folder, reuse=uids is not None)
+            if num_messages is None:
+                print(f"Error selecting folder {folder}")
+                return
+            
+            # Get message count
+            print(f"Found {num_messages} messages in {folder}")
+            
+            if uids is not None:
+                message_ids = [str(uid).encode() for uid in uids]
+            else:
+                # Search for matching messages on the server
+                message_ids = self.search_messages(criteria)
+                if message_ids is None:
+                    print("Error searching for messages")
+                    return
+
+            if limit:
+                message_ids = message_ids[-limit:]  # Get most recent messages
+
+            use_uid = uids is not None
+            duplicates = []
+            if dedup and save_to_file:
+                message_ids, duplicates = self.skip_duplicates(message_ids, folder, dedup, use_uid, journal)
+            
+            # Create output directory if saving to files
+            if save_to_file:
+                os.makedirs(output_dir, exist_ok=True)
+                
+                # Open the attachment store if saving attachments
+                if save_attachments and store is None:
+                    store = own_store = AttachmentStore(os.path.join(output_dir, "attachments"))
+                # Open the archive unless writing one JSON file per message
+                if archive is None and archive_format != "json":
+                    archive = own_archive = ArchiveWriter(os.path.join(output_dir, "archive"), archive_format)
+                if save_summary:
+                    summary = SummaryWriter(output_dir, folder, save_attachments, append=append_summary)
+                    for duplicate in duplicates:
+                        summary.add(duplicate)
+            if not (save_to_file and save_attachments):
+                store = None
+            if store is not None and store.metrics is None:
+                store.metrics = self.metrics
+            
+            print(f"Retrieving {len(message_ids)} messages...")
+            
+            retrieved = 0
+            total_attachments = 0
+            started = time.perf_counter()
+            if workers:
+                emails = self.iter_staged(message_ids, folder, output_dir, save_to_file=save_to_file, streaming=streaming, store=store,
+                                          archive=archive, search_index=search_index, use_uid=use_uid, batch_size=batch_size,
+                                          start_index=start_index, workers=workers, journal=journal, dedup=dedup)
+            else:
+                emails = self.iter_fetched(message_ids, folder, output_dir, save_to_file=save_to_file, streaming=streaming, store=store,
+                                           archive=archive, search_index=search_index, use_uid=use_uid, batch_size=batch_size,
+                                           start_index=start_index, journal=journal, dedup=dedup, started=started)
+            for email_data in emails:
+                retrieved += 1
+                total_attachments += len(email_data['content']['attachments'])
+                if summary:
+                    summary.add(email_data)
+                yield email_data
+            
+            print(f"Successfully retrieved {retrieved} emails")
+            if total_attachments > 0:
+                print(f"Downloaded {total_attachments} attachments")
+            if summary:
+                print(f"Emails saved to {output_dir} directory")
+                if save_attachments and total_attachments > 0:
+                    print(f"Attachments saved to {store.root} directory")
+                print(f"Summary saved to {summary.summary_file}")
+            
+        except Exception as e:
+            print(f"Error retrieving emails: {e}")
+
+        finally:
+            if search_index:
+                search_index.commit()
+            if dedup:
+                dedup.commit()
+            if summary:
+                summary.close()
+            if own_store:
+                own_store.close()
+            if own_archive:
+                own_archive.close()
+
+    def iter_fetched(self, message_ids, folder, output_dir, *, save_to_file=True, streaming=False, store=None, archive=None,
+                     search_index=None, use_uid=False, batch_size=1, start_index=1, journal=None, dedup=None, started=None):
+        """The in-process fetch/parse/save loop of iter_emails(), yielding each saved email"""
+        started = started or time.perf_counter()
+        saved = 0
+        failed = deque() if journal and use_uid else None
+        try:
+            for i, (msg_id, raw_email) in enumerate(self.fetch_messages(message_ids, batch_size, use_uid=use_uid, failed=failed),
+                                                    start_index):
+                self.record_missing(journal, failed)
+                try:
+                    email_data = self.process_message(i, msg_id, raw_email, folder, output_dir, save_to_file=save_to_file,
+                                                      streaming=streaming, store=store, archive=archive, search_index=search_index,
+                                                      use_uid=use_uid, dedup=dedup)
+                    if journal and use_uid:
+                        journal.commit(msg_id, i)
+
+                    if i % 10 == 0:
+                        print(self.metrics.progress_line(i - start_index + 1, len(message_ids), started))
+
+                except Exception as e:
+                    print(f"Error processing message {i}: {e}")
+                    self.metrics.inc("errors_total", stage="parse")
+                    if journal and use_uid:
+                        journal.commit(msg_id, i, error=str(e))
+                    continue
+                saved += 1
+                yield email_data
+        except (imaplib.IMAP4.abort, OSError) as e:
+            print(f"Connection lost after {saved} messages: {e}")
+            self.metrics.inc("errors_total", stage="connection")
+        finally:
+            self.record_missing(journal, failed)
+
+    def record_missing(self, journal, failed):
+        """Move the ids fetch_messages() could not fetch from failed into journal (see DownloadJournal.miss)"""
+        while failed:
+            journal.miss(failed.popleft())
+
+    def process_message(self, i, msg_id, raw_email, folder, output_dir, *, save_to_file=True, streaming=False, store=None, archive=None,
+                        search_index=None, use_uid=False, dedup=None):
+        """Parse one fetched message, save it and return its email_data dict
+
+        i numbers the saved file; the other arguments are as for
+        retrieve_emails().
+        """
+        filepath = self.message_location(i, msg_id, output_dir, archive)
+        # Attachment refs are recorded once save_email() has decided the message is not a duplicate
+        deferred = DeferredRefStore(store.root) if store is not None else None
+        if deferred:
+            deferred.metrics = store.metrics
+        email_data = self.parse_message(i, msg_id, raw_email, streaming=streaming, store=deferred, ref=filepath, use_uid=use_uid)
+        self.save_email(email_data, raw_email, filepath, folder, save_to_file=save_to_file, archive=archive, search_index=search_index,
+                        dedup=dedup)
+        self.record_refs(store, email_data, deferred.refs if deferred else [])
+        return email_data
+
+    def record_refs(self, store, email_data, refs):
+        """Record the attachment refs of a saved email in store
+
+        A duplicate (see save_email) was not written, so it keeps none;
+        its blobs are the saved copy's, or unreferenced until gc().
+        """
+        if store is not None and 'duplicate_of' not in email_data:
+            for sha256, size, ref in refs:
+                store.add_ref(sha256, size, ref)
+
+    def retrieve_resumable(self, folder="INBOX", output_dir="emails", **options):
+        """iter_resumable() collected into a list"""
+        return list(self.iter_resumable(folder, output_dir, **options))
+
+    def iter_resumable(self, folder="INBOX", output_dir="emails", *, limit=None, save_attachments=True, batch_size=100, streaming=False,
+                       criteria=None, archive_format="json", search_index=None, workers=0, max_retries=RECONNECT_MAX_RETRIES,
+                       dedup=None):
+        """Download a folder with a DownloadJournal so it survives connection drops
+
+        Every saved message is checkpointed. When the connection drops the
+        retriever reconnects with exponential backoff, re-SELECTs the
+        folder and carries on after the last committed UID, fetching the
+        messages the server refused before (the journal's missing list)
+        first; the download is reported incomplete while any are left. If output_dir
+        already holds a journal, that download is resumed with its
+        original folder and options (the arguments are ignored apart from
+        search_index, workers, max_retries and dedup). Yields the emails
+        downloaded by this call as they are saved (see iter_emails).
+        """
+        journal = DownloadJournal(output_dir)
+        if journal.state:
+            options = journal.state['options']
+            folder = journal.state['folder']
+            limit, save_attachments, batch_size = options['limit'], options['save_attachments'], options['batch_size']
+            streaming, archive_format = options['streaming'], options['archive_format']
+            criteria = [c if isinstance(c, str) else c['utf8'].encode('utf-8') for c in options['criteria']]
+            print(f"Resuming {folder} after UID {journal.last_uid} ({journal.state.get('saved', 0)} messages saved"
+                  + (f", {len(journal.missing)} to fetch again)" if journal.missing else ")"))
+        else:
+            options = {
+                'limit': limit,
+                'save_attachments': save_attachments,
+                'batch_size': batch_size,
+                'streaming': streaming,
+                'archive_format': archive_format,
+                'criteria': [c if isinstance(c, str) else {'utf8': c.decode('utf-8')} for c in criteria or []]
+            }
+
+        attempt = 0
+        try:
+            while True:
+                progress = journal.last_uid
+                try:
+                    if not self.is_alive() and not self.reconnect():
+                        raise ConnectionError("Reconnect failed")
+                    if self.select_folder(folder) is None:
+                        print(f"Error selecting folder {folder}")
+                        break
+                    if journal.state and journal.state['uidvalidity'] != self.selected_uidvalidity:
+                        print(f"UIDVALIDITY of {folder} changed since the download started; start a new download")
+                        break
+
+                    if not journal.state:
+                        uids = self.search_messages(criteria, use_uid=True)
+                        if uids is None:
+                            print(f"Error searching for messages in {folder}")
+                            break
+                        uids = sorted(int(uid) for uid in uids)
+                        if limit:
+                            uids = uids[-limit:]
+                        options['first_uid'] = uids[0] if uids else 0
+                        options['last_uid'] = uids[-1] if uids else 0
+                        journal.start(folder, self.selected_uidvalidity, options)
+
+                    first_uid = max(journal.state['options']['first_uid'], journal.last_uid + 1)
+                    last_uid = journal.state['options']['last_uid']
+                    pending = []
+                    if first_uid <= last_uid:
+                        # The range goes first: a non-ASCII criterion has to stay last (see search_messages)
+                        uids = self.search_messages(['UID', f"{first_uid}:{last_uid}"] + list(criteria or []), use_uid=True)
+                        if uids is None:
+                            print(f"Error searching for messages in {folder}")
+                            break
+                        # "n:m" also matches the highest UID when the range is empty
+                        pending = sorted(int(uid) for uid in uids if first_uid <= int(uid) <= last_uid)
+                    if journal.missing:
+                        uids = self.search_messages(['UID', self.build_sequence_set(journal.missing)], use_uid=True)
+                        if uids is None:
+                            print(f"Error searching for messages in {folder}")
+                            break
+                        found = {int(uid) for uid in uids} & set(journal.missing)
+                        journal.expunged(set(journal.missing) - found)
+                        pending = sorted(found) + pending
+                    if not pending:
+                        break
+
+                    yield from self.iter_emails(
+                        folder=folder,
+                        output_dir=output_dir,
+                        save_attachments=save_attachments,
+                        batch_size=batch_size,
+                        streaming=streaming,
+                        uids=pending,
+                        start_index=journal.next_index,
+                        append_summary=True,
+                        archive_format=archive_format,
+                        search_index=search_index,
+                        workers=workers,
+                        journal=journal,
+                        dedup=dedup
+                    )
+                    if self.is_alive():
+                        # Finished, or what is left cannot be fetched (e.g. expunged meanwhile)
+                        journal.commit_deferred()
+                        break
+                    raise ConnectionError("Connection lost")
+
+                except (imaplib.IMAP4.abort, OSError) as e:
+                    attempt = 1 if journal.last_uid > progress else attempt + 1
+                    self.metrics.inc("retries_total")
+                    if attempt > max_retries:
+                        print(f"Giving up after {max_retries} reconnect attempts: {e}")
+                        break
+                    delay = min(RECONNECT_MAX_DELAY, RECONNECT_BASE_DELAY * 2 ** (attempt - 1)) * random.uniform(0.5, 1)
+                    print(f"Connection problem ({e}); reconnecting in {delay:.1f}s (attempt {attempt}/{max_retries})")
+                    time.sleep(delay)
+        finally:
+            journal.close()
+
+        remaining = journal.state.get('options', {}).get('last_uid', 0) - journal.last_uid if journal.state else 0
+        print(f"{folder}: {journal.state.get('saved', 0)} messages saved in {output_dir}"
+              + (f", {journal.state['duplicates']} already downloaded before" if journal.state.get('duplicates') else "")
+              + (f", {len(journal.state['failed'])} could not be parsed" if journal.state.get('failed') else "")
+              + (f", {len(journal.missing)} could not be fetched" if journal.missing else ""))
+        if remaining > 0 or journal.missing:
+            print(f"Download incomplete; resume it with: --resume {output_dir}")
+
+    def is_alive(self):
+        """NOOP the connection to see whether it still works"""
+        try:
+            if self.connection is None:
+                return False
+            with self.metrics.timer("imap_command_seconds", command="NOOP"):
+                return self.connection.noop()[0] == 'OK'
+        except Exception:
+            return False
+
+    def reconnect(self):
+        """Log in again with the credentials of the last connect()"""
+        if self.connection:
+            try:
+                self.connection.shutdown()
+            except Exception:
+                pass
+            self.connection = None
+        if not self.credentials:
+            return False
+        return self.connect(*self.credentials)
+
+    def idle(self, timeout=IDLE_TIMEOUT, stop=None):
+        """Wait in IMAP IDLE (RFC 2177) until the selected folder reports new mail
+
+        Returns True when the server sent EXISTS and False when timeout
+        seconds passed or stop (a threading.Event) was set. imaplib has no
+        IDLE command, so it is written and its responses read on the
+        socket directly; imaplib's buffer is empty between commands.
+        """
+        sock = self.connection.socket()
+        buffer = bytearray()
+
+        def read_line(deadline, stop=None):
+            while b"\r\n" not in buffer:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or (stop and stop.is_set()):
+                    return None
+                # Decrypted bytes waiting in the TLS layer do not make the socket readable
+                pending = isinstance(sock, ssl.SSLSocket) and sock.pending()
+                if not pending and not select.select([sock], [], [], min(remaining, 1))[0]:
+                    continue
+                data = sock.recv(STREAM_BUFFER_SIZE)
+                if not data:
+                    raise imaplib.IMAP4.abort("connection closed during IDLE")
+                buffer.extend(data)
+            line, _, rest = bytes(buffer).partition(b"\r\n")
+            buffer[:] = rest
+            return line
+
+        self.idle_count += 1
+        tag = b"IDLE%d" % self.idle_count
+        self.connection.send(tag + b" IDLE\r\n")
+        new_mail = False
+        deadline = time.monotonic() + timeout
+        while True:
+            line = read_line(deadline, stop)
+            if line is None:
+                break
+            if line.startswith(tag + b" "):
+                raise imaplib.IMAP4.error(f"IDLE failed: {line.decode(errors='replace')}")
+            if line.startswith(b"* BYE"):
+                raise imaplib.IMAP4.abort(line.decode(errors='replace'))
+            if re.match(rb"\* \d+ EXISTS", line):
+                new_mail = True
+                break
+
+        self.connection.send(b"DONE\r\n")
+        while True:
+            line = read_line(time.monotonic() + IDLE_RESPONSE_TIMEOUT)
+            if line is None:
+                raise imaplib.IMAP4.abort("no response to IDLE DONE")
+            if line.startswith(tag + b" "):
+                if line.split()[1:2] != [b"OK"]:
+                    raise imaplib.IMAP4.error(f"IDLE failed: {line.decode(errors='replace')}")
+                return new_mail
+            if re.match(rb"\* \d+ EXISTS", line):
+                new_mail = True
+
+    def wait_for_mail(self, idle_timeout=IDLE_TIMEOUT, poll_interval=POLL_INTERVAL, stop=None):
+        """Block until the selected folder may have new mail
+
+        Uses IDLE when the server supports it, otherwise waits
+        poll_interval seconds and sends a NOOP. Returns True when the
+        message count changed (including changes reported since the folder
+        was selected) and False otherwise, so callers loop on it. Raises
+        imaplib.IMAP4.abort or OSError when the connection is gone.
+        """
+        # Mail that arrived while the folder was being synced
+        _, counts = self.connection.response('EXISTS')
+        if counts[-1] is not None and int(counts[-1]) != self.selected_count:
+            return True
+        if 'IDLE' in self.connection.capabilities:
+            return self.idle(idle_timeout, stop)
+
+        if stop is not None:
+            if stop.wait(poll_interval):
+                return False
+        else:
+            time.sleep(poll_interval)
+        with self.metrics.timer("imap_command_seconds", command="NOOP"):
+            status, _ = self.connection.noop()
+        if status != 'OK':
+            raise imaplib.IMAP4.abort("NOOP failed")
+        _, counts = self.connection.response('EXISTS')
+        return counts[-1] is not None
+
+    def iter_staged(self, message_ids, folder, output_dir, *, save_to_file=True, streaming=False, store=None, archive=None,
+                    search_index=None, use_uid=False, batch_size=1, start_index=1, workers=2, queue_size=None, journal=None,
+                    dedup=None):
+        """Staged version of the iter_emails() fetch/parse/save loop
+
+        A fetch thread fills a bounded queue from fetch_messages(), a
+        submit thread hands the messages to a pool of worker processes
+        that parse them (writing attachment blobs as they go), and the
+        generator itself saves the results and yields them in fetch order.
+        Every stage is bounded by queue_size messages, so a slow stage (or
+        a slow consumer) holds back the ones before it. Closing the
+        generator early stops the other stages.
+        """
+        # multiprocessing is slow to import and only needed here
+        from concurrent.futures import ProcessPoolExecutor
+        queue_size = queue_size or 4 * workers
+        fetched = queue.Queue(maxsize=queue_size)
+        parsed = queue.Queue(maxsize=queue_size)
+        stopping = threading.Event()
+        store_root = store.root if store else None
+        started = time.perf_counter()
+        # Filled by the fetch thread; a deque, as appends and pops from both ends are thread-safe
+        failed = deque() if journal and use_uid else None
+
+        def fetch_stage():
+            try:
+                for i, (msg_id, raw_email) in enumerate(self.fetch_messages(message_ids, batch_size, use_uid=use_uid, failed=failed),
+                                                        start_index):
+                    if stopping.is_set():
+                        break
+                    fetched.put((i, msg_id, raw_email))
+            except Exception as e:
+                print(f"Error fetching messages: {e}")
+                self.metrics.inc("errors_total", stage="connection")
+            finally:
+                fetched.put(None)
+
+        def submit_stage():
+            try:
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    in_flight = deque()
+                    while True:
+                        item = fetched.get()
+                        if item is None:
+                            break
+                        if stopping.is_set():
+                            # Drain so the fetch stage is not left blocked
+                            continue
+                        i, msg_id, raw_email = item
+                        filepath = self.message_location(i, msg_id, output_dir, archive)
+                        future = executor.submit(parse_message_worker, i, msg_id, raw_email, streaming=streaming, store_root=store_root,
+                                                 ref=filepath, use_uid=use_uid, parse_mode=self.parse_mode, email_policy=self.email_policy,
+                                                 postprocess=self.postprocessor.names if self.postprocessor else None)
+                        in_flight.append((i, msg_id, raw_email if archive or dedup else None, filepath, future))
+                        # Hand results to the writer in submission order; blocks when the writer falls behind
+                        while in_flight and (len(in_flight) >= queue_size or in_flight[0][4].done()):
+                            parsed.put(in_flight.popleft())
+                    while in_flight and not stopping.is_set():
+                        parsed.put(in_flight.popleft())
+            except Exception as e:
+                print(f"Error parsing messages: {e}")
+                self.metrics.inc("errors_total", stage="parse")
+            finally:
+                parsed.put(None)
+
+        fetcher = threading.Thread(target=fetch_stage, daemon=True)
+        submitter = threading.Thread(target=submit_stage, daemon=True)
+        fetcher.start()
+        submitter.start()
+        finished = False
+        try:
+            while True:
+                item = parsed.get()
+                if item is None:
+                    finished = True
+                    return
+                i, msg_id, raw_email, filepath, future = item
+                self.record_missing(journal, failed)
+                try:
+                    email_data, refs, worker_metrics = future.result()
+                    self.metrics.merge(worker_metrics)
+                    self.save_email(email_data, raw_email, filepath, folder, save_to_file=save_to_file, archive=archive,
+                                    search_index=search_index, dedup=dedup)
+                    self.record_refs(store, email_data, refs)
+                    if journal and use_uid:
+                        journal.commit(msg_id, i)
+
+                    if i % 10 == 0:
+                        print(self.metrics.progress_line(i - start_index + 1, len(message_ids), started))
+
+                except Exception as e:
+                    print(f"Error processing message {i}: {e}")
+                    self.metrics.inc("errors_total", stage="parse")
+                    if journal and use_uid:
+                        journal.commit(msg_id, i, error=str(e))
+                    continue
+                yield email_data
+        finally:
+            if not finished:
+                stopping.set()
+                while parsed.get() is not None:
+                    pass
+            fetcher.join()
+            submitter.join()
+            self.record_missing(journal, failed)
+
+    def skip_duplicates(self, message_ids, folder, dedup, use_uid=False, journal=None):
+        """Drop the messages whose Message-ID is already in dedup, before any body is fetched
+
+        Only a few header fields are fetched. Skipped messages are
+        recorded as members of folder and deferred in journal (see
+        DownloadJournal.defer). Returns the ids still to fetch and a
+        summary stub for every skipped message (see duplicate_stub).
+        """
+        message_ids = [msg_id if isinstance(msg_id, bytes) else str(msg_id).encode() for msg_id in message_ids]
+        items = f"({'UID ' if use_uid else ''}BODY.PEEK[HEADER.FIELDS ({DEDUP_HEADER_FIELDS})])"
+        remaining = []
+        duplicates = []
+        for start in range(0, len(message_ids), DEDUP_HEADER_BATCH_SIZE):
+            batch = message_ids[start:start + DEDUP_HEADER_BATCH_SIZE]
+            with self.metrics.timer("imap_command_seconds", command="FETCH"):
+                if use_uid:
+                    status, msg_data = self.connection.uid('FETCH', self.build_sequence_set(batch), items)
+                else:
+                    status, msg_data = self.connection.fetch(self.build_sequence_set(batch), items)
+            headers = self.index_fetch_literals(msg_data, use_uid) if status == 'OK' else {}
+            fetch, skipped = self.sort_duplicates(batch, headers, folder, dedup, use_uid)
+            remaining += fetch
+            duplicates += skipped
+        dedup.commit()
+        if duplicates:
+            print(f"Skipping {len(duplicates)} messages already downloaded (same Message-ID)")
+            self.metrics.inc("duplicates_total", len(duplicates))
+            if journal and use_uid:
+                journal.defer([duplicate['id'].encode() for duplicate in duplicates])
+        return remaining, duplicates
+
+    def sort_duplicates(self, batch, headers, folder, dedup, use_uid=False):
+        """Split batch by the fetched headers into (ids to fetch, duplicate_stub of each id dedup already has)"""
+        remaining = []
+        duplicates = []
+        for msg_id in batch:
+            original = None
+            if headers.get(msg_id):
+                msg = BytesHeaderParser().parsebytes(headers[msg_id])
+                original = dedup.find(msg.get("Message-ID"))
+            if original:
+                dedup.add_membership(original[0], folder, int(msg_id) if use_uid else 0, self.selected_uidvalidity, commit=False)
+                duplicates.append(self.duplicate_stub(msg_id, msg, original[1], use_uid))
+            else:
+                remaining.append(msg_id)
+        return remaining, duplicates
+
+    def duplicate_stub(self, msg_id, msg, location, use_uid=False):
+        """email_data for a message skipped as a duplicate: its headers and 'duplicate_of', for the summary"""
+        stub = {
+            'id': msg_id.decode(),
+            'subject': self.decode_mime_words(msg.get("Subject", "")),
+            'from': self.decode_mime_words(msg.get("From", "")),
+            'date': msg.get("Date", ""),
+            'message_id': msg.get("Message-ID", ""),
+            'content': {'text': '', 'html': '', 'attachments': []},
+            'duplicate_of': location
+        }
+        if use_uid:
+            stub['uid'] = int(msg_id)
+        return stub
+
+    def message_location(self, i, msg_id, output_dir, archive=None):
+        """Where a message is saved: its JSON file, or "<archive_dir>#<id>" when archiving"""
+        if archive:
+            # Attachment references point at the archive entry
+            return f"{archive.archive_dir}#{msg_id.decode()}"
+        filename = f"email_{i:04d}_{msg_id.decode()}.json"
+        return os.path.join(output_dir, filename)
+
+    def parse_message(self, i, msg_id, raw_email, *, streaming=False, store=None, ref=None, use_uid=False):
+        """Parse a raw message into an email_data dict, saving attachments to store under ref
+
+        How much is parsed depends on self.parse_mode (see PARSE_MODES);
+        the "text" and "headers" modes always use the streaming parser and
+        record the raw message size and the mode in the email_data.
+        """
+        started = time.perf_counter()
+        if self.parse_mode == "headers":
+            msg = self.read_header_block(io.BytesIO(raw_email))
+            content = {'text': '', 'html': '', 'attachments': []}
+        elif streaming or self.parse_mode == "text":
+            msg, content = self.extract_streaming(
+                raw_email,
+                email_id=msg_id.decode(),
+                store=store,
+                ref=ref,
+                mode=self.parse_mode
+            )
+        else:
+            msg = email.message_from_bytes(raw_email, policy=load_email_policy(self.email_policy))
+            content = self.get_email_content(
+                msg, 
+                email_id=msg_id.decode(),
+                store=store,
+                ref=ref
+            )
+        
+        # Extract email information
+        email_data = {
+            'id': msg_id.decode(),
+            'subject': self.decode_mime_words(msg.get("Subject", "")),
+            'from': self.decode_mime_words(msg.get("From", "")),
+            'to': self.decode_mime_words(msg.get("To", "")),
+            'cc': self.decode_mime_words(msg.get("Cc", "")),
+            'date': msg.get("Date", ""),
+            'message_id': msg.get("Message-ID", ""),
+            'content': content
+        }
+        if use_uid:
+            email_data['uid'] = int(msg_id)
+        if self.parse_mode != "full":
+            email_data['parse_mode'] = self.parse_mode
+            email_data['size'] = len(raw_email)
+        
+        # Show attachment info
+        if email_data['content']['attachments']:
+            print(f"  Message {i} has {len(email_data['content']['attachments'])} attachment(s)")
+        self.metrics.observe("parse_seconds", time.perf_counter() - started)
+        return email_data
+
+    def save_email(self, email_data, raw_email, filepath, folder, *, save_to_file=True, archive=None, search_index=None, dedup=None):
+        """Save an email to its JSON file or the archive and add it to the search index
+
+        With dedup, an email already saved under another path (same
+        Message-ID, or same content without one) is only recorded as being
+        in folder and gets a 'duplicate_of' key instead of being written;
+        callers record attachment refs afterwards (see record_refs).
+        """
+        if self.postprocessor:
+            self.postprocessor.resolve(email_data['content']['attachments'])
+        # The indexes are shared by runs started from anywhere, so they get absolute paths
+        location = os.path.abspath(filepath) if filepath else filepath
+        if save_to_file and dedup:
+            original = dedup.find(email_data.get('message_id'), raw_email)
+            if original and original[1] != location:
+                dedup.add_membership(original[0], folder, email_data.get('uid', 0), self.selected_uidvalidity, commit=False)
+                email_data['duplicate_of'] = original[1]
+                self.metrics.inc("duplicates_total")
+                return
+        with self.metrics.timer("save_seconds"):
+            if save_to_file and archive:
+                archive.append(email_data['id'], email_data=email_data, raw_email=raw_email)
+            elif save_to_file:
+                with open(filepath, 'w', encoding='utf-8') as f:
+                    json.dump(email_data, f, indent=2, ensure_ascii=False)
+            if save_to_file and search_index:
+                search_index.add(email_data, folder, location=location, commit=False)
+        if save_to_file and dedup:
+            dedup.add(email_data.get('message_id'), raw_email, location, folder, email_data.get('uid', 0), self.selected_uidvalidity, commit=False)
+        self.metrics.inc("messages_total")
+
+    def write_summary(self, output_dir, folder, emails, save_attachments=True, append=False):
+        """Write email_summary.json for a folder and return its path
+
+        With append, the emails are merged into an existing summary file.
+        emails can be any iterable; see SummaryWriter.
+        """
+        writer = SummaryWriter(output_dir, folder, save_attachments, append=append)
+        for email_data in emails:
+            writer.add(email_data)
+        return writer.close()
+    
+    def folder_dir_name(self, folder):
+        """Turn an IMAP folder name into a safe directory name"""
+        safe_name = "".join(c if c.isalnum() or c in (' ', '-', '_', '.') else '_' for c in folder).strip()
+        return safe_name or "folder"
+
+    def load_sync_state(self, output_dir):
+        """Load the per-folder UIDVALIDITY / high-water-mark state"""
+        state_file = os.path.join(output_dir, SYNC_STATE_FILE)
+        if not os.path.exists(state_file):
+            return {}
+        try:
+            with open(state_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error reading sync state {state_file}: {e}")
+            return {}
+
+    def save_sync_state(self, output_dir, state):
+        """Atomically write the sync state file"""
+        os.makedirs(output_dir, exist_ok=True)
+        state_file = os.path.join(output_dir, SYNC_STATE_FILE)
+        tmp_file = state_file + ".tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(state, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_file, state_file)
+
+    def sync_folder(self, folder="INBOX", output_dir="yahoo_emails", **options):
+        """iter_sync_folder() collected into a list"""
+        return list(self.iter_sync_folder(folder, output_dir, **options))
+
+    def iter_sync_folder(self, folder="INBOX", output_dir="yahoo_emails", *, save_attachments=True, batch_size=100, streaming=False,
+                         criteria=None, archive_format="json", search_index=None, workers=0, dedup=None, store=None):
+        """Incrementally sync a folder into a fixed output directory
+
+        Only UIDs above the last synced UID are fetched. If the folder's
+        UIDVALIDITY changed since the last run, the old copy is moved aside
+        and the folder is resynced from scratch. Messages skipped as
+        duplicates by dedup count as synced. Attachments go to store, or
+        to an AttachmentStore in output_dir/attachments opened for the call.
+        Yields the new emails as they are saved (see iter_emails); the sync
+        state is written when the generator is exhausted or closed.
+        """
+        if not self.connection:
+            print("Not connected to server")
+            return
+
+        try:
+            if self.select_folder(folder) is None:
+                print(f"Error selecting folder {folder}")
+                return
+            uidvalidity = self.selected_uidvalidity
+
+            state = self.load_sync_state(output_dir)
+            folder_state = state.get(folder)
+            folder_dir = os.path.join(output_dir, self.folder_dir_name(folder))
+
+            if folder_state and folder_state['uidvalidity'] == uidvalidity:
+                last_uid = folder_state['last_uid']
+                message_count = folder_state.get('message_count', 0)
+                data = self.search_messages([f"UID {last_uid + 1}:*"] + list(criteria or []), use_uid=True)
+            else:
+                if folder_state:
+                    print(f"UIDVALIDITY of {folder} changed ({folder_state['uidvalidity']} -> {uidvalidity}), running full resync")
+                    if os.path.isdir(folder_dir):
+                        os.replace(folder_dir, f"{folder_dir}.uidvalidity-{folder_state['uidvalidity']}")
+                last_uid = 0
+                message_count = 0
+                data = self.search_messages(criteria, use_uid=True)
+
+            if data is None:
+                print("Error searching for messages")
+                return
+
+            # "UID n:*" always matches the last message, even when its UID is below n
+            new_uids = sorted(uid for uid in map(int, data) if uid > last_uid)
+            print(f"{len(new_uids)} new messages in {folder} since UID {last_uid}")
+
+            retrieved = set()
+            try:
+                if new_uids:
+                    # Attachments of all folders share one store at the top of output_dir
+                    own_store = None
+                    if save_attachments and store is None:
+                        store = own_store = AttachmentStore(os.path.join(output_dir, "attachments"))
+                    try:
+                        for email_data in self.iter_emails(
+                            folder=folder,
+                            output_dir=folder_dir,
+                            save_attachments=save_attachments,
+                            batch_size=batch_size,
+                            streaming=streaming,
+                            uids=new_uids,
+                            start_index=message_count + 1,
+                            append_summary=True,
+                            store=store,
+                            archive_format=archive_format,
+                            search_index=search_index,
+                            workers=workers,
+                            dedup=dedup
+                        ):
+                            retrieved.add(email_data['uid'])
+                            yield email_data
+                    finally:
+                        if own_store:
+                            own_store.close()
+
+            finally:
+                # Only advance the high-water mark over UIDs that were actually stored
+                saved = len(retrieved)
+                if dedup:
+                    retrieved |= dedup.member_uids(folder, uidvalidity, new_uids)
+                for uid in new_uids:
+                    if uid not in retrieved:
+                        break
+                    last_uid = uid
+
+                with self.sync_state_lock:
+                    # Re-read so folders saved meanwhile by other threads are kept
+                    state = self.load_sync_state(output_dir)
+                    state[folder] = {
+                        'uidvalidity': uidvalidity,
+                        'last_uid': last_uid,
+                        'message_count': message_count + saved,
+                        'synced_at': datetime.now().isoformat()
+                    }
+                    self.save_sync_state(output_dir, state)
+
+        except Exception as e:
+            print(f"Error syncing folder {folder}: {e}")
+
+    def load_flag_state(self, folder_dir):
+        """Load a folder's FLAGS_FILE, with the UIDs as ints"""
+        state_file = os.path.join(folder_dir, FLAGS_FILE)
+        if not os.path.exists(state_file):
+            return {}
+        try:
+            with open(state_file, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error reading flags {state_file}: {e}")
+            return {}
+        state['messages'] = {int(uid): flags for uid, flags in state.get('messages', {}).items()}
+        state['expunged'] = {int(uid): when for uid, when in state.get('expunged', {}).items()}
+        return state
+
+    def save_flag_state(self, folder_dir, state):
+        """Atomically write a folder's FLAGS_FILE"""
+        os.makedirs(folder_dir, exist_ok=True)
+        state_file = os.path.join(folder_dir, FLAGS_FILE)
+        tmp_file = state_file + ".tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_file, state_file)
+
+    def parse_flags_response(self, msg_data):
+        """Map UID -> sorted list of flags from a FETCH (UID FLAGS) response
+
+        Flag-only responses are one line per message and can run to
+        100,000 lines, so they are picked apart with regular expressions
+        rather than parse_fetch_response().
+        """
+        flags_by_uid = {}
+        for line in msg_data:
+            if isinstance(line, tuple):
+                line = line[0]
+            if not isinstance(line, bytes):
+                continue
+            uid = re.search(rb'\bUID (\d+)', line)
+            flags = re.search(rb'\bFLAGS \(([^)]*)\)', line)
+            if uid and flags:
+                flags_by_uid[int(uid.group(1))] = sorted(flags.group(1).decode('utf-8', errors='replace').split())
+        return flags_by_uid
+
+    def reconcile_folder(self, folder="INBOX", output_dir="yahoo_emails"):
+        """Mirror flag changes and expunges of a synced folder without fetching bodies
+
+        The flags of every message in the folder and the UIDs expunged
+        from it are kept in FLAGS_FILE in the folder's directory. When the
+        server supports CONDSTORE and the folder's HIGHESTMODSEQ is known
+        from the last pass, only the messages changed since are fetched
+        (UID FETCH 1:* (UID FLAGS) (CHANGEDSINCE n)), and nothing at all if
+        HIGHESTMODSEQ has not moved; the UIDs still in the folder are only
+        listed when the message count shows that some were expunged.
+        Otherwise a single UID FETCH 1:* (UID FLAGS) gives every message's
+        flags. Expunged UIDs are tombstoned with the time they were
+        noticed. Returns a dict of counts, or None on error.
+        """
+        if not self.connection:
+            print("Not connected to server")
+            return None
+
+        try:
+            count = self.select_folder(folder)
+            if count is None:
+                print(f"Error selecting folder {folder}")
+                return None
+            _, modseq = self.connection.response('HIGHESTMODSEQ')
+            highestmodseq = int(modseq[-1]) if modseq[-1] else None
+
+            folder_dir = os.path.join(output_dir, self.folder_dir_name(folder))
+            state = self.load_flag_state(folder_dir)
+            if state.get('uidvalidity') != self.selected_uidvalidity:
+                if state:
+                    print(f"UIDVALIDITY of {folder} changed, rebuilding its {FLAGS_FILE}")
+                state = {'uidvalidity': self.selected_uidvalidity, 'highestmodseq': None, 'messages': {}, 'expunged': {}}
+            messages = state['messages']
+            now = datetime.now().isoformat()
+            result = {'folder': folder, 'mode': "full", 'changed': 0, 'expunged': 0}
+
+            incremental = 'CONDSTORE' in self.connection.capabilities and highestmodseq and state['highestmodseq']
+            changes = {}
+            if incremental and highestmodseq == state['highestmodseq']:
+                result['mode'] = "unchanged"
+            elif count:
+                if incremental:
+                    result['mode'] = "changedsince"
+                    modifier = (f"(CHANGEDSINCE {state['highestmodseq']})",)
+                else:
+                    modifier = ()
+                with self.metrics.timer("imap_command_seconds", command="FETCH"):
+                    status, data = self.connection.uid('FETCH', '1:*', '(UID FLAGS)', *modifier)
+                if status != 'OK':
+                    print(f"Error fetching flags in {folder}")
+                    return None
+                self.metrics.inc("bytes_received_total", sum(len(line) for line in data if isinstance(line, bytes)))
+                changes = self.parse_flags_response(data)
+
+            for uid, flags in changes.items():
+                if messages.get(uid) != flags:
+                    messages[uid] = flags
+                    result['changed'] += 1
+
+            # The full fetch lists every message; otherwise only look when the count is off
+            present = None
+            if result['mode'] == "full":
+                present = set(changes)
+            elif len(messages) != count:
+                data = self.search_messages(None, use_uid=True)
+                if data is None:
+                    print(f"Error listing UIDs in {folder}")
+                    return None
+                present = {int(uid) for uid in data}
+            if present is not None:
+                for uid in [uid for uid in messages if uid not in present]:
+                    del messages[uid]
+                    state['expunged'][uid] = now
+                    result['expunged'] += 1
+
+            state['highestmodseq'] = highestmodseq
+            state['reconciled_at'] = now
+            self.save_flag_state(folder_dir, state)
+            result['messages'] = len(messages)
+            return result
+
+        except Exception as e:
+            print(f"Error reconciling folder {folder}: {e}")
+            return None
+
+    def parse_fetch_response(self, msg_data):
+        """Parse the data of a FETCH response into a list of dicts
+
+        Each dict maps upper-cased item names (UID, ENVELOPE, ...) to values
+        and has the message sequence number under 'SEQ'. Parenthesised lists
+        become Python lists, NIL becomes None, quoted strings and literals
+        are bytes and other atoms are str.
+        """
+        # Join the response pieces, replacing literals with \0<index>\0 markers
+        pieces = []
+        literals = []
+        for item in msg_data:
+            if isinstance(item, tuple):
+                pieces.append(re.sub(rb'\{\d+\}$', b'', item[0]) + b'\x00' + str(len(literals)).encode() + b'\x00')
+                literals.append(item[1])
+            elif isinstance(item, bytes):
+                pieces.append(item)
+        text = b' '.join(pieces)
+
+        tokens = self.tokenize_imap(text, literals)
+        messages = []
+        pos = 0
+        while pos < len(tokens):
+            seq = tokens[pos]
+            if not (isinstance(seq, str) and seq.isdigit()) or pos + 1 >= len(tokens) or tokens[pos + 1] != '(':
+                pos += 1
+                continue
+            items, pos = self.parse_imap_list(tokens, pos + 2)
+            message = {'SEQ': int(seq)}
+            for key, value in zip(items[0::2], items[1::2]):
+                message[key.upper() if isinstance(key, str) else key] = value
+            messages.append(message)
+        return messages
+
+    def tokenize_imap(self, text, literals=()):
+        """Split IMAP response text into tokens ('(', ')', bytes strings, str atoms, None)"""
+        tokens = []
+        i = 0
+        length = len(text)
+        while i < length:
+            c = text[i:i + 1]
+            if c in (b' ', b'\r', b'\n'):
+                i += 1
+            elif c in (b'(', b')'):
+                tokens.append(c.decode())
+                i += 1
+            elif c == b'"':
+                value = bytearray()
+                i += 1
+                while i < length and text[i:i + 1] != b'"':
+                    if text[i:i + 1] == b'\\':
+                        i += 1
+                    value += text[i:i + 1]
+                    i += 1
+                tokens.append(bytes(value))
+                i += 1
+            elif c == b'\x00':
+                end = text.index(b'\x00', i + 1)
+                tokens.append(literals[int(text[i + 1:end])])
+                i = end + 1
+            else:
+                start = i
+                depth = 0
+                while i < length:
+                    c = text[i:i + 1]
+                    if c == b'[':
+                        depth += 1
+                    elif c == b']':
+                        depth -= 1
+                    elif depth == 0 and c in (b' ', b'(', b')', b'\r', b'\n'):
+                        break
+                    i += 1
+                atom = text[start:i].decode('utf-8', errors='replace')
+                tokens.append(None if atom.upper() == 'NIL' else atom)
+        return tokens
+
+    def parse_imap_list(self, tokens, pos):
+        """Parse the parenthesised list starting after '(' at tokens[pos]"""
+        items = []
+        while pos < len(tokens) and tokens[pos] != ')':
+            if tokens[pos] == '(':
+                value, pos = self.parse_imap_list(tokens, pos + 1)
+                items.append(value)
+            else:
+                items.append(tokens[pos])
+                pos += 1
+        return items, pos + 1
+
+    def imap_string(self, value):
+        """Decode an IMAP string (bytes/str/None) to text"""
+        if value is None:
+            return ""
+        if isinstance(value, bytes):
+            return value.decode('utf-8', errors='replace')
+        return str(value)
+
+    def format_addresses(self, addresses):
+        """Format an ENVELOPE address list as a From/To style header value"""
+        formatted = []
+        for address in addresses or []:
+            name, _, mailbox, host = (address + [None] * 4)[:4]
+            addr = self.imap_string(mailbox)
+            if host:
+                addr += "@" + self.imap_string(host)
+            name = self.decode_mime_words(self.imap_string(name))
+            formatted.append(f"{name} <{addr}>" if name else addr)
+        return ", ".join(formatted)
+
+    def walk_bodystructure(self, structure, section=""):
+        """Yield a dict for each leaf part of a BODYSTRUCTURE
+
+        Each dict holds the part's IMAP section number (e.g. '1.2'), content
+        type, parameters, transfer encoding, encoded size, disposition and
+        filename.
+        """
+        if structure and isinstance(structure[0], list):
+            # multipart: child parts followed by the subtype and extension data
+            number = 0
+            for child in structure:
+                if not isinstance(child, list):
+                    break
+                number += 1
+                yield from self.walk_bodystructure(child, f"{section}.{number}" if section else str(number))
+            return
+
+        def pairs(values):
+            values = values or []
+            return {self.imap_string(k).lower(): self.imap_string(v) for k, v in zip(values[0::2], values[1::2])}
+
+        maintype = self.imap_string(structure[0]).lower()
+        subtype = self.imap_string(structure[1]).lower()
+        params = pairs(structure[2])
+        # Extension data follows the basic fields; text/* adds a line count
+        # and message/rfc822 adds an envelope, a body and a line count
+        extension = 7
+        if maintype == 'text':
+            extension = 8
+        elif maintype == 'message' and subtype == 'rfc822':
+            extension = 10
+        disposition = None
+        disposition_params = {}
+        if len(structure) > extension + 1 and isinstance(structure[extension + 1], list):
+            disposition = self.imap_string(structure[extension + 1][0]).lower()
+            disposition_params = pairs(structure[extension + 1][1] if len(structure[extension + 1]) > 1 else None)
+        filename = disposition_params.get('filename') or params.get('name')
+        yield {
+            'section': section or "1",
+            'content_type': f"{maintype}/{subtype}",
+            'params': params,
+            'charset': params.get('charset'),
+            'encoding': self.imap_string(structure[5]).lower() if len(structure) > 5 else "7bit",
+            'size': int(structure[6]) if len(structure) > 6 and structure[6] and str(structure[6]).isdigit() else 0,
+            'disposition': disposition,
+            'filename': self.decode_mime_words(filename) if filename else None,
+        }
+
+    def index_folder(self, folder="INBOX", output_dir="emails", batch_size=500, save_to_file=True, criteria=None):
+        """Build a folder summary from ENVELOPE/BODYSTRUCTURE without downloading bodies
+
+        Fetches only ENVELOPE, BODYSTRUCTURE, RFC822.SIZE and INTERNALDATE
+        for every message. Attachment counts come from BODYSTRUCTURE. The
+        returned entries can be passed to download_selected() to fetch the
+        bodies of just the messages that are wanted.
+        """
+        if not self.connection:
+            print("Not connected to server")
+            return []
+
+        try:
+            num_messages = self.select_folder(folder)
+            if num_messages is None:
+                print(f"Error selecting folder {folder}")
+                return []
+            print(f"Found {num_messages} messages in {folder}")
+
+            data = self.search_messages(criteria, use_uid=True)
+            if data is None:
+                print("Error searching for messages")
+                return []
+            uids = [int(uid) for uid in data]
+
+            entries = []
+            for start in range(0, len(uids), max(1, batch_size)):
+                batch = uids[start:start + batch_size]
+                status, msg_data = self.connection.uid('FETCH', self.build_sequence_set(batch), "(UID ENVELOPE BODYSTRUCTURE RFC822.SIZE INTERNALDATE)")
+                if status != 'OK':
+                    print(f"Error fetching headers for messages {start + 1}-{start + len(batch)}")
+                    continue
+                for message in self.parse_fetch_response(msg_data):
+                    try:
+                        envelope = message.get('ENVELOPE') or [None] * 10
+                        parts = list(self.walk_bodystructure(message.get('BODYSTRUCTURE') or []))
+                        attachments = [part for part in parts if part['filename']]
+                        entries.append({
+                            'id': str(message['UID']),
+                            'uid': int(message['UID']),
+                            'subject': self.decode_mime_words(self.imap_string(envelope[1])),
+                            'from': self.format_addresses(envelope[2]),
+                            'to': self.format_addresses(envelope[5]),
+                            'date': self.imap_string(envelope[0]),
+                            'message_id': self.imap_string(envelope[9]),
+                            'size': int(message.get('RFC822.SIZE') or 0),
+                            'internaldate': self.imap_string(message.get('INTERNALDATE')),
+                            'attachment_count': len(attachments),
+                            'attachments': [
+                                {'filename': part['filename'], 'content_type': part['content_type'], 'size': part['size']}
+                                for part in attachments
+                            ],
+                            'downloaded': False
+                        })
+                    except Exception as e:
+                        print(f"Error indexing message {message.get('SEQ')}: {e}")
+                print(f"Indexed {len(entries)}/{len(uids)} messages")
+
+            if save_to_file:
+                os.makedirs(output_dir, exist_ok=True)
+                summary_file = self.write_index_summary(output_dir, folder, entries)
+                print(f"Index summary saved to {summary_file}")
+            return entries
+
+        except Exception as e:
+            print(f"Error indexing folder {folder}: {e}")
+            return []
+
+    def write_index_summary(self, output_dir, folder, entries):
+        """Write email_summary.json for a headers-only index and return its path"""
+        summary_file = os.path.join(output_dir, "email_summary.json")
+        summary = {
+            'total_emails': len(entries),
+            'total_attachments': sum(entry['attachment_count'] for entry in entries),
+            'total_size': sum(entry['size'] for entry in entries),
+            'folder': folder,
+            'retrieved_at': datetime.now().isoformat(),
+            'headers_only': True,
+            'emails': [dict(entry, subject=entry['subject'][:100]) for entry in entries]
+        }
+        with open(summary_file, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+        return summary_file
+
+    def download_selected(self, folder, entries, selector, *, output_dir="emails", save_attachments=True, batch_size=100, streaming=False,
+                          archive_format="json", search_index=None, workers=0, dedup=None):
+        """Download full bodies for the index entries accepted by selector
+
+        selector is called with each entry from index_folder() and returns
+        True for messages whose bodies should be fetched. The index summary
+        is updated to mark the downloaded messages.
+        """
+        selected = [entry for entry in entries if not entry.get('downloaded') and selector(entry)]
+        print(f"Downloading bodies for {len(selected)} of {len(entries)} indexed messages")
+        if not selected:
+            return []
+
+        emails = self.retrieve_emails(
+            folder=folder,
+            output_dir=output_dir,
+            save_attachments=save_attachments,
+            batch_size=batch_size,
+            streaming=streaming,
+            uids=[entry['uid'] for entry in selected],
+            save_summary=False,
+            archive_format=archive_format,
+            search_index=search_index,
+            workers=workers,
+            dedup=dedup
+        )
+        downloaded = {email_data['uid'] for email_data in emails}
+        if dedup:
+            downloaded |= dedup.member_uids(folder, self.selected_uidvalidity, [entry['uid'] for entry in selected])
+        for entry in entries:
+            if entry['uid'] in downloaded:
+                entry['downloaded'] = True
+        self.write_index_summary(output_dir, folder, entries)
+        return emails
+
+    def decoded_size(self, part):
+        """Estimate a part's decoded size from its encoded BODYSTRUCTURE size"""
+        if part['encoding'] == 'base64':
+            # 76 characters plus CRLF per line, 4 characters per 3 bytes
+            return (part['size'] - 2 * (part['size'] // 78)) * 3 // 4
+        return part['size']
+
+    def fetch_section(self, uid, part, sink, chunk_size=PARTIAL_CHUNK_SIZE):
+        """Fetch one MIME section (a walk_bodystructure() part) by UID into sink
+
+        The transfer encoding is decoded on the way. Parts bigger than
+        chunk_size are read in BODY.PEEK[section]<offset.length> ranges so
+        only one range is held in memory. Returns the decoded size.
+        """
+        decoder = TransferDecoder(part['encoding'])
+        chunked = part['size'] > chunk_size
+        offset = 0
+        size = 0
+        while True:
+            item = f"BODY.PEEK[{part['section']}]" + (f"<{offset}.{chunk_size}>" if chunked else "")
+            with self.metrics.timer("imap_command_seconds", command="FETCH"):
+                status, msg_data = self.connection.uid('FETCH', str(uid), f"(UID {item})")
+            if status != 'OK':
+                raise imaplib.IMAP4.error(f"FETCH {item} failed for UID {uid}")
+            data = b''
+            for message in self.parse_fetch_response(msg_data):
+                for key, value in message.items():
+                    if isinstance(key, str) and key.startswith(f"BODY[{part['section']}]"):
+                        data = value or b''
+            self.metrics.inc("bytes_received_total", len(data))
+            chunk = decoder.decode(data)
+            sink.write(chunk)
+            size += len(chunk)
+            if not chunked or len(data) < chunk_size:
+                break
+            offset += len(data)
+        chunk = decoder.flush()
+        sink.write(chunk)
+        return size + len(chunk)
+
+    def retrieve_partial(self, folder="INBOX", limit=None, **options):
+        """iter_partial() collected into a list"""
+        return list(self.iter_partial(folder, limit, **options))
+
+    def iter_partial(self, folder="INBOX", limit=None, *, save_to_file=True, output_dir="emails", rules=None, batch_size=100,
+                     chunk_size=PARTIAL_CHUNK_SIZE, criteria=None, store=None, search_index=None, dedup=None):
+        """Retrieve emails section by section instead of as whole RFC822 messages, yielding each one once it is saved
+
+        BODYSTRUCTURE and the headers are fetched first; then only the
+        text/plain and text/html bodies are fetched with BODY.PEEK[section],
+        plus the attachments accepted by rules (an AttachmentRules, default
+        none). Attachment sizes come from BODYSTRUCTURE, so skipped
+        attachments are never downloaded; they are listed with
+        "downloaded": false. Emails are saved as JSON files like
+        iter_emails(), marked "partial": true, and the summary is written
+        as they come in (see SummaryWriter). With dedup, messages whose
+        Message-ID was already downloaded are skipped once their headers
+        are in.
+        """
+        if not self.connection:
+            print("Not connected to server")
+            return
+
+        rules = rules or AttachmentRules(download=False)
+        own_store = None
+        summary = None
+        try:
+            num_messages = self.select_folder(folder)
+            if num_messages is None:
+                print(f"Error selecting folder {folder}")
+                return
+            print(f"Found {num_messages} messages in {folder}")
+
+            data = self.search_messages(criteria, use_uid=True)
+            if data is None:
+                print("Error searching for messages")
+                return
+            uids = [int(uid) for uid in data]
+            if limit:
+                uids = uids[-limit:]
+
+            if save_to_file:
+                os.makedirs(output_dir, exist_ok=True)
+                if store is None and rules.download:
+                    store = own_store = AttachmentStore(os.path.join(output_dir, "attachments"))
+                summary = SummaryWriter(output_dir, folder, rules.download)
+            if store is not None and store.metrics is None:
+                store.metrics = self.metrics
+
+            print(f"Retrieving {len(uids)} messages by section...")
+            retrieved = 0
+            skipped_bytes = 0
+            started = time.perf_counter()
+            for start in range(0, len(uids), max(1, batch_size)):
+                batch = uids[start:start + batch_size]
+                with self.metrics.timer("imap_command_seconds", command="FETCH"):
+                    status, msg_data = self.connection.uid('FETCH', self.build_sequence_set(batch),
+                                                           f"(UID BODYSTRUCTURE BODY.PEEK[HEADER.FIELDS ({PARTIAL_HEADER_FIELDS})])")
+                if status != 'OK':
+                    print(f"Error fetching structure for messages {start + 1}-{start + len(batch)}")
+                    continue
+
+                # Plan each message: which text parts to fetch, which attachments exist
+                plans = {}
+                for message in self.parse_fetch_response(msg_data):
+                    uid = int(message['UID'])
+                    header_bytes = next((value for key, value in message.items() if isinstance(key, str) and key.startswith('BODY[HEADER')), b'')
+                    parts = list(self.walk_bodystructure(message.get('BODYSTRUCTURE') or []))
+                    texts = [part for part in parts if not part['filename'] and part['disposition'] != 'attachment'
+                             and part['content_type'] in ("text/plain", "text/html")]
+                    attachments = [part for part in parts if part['filename']]
+                    plans[uid] = (BytesHeaderParser().parsebytes(header_bytes or b''), texts, attachments)
+
+                duplicates = set()
+                if dedup and save_to_file:
+                    for uid, (headers, _, _) in list(plans.items()):
+                        original = dedup.find(headers.get("Message-ID"))
+                        if original:
+                            dedup.add_membership(original[0], folder, uid, self.selected_uidvalidity, commit=False)
+                            duplicates.add(uid)
+                            del plans[uid]
+                    if duplicates:
+                        print(f"Skipping {len(duplicates)} messages already downloaded (same Message-ID)")
+                        self.metrics.inc("duplicates_total", len(duplicates))
+
+                # Fetch the small text parts of messages with the same layout together
+                bodies = {}
+                groups = {}
+                for uid, (_, texts, _) in plans.items():
+                    sections = tuple(part['section'] for part in texts if part['size'] <= chunk_size)
+                    if sections:
+                        groups.setdefault(sections, []).append(uid)
+                for sections, group in groups.items():
+                    items = " ".join(f"BODY.PEEK[{section}]" for section in sections)
+                    with self.metrics.timer("imap_command_seconds", command="FETCH"):
+                        status, msg_data = self.connection.uid('FETCH', self.build_sequence_set(sorted(group)), f"(UID {items})")
+                    if status != 'OK':
+                        print(f"Error fetching text parts {', '.join(sections)}")
+                        self.metrics.inc("errors_total", stage="fetch")
+                        continue
+                    for message in self.parse_fetch_response(msg_data):
+                        for section in sections:
+                            bodies[(int(message['UID']), section)] = message.get(f"BODY[{section}]") or b''
+                            self.metrics.inc("bytes_received_total", len(bodies[(int(message['UID']), section)]))
+
+                for i, uid in enumerate(batch, start + 1):
+                    if uid in duplicates:
+                        continue
+                    if uid not in plans:
+                        print(f"Message {uid} missing from FETCH response")
+                        continue
+                    try:
+                        headers, texts, attachments = plans[uid]
+                        msg_id = str(uid).encode()
+                        filepath = self.message_location(i, msg_id, output_dir)
+                        content = {'text': '', 'html': '', 'attachments': []}
+                        refs = []
+                        for part in texts:
+                            if (uid, part['section']) in bodies:
+                                decoder = TransferDecoder(part['encoding'])
+                                body = decoder.decode(bodies[(uid, part['section'])]) + decoder.flush()
+                            else:
+                                sink = io.BytesIO()
+                                self.fetch_section(uid, part, sink, chunk_size)
+                                body = sink.getvalue()
+                            body_text = body.decode(resolve_codec(part['charset']) or 'utf-8', errors='ignore')
+                            content['text' if part['content_type'] == "text/plain" else 'html'] = body_text
+
+                        for part in attachments:
+                            attachment_info = {
+                                'filename': part['filename'],
+                                'content_type': part['content_type'],
+                                'size': self.decoded_size(part),
+                                'section': part['section'],
+                                'downloaded': False
+                            }
+                            if store and rules.matches(part, attachment_info['size']):
+                                sink = store.open_writer()
+                                captured = None
+                                if self.postprocessor and self.postprocessor.wants(attachment_info, attachment_info['size']):
+                                    captured = io.BytesIO()
+                                try:
+                                    attachment_info['size'] = self.fetch_section(uid, part, TeeWriter(sink, captured) if captured is not None else sink,
+                                                                                 chunk_size)
+                                except Exception:
+                                    sink.abort()
+                                    raise
+                                sha256, attachment_path, stored = sink.commit()
+                                refs.append((sha256, attachment_info['size'], filepath))
+                                attachment_info.update(sha256=sha256, saved_path=attachment_path, downloaded=True)
+                                print(f"  {'Saved' if stored else 'Already stored'} attachment: {part['filename']} ({attachment_info['size']} bytes)")
+                                if captured is not None:
+                                    self.postprocessor.submit(attachment_info, captured.getvalue())
+                            else:
+                                skipped_bytes += part['size']
+                            content['attachments'].append(attachment_info)
+
+                        email_data = {
+                            'id': str(uid),
+                            'uid': uid,
+                            'subject': self.decode_mime_words(headers.get("Subject", "")),
+                            'from': self.decode_mime_words(headers.get("From", "")),
+                            'to': self.decode_mime_words(headers.get("To", "")),
+                            'cc': self.decode_mime_words(headers.get("Cc", "")),
+                            'date': headers.get("Date", ""),
+                            'message_id': headers.get("Message-ID", ""),
+                            'partial': True,
+                            'content': content
+                        }
+                        self.save_email(email_data, None, filepath, folder, save_to_file=save_to_file, search_index=search_index, dedup=dedup)
+                        self.record_refs(store, email_data, refs)
+                    except imaplib.IMAP4.abort:
+                        raise
+                    except Exception as e:
+                        print(f"Error processing message {i}: {e}")
+                        self.metrics.inc("errors_total", stage="parse")
+                        continue
+                    retrieved += 1
+                    if summary:
+                        summary.add(email_data)
+                    yield email_data
+                print(self.metrics.progress_line(min(start + len(batch), len(uids)), len(uids), started))
+
+            print(f"Successfully retrieved {retrieved} emails ({skipped_bytes} bytes of attachments not downloaded)")
+            if summary:
+                print(f"Emails saved to {output_dir} directory")
+                print(f"Summary saved to {summary.summary_file}")
+
+        except Exception as e:
+            print(f"Error retrieving emails: {e}")
+
+        finally:
+            if search_index:
+                search_index.commit()
+            if dedup:
+                dedup.commit()
+            if summary:
+                summary.close()
+            if own_store:
+                own_store.close()
+
+    def disconnect(self):
+        """Close connection to IMAP server"""
+        if self.connection:
+            try:
+                if self.selected_folder:
+                    self.connection.close()
+                self.connection.logout()
+                self.selected_folder = None
+                print("Disconnected from Yahoo IMAP server")
+            except:
+                pass
+
+
+class AttachmentRules:
+    """Which attachments iter_partial() downloads
+
+    An attachment is fetched when it is at most max_size bytes (None for
+    no limit) and, when given, its content type matches one of
+    content_types and its filename one of filenames. Both take
+    case-insensitive shell patterns such as "image/*" or "*.pdf". With
+    download=False no attachment is fetched.
+    """
+
+    def __init__(self, max_size=None, content_types=None, filenames=None, download=True):
+        self.max_size = max_size
+        self.content_types = [pattern.lower() for pattern in content_types or []]
+        self.filenames = [pattern.lower() for pattern in filenames or []]
+        self.download = download
+
+    def matches(self, part, size=None):
+        """True if the walk_bodystructure() part should be downloaded"""
+        if not self.download:
+            return False
+        if self.max_size is not None and (size if size is not None else part['size']) > self.max_size:
+            return False
+        if self.content_types and not any(fnmatch.fnmatch(part['content_type'].lower(), pattern) for pattern in self.content_types):
+            return False
+        if self.filenames and not any(fnmatch.fnmatch((part['filename'] or "").lower(), pattern) for pattern in self.filenames):
+            return False
+        return True
+
+
+class TeeWriter:
+    """Sink that passes every write on to several sinks"""
+
+    def __init__(self, *sinks):
+        self.sinks = sinks
+
+    def write(self, data):
+        for sink in self.sinks:
+            sink.write(data)
+
+
+# Inline AttachmentPostProcessor per plugin list in each parse worker process, so its cache outlives a message
+worker_postprocessors = {}
+
+
+def parse_message_worker(i, msg_id, raw_email, *, streaming, store_root, ref, use_uid, parse_mode="full", email_policy="compat32",
+                         postprocess=None):
+    """Process pool task for iter_staged(): return (email_data, attachment refs, Metrics.state())
+
+    postprocess names the attachment plugins to run; they run inline in
+    the worker and their results are in email_data.
+    """
+    retriever = YahooEmailRetriever(parse_mode=parse_mode, email_policy=email_policy)
+    if postprocess:
+        key = tuple(postprocess)
+        if key not in worker_postprocessors:
+            worker_postprocessors[key] = AttachmentPostProcessor.from_names(postprocess, workers=0)
+        retriever.postprocessor = worker_postprocessors[key]
+        retriever.postprocessor.metrics = retriever.metrics
+    store = DeferredRefStore(store_root) if store_root else None
+    if store:
+        store.metrics = retriever.metrics
+    email_data = retriever.parse_message(i, msg_id, raw_email, streaming=streaming, store=store, ref=ref, use_uid=use_uid)
+    if email_data and retriever.postprocessor:
+        retriever.postprocessor.resolve(email_data['content']['attachments'])
+    return email_data, store.refs if store else [], retriever.metrics.state()
@@ -0,0 +1,266 @@
+import argparse
+import os
+import json
+from datetime import datetime, timedelta
+from email.parser import BytesHeaderParser
+import getpass
+
+from .client import YahooEmailRetriever as BaseRetriever
+from .mime import TransferDecoder, resolve_codec
+
+# Headers fetched in place of the full message
+HEADER_FIELDS = "SUBJECT FROM TO CC DATE MESSAGE-ID"
+
+class YahooEmailRetriever(BaseRetriever):
+    """Text-only retriever: headers and text bodies, attachment sizes from BODYSTRUCTURE
+
+    Connecting, IMAP response parsing, SEARCH and header decoding are
+    those of yahoo_imap.client.YahooEmailRetriever.
+    """
+
+    def get_text_content(self, msg_id, structure):
+        """Extract email content using the message's BODYSTRUCTURE
+
+        Only the text/plain and text/html parts are fetched (with
+        BODY.PEEK[section]); attachment sizes come from BODYSTRUCTURE, so
+        attachments are never downloaded.
+        """
+        content = {
+            'text': '',
+            'html': '',
+            'attachments': []
+        }
+        
+        parts = list(self.walk_bodystructure(structure))
+        texts = []
+        for part in parts:
+            # Handle attachments
+            if part['filename']:
+                content['attachments'].append({
+                    'filename': part['filename'],
+                    'content_type': part['content_type'],
+                    'size': self.decoded_size(part)
+                })
+            elif part['disposition'] != 'attachment' and part['content_type'] in ("text/plain", "text/html"):
+                texts.append(part)
+        
+        if not texts:
+            return content
+        
+        # Get email body
+        status, msg_data = self.connection.fetch(msg_id, "(" + " ".join(f"BODY.PEEK[{part['section']}]" for part in texts) + ")")
+        if status != 'OK':
+            print("Error fetching email body")
+            return content
+        message = (self.parse_fetch_response(msg_data) or [{}])[0]
+        for part in texts:
+            try:
+                decoder = TransferDecoder(part['encoding'])
+                body = decoder.decode(message.get(f"BODY[{part['section']}]") or b'') + decoder.flush()
+                if body:
+                    body_text = body.decode(resolve_codec(part['charset']) or 'utf-8', errors='ignore')
+                    
+                    if part['content_type'] == "text/plain":
+                        content['text'] = body_text
+                    elif part['content_type'] == "text/html":
+                        content['html'] = body_text
+            except Exception as e:
+                print(f"Error decoding email part: {e}")
+        
+        return content
+
+    def retrieve_text_emails(self, folder="INBOX", limit=None, *, save_to_file=True, output_dir="emails", criteria=None):
+        """Retrieve the headers and text bodies of emails from specified folder
+
+        criteria (see build_search_criteria) limits the messages on the server.
+        Named apart from the inherited retrieve_emails(), which downloads
+        whole messages and takes that method's options.
+        """
+        if not self.connection:
+            print("Not connected to server")
+            return []
+        
+        try:
+            # Select folder
+            num_messages = self.select_folder(folder)
+            if num_messages is None:
+                print(f"Error selecting folder {folder}")
+                return []
+            
+            # Get message count
+            print(f"Found {num_messages} messages in {folder}")
+            
+            # Search for matching messages on the server
+            message_ids = self.search_messages(criteria)
+            if message_ids is None:
+                print("Error searching for messages")
+                return []
+            
+            if limit:
+                message_ids = message_ids[-limit:]  # Get most recent messages
+            
+            emails = []
+            
+            # Create output directory if saving to files
+            if save_to_file:
+                os.makedirs(output_dir, exist_ok=True)
+            
+            print(f"Retrieving {len(message_ids)} messages...")
+            
+            for i, msg_id in enumerate(message_ids, 1):
+                try:
+                    # Fetch headers and structure, not the whole message
+                    status, msg_data = self.connection.fetch(msg_id, f"(BODYSTRUCTURE BODY.PEEK[HEADER.FIELDS ({HEADER_FIELDS})])")
+                    if status != 'OK':
+                        print(f"Error fetching message {i}")
+                        continue
+                    
+                    # Parse headers
+                    message = self.parse_fetch_response(msg_data)[0]
+                    header_bytes = next((value for key, value in message.items() if isinstance(key, str) and key.startswith('BODY[HEADER')), b'')
+                    msg = BytesHeaderParser().parsebytes(header_bytes or b'')
+                    
+                    # Extract email information
+                    email_data = {
+                        'id': msg_id.decode(),
+                        'subject': self.decode_mime_words(msg.get("Subject", "")),
+                        'from': self.decode_mime_words(msg.get("From", "")),
+                        'to': self.decode_mime_words(msg.get("To", "")),
+                        'cc': self.decode_mime_words(msg.get("Cc", "")),
+                        'date': msg.get("Date", ""),
+                        'message_id': msg.get("Message-ID", ""),
+                        'content': self.get_text_content(msg_id, message.get('BODYSTRUCTURE') or [])
+                    }
+                    
+                    emails.append(email_data)
+                    
+                    # Save individual email to file
+                    if save_to_file:
+                        filename = f"email_{i:04d}_{msg_id.decode()}.json"
+                        filepath = os.path.join(output_dir, filename)
+                        with open(filepath, 'w', encoding='utf-8') as f:
+                            json.dump(email_data, f, indent=2, ensure_ascii=False)
+                    
+                    if i % 10 == 0:
+                        print(f"Processed {i}/{len(message_ids)} messages")
+                
+                except Exception as e:
+                    print(f"Error processing message {i}: {e}")
+                    continue
+            
+            print(f"Successfully retrieved {len(emails)} emails")
+            
+            # Save summary file
+            if save_to_file:
+                summary_file = os.path.join(output_dir, "email_summary.json")
+                summary = {
+                    'total_emails': len(emails),
+                    'folder': folder,
+                    'retrieved_at': datetime.now().isoformat(),
+                    'emails': [
+                        {
+                            'id': email_data['id'],
+                            'subject': email_data['subject'][:100],
+                            'from': email_data['from'],
+                            'date': email_data['date']
+                        }
+                        for email_data in emails
+                    ]
+                }
+                with open(summary_file, 'w', encoding='utf-8') as f:
+                    json.dump(summary, f, indent=2, ensure_ascii=False)
+                
+                print(f"Emails saved to {output_dir} directory")
+                print(f"Summary saved to {summary_file}")
+            
+            return emails
+            
+        except Exception as e:
+            print(f"Error retrieving emails: {e}")
+            return []
+
+def parse_args(argv=None):
+    """Parse the command line filters; everything else is asked interactively"""
+    parser = argparse.ArgumentParser(description="Download Yahoo email over IMAP")
+    filters = parser.add_argument_group("server-side filters", "applied with IMAP SEARCH before anything is downloaded")
+    filters.add_argument("--since", help="only mail on or after this date (YYYY-MM-DD)")
+    filters.add_argument("--before", help="only mail before this date (YYYY-MM-DD)")
+    filters.add_argument("--last-days", type=int, help="only mail from the last N days")
+    filters.add_argument("--from", dest="sender", help="only mail whose From contains this text")
+    filters.add_argument("--subject", help="only mail whose Subject contains this text")
+    filters.add_argument("--unseen", action="store_true", help="only unread mail")
+    filters.add_argument("--flagged", action="store_true", help="only flagged mail")
+    filters.add_argument("--min-size", type=int, help="only mail of at least this many bytes")
+    filters.add_argument("--max-size", type=int, help="only mail of at most this many bytes")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    retriever = YahooEmailRetriever()
+
+    since = args.since
+    if args.last_days:
+        since = datetime.now() - timedelta(days=args.last_days)
+    criteria = retriever.build_search_criteria(
+        since=since,
+        before=args.before,
+        sender=args.sender,
+        subject=args.subject,
+        unseen=args.unseen,
+        flagged=args.flagged,
+        min_size=args.min_size,
+        max_size=args.max_size
+    )
+    
+    # Get credentials
+    print("Yahoo Email Retriever")
+    print("Note: You'll need to use an App Password, not your regular Yahoo password")
+    print("Generate one at: https://login.yahoo.com/account/security")
+    print()
+    
+    username = input("Enter your Yahoo email address: ")
+    password = getpass.getpass("Enter your App Password: ")
+    
+    # Connect to Yahoo
+    if not retriever.connect(username, password):
+        return
+
+    if criteria:
+        print(f"Server-side filter: {' '.join(c if isinstance(c, str) else c.decode() for c in criteria)}")
+    
+    try:
+        # List available folders
+        print("\nAvailable folders:")
+        folders = retriever.list_folders()
+        for i, folder in enumerate(folders, 1):
+            print(f"{i}. {folder}")
+        
+        # Select folder
+        folder_choice = input(f"\nSelect folder (1-{len(folders)}) or press Enter for INBOX: ").strip()
+        if folder_choice.isdigit() and 1 <= int(folder_choice) <= len(folders):
+            selected_folder = folders[int(folder_choice) - 1]
+        else:
+            selected_folder = "INBOX"
+        
+        print(f"Selected folder: {selected_folder}")
+        
+        # Ask for limit
+        limit_input = input("Enter number of emails to retrieve (or press Enter for all): ").strip()
+        limit = int(limit_input) if limit_input.isdigit() else None
+        
+        # Retrieve emails
+        emails = retriever.retrieve_text_emails(
+            folder=selected_folder,
+            limit=limit,
+            save_to_file=True,
+            output_dir=f"yahoo_emails_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+            criteria=criteria
+        )
+        
+        print(f"\nRetrieved {len(emails)} emails successfully!")
+        
+    finally:
+        retriever.disconnect()
+
+if __name__ == "__main__":
+    main()
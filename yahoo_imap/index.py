@@ -0,0 +1,253 @@
+'''
+Per-user SQLite indexes of downloaded mail: the full-text search index
+and the duplicate index.
+'''
+
+import json
+import os
+import re
+import threading
+from datetime import datetime
+from html import unescape
+
+from .archive import ARCHIVE_MANIFEST_FILE, ArchiveReader
+
+# Per-user directory of the indexes shared by every run, wherever it is started from
+DATA_DIR = os.path.join(os.environ.get("XDG_DATA_HOME") or os.path.join(os.path.expanduser("~"), ".local", "share"), "yahoo-imap")
+
+# Default location of the local full-text search index
+SEARCH_INDEX_FILE = os.path.join(DATA_DIR, "search.sqlite")
+
+# Default location of the cross-folder, cross-run duplicate index
+DEDUP_INDEX_FILE = os.path.join(DATA_DIR, "dedup.sqlite")
+
+
+class MailSearchIndex:
+    """Local full-text index over downloaded mail (SQLite FTS5)
+
+    Subject, from, to, cc, the text body and attachment filenames are
+    indexed. The index is shared by every account and output directory,
+    so messages are keyed by (source, folder, id), source being the
+    absolute directory the message was saved in (see location_source).
+    Adding a message again replaces its entry, so the index can be kept
+    up to date as new mail is downloaded.
+    """
+
+    def __init__(self, db_path=SEARCH_INDEX_FILE):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        import sqlite3
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(messages)")]
+        if columns and 'source' not in columns:
+            # Written before messages were keyed by directory; rowids are kept so the mail table still matches
+            self.db.execute("ALTER TABLE messages RENAME TO messages_unkeyed")
+        self.db.execute("CREATE TABLE IF NOT EXISTS messages (rowid INTEGER PRIMARY KEY, source TEXT NOT NULL, folder TEXT NOT NULL, "
+                        "email_id TEXT NOT NULL, subject TEXT, sender TEXT, date TEXT, location TEXT, UNIQUE (source, folder, email_id))")
+        if columns and 'source' not in columns:
+            rows = self.db.execute("SELECT rowid, folder, email_id, subject, sender, date, location FROM messages_unkeyed").fetchall()
+            self.db.executemany("INSERT INTO messages (rowid, source, folder, email_id, subject, sender, date, location) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                [(row[0], self.location_source(row[-1]), *row[1:]) for row in rows])
+            self.db.execute("DROP TABLE messages_unkeyed")
+        self.db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS mail USING fts5(subject, sender, recipients, cc, body, attachments, "
+                        "tokenize='unicode61 remove_diacritics 2')")
+        self.db.commit()
+
+    def location_source(self, location):
+        """The directory a message location is in; "<archive_dir>#<id>" is in the archive's parent"""
+        return os.path.dirname(location.split("#", 1)[0]) if location else ""
+
+    def html_to_text(self, html):
+        """Crude tag stripping so HTML-only mail is searchable"""
+        html = re.sub(r'(?is)<(script|style).*?</\1>', ' ', html)
+        return unescape(re.sub(r'<[^>]+>', ' ', html))
+
+    def add(self, email_data, folder, location=None, commit=True):
+        """Index (or re-index) one email_data dict"""
+        content = email_data.get('content', {})
+        body = content.get('text') or self.html_to_text(content.get('html', ''))
+        attachments = " ".join(attachment['filename'] for attachment in content.get('attachments', []))
+        source = self.location_source(location)
+        with self.lock:
+            row = self.db.execute("SELECT rowid FROM messages WHERE source = ? AND folder = ? AND email_id = ?",
+                                  (source, folder, str(email_data['id']))).fetchone()
+            if row:
+                self.db.execute("DELETE FROM mail WHERE rowid = ?", row)
+                self.db.execute("UPDATE messages SET subject = ?, sender = ?, date = ?, location = ? WHERE rowid = ?",
+                                (email_data['subject'], email_data['from'], email_data['date'], location, row[0]))
+                rowid = row[0]
+            else:
+                rowid = self.db.execute("INSERT INTO messages (source, folder, email_id, subject, sender, date, location) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                        (source, folder, str(email_data['id']), email_data['subject'], email_data['from'], email_data['date'],
+                                         location)).lastrowid
+            self.db.execute("INSERT INTO mail (rowid, subject, sender, recipients, cc, body, attachments) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                            (rowid, email_data['subject'], email_data['from'], email_data.get('to', ''), email_data.get('cc', ''), body, attachments))
+            if commit:
+                self.db.commit()
+
+    def contains(self, folder, email_id, location=None):
+        """Whether message email_id of folder saved at location (or anywhere in its directory) is indexed"""
+        with self.lock:
+            return self.db.execute("SELECT 1 FROM messages WHERE source = ? AND folder = ? AND email_id = ?",
+                                   (self.location_source(location), folder, str(email_id))).fetchone() is not None
+
+    def commit(self):
+        with self.lock:
+            self.db.commit()
+
+    def search(self, query, limit=20):
+        """Return the best matches for an FTS5 query, e.g. 'invoice AND sender:flickr'"""
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT m.folder, m.email_id, m.subject, m.sender, m.date, m.location, snippet(mail, 4, '[', ']', '...', 12) "
+                "FROM mail JOIN messages m ON m.rowid = mail.rowid WHERE mail MATCH ? ORDER BY bm25(mail) LIMIT ?",
+                (query, limit)
+            ).fetchall()
+        return [
+            {'folder': folder, 'id': email_id, 'subject': subject, 'from': sender, 'date': date, 'location': location, 'snippet': snippet}
+            for folder, email_id, subject, sender, date, location, snippet in rows
+        ]
+
+    def index_directory(self, output_dir):
+        """Index an existing download directory (JSON files and segment archives), skipping what is already indexed
+
+        Returns the number of newly indexed messages.
+        """
+        added = 0
+        for root, dirs, files in os.walk(os.path.abspath(output_dir)):
+            dirs[:] = [d for d in dirs if d != "attachments"]
+            folder = None
+            summary_file = os.path.join(root, "email_summary.json")
+            if os.path.exists(summary_file):
+                with open(summary_file, 'r', encoding='utf-8') as f:
+                    folder = json.load(f).get('folder')
+            for name in sorted(files):
+                if name.startswith("email_") and name.endswith(".json") and name != "email_summary.json":
+                    path = os.path.join(root, name)
+                    with open(path, 'r', encoding='utf-8') as f:
+                        email_data = json.load(f)
+                    email_folder = folder or os.path.basename(root)
+                    if not self.contains(email_folder, email_data['id'], path):
+                        self.add(email_data, email_folder, location=path, commit=False)
+                        added += 1
+            if os.path.basename(root) == "archive" and ARCHIVE_MANIFEST_FILE in files:
+                reader = ArchiveReader(root)
+                if reader.archive_format == "segments":
+                    parent_summary = os.path.join(os.path.dirname(root), "email_summary.json")
+                    archive_folder = os.path.basename(os.path.dirname(root))
+                    if os.path.exists(parent_summary):
+                        with open(parent_summary, 'r', encoding='utf-8') as f:
+                            archive_folder = json.load(f).get('folder') or archive_folder
+                    for key in reader.keys():
+                        location = f"{root}#{key}"
+                        if not self.contains(archive_folder, key, location):
+                            self.add(reader.get(key), archive_folder, location=location, commit=False)
+                            added += 1
+        self.commit()
+        return added
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+class DedupIndex:
+    """Persistent record of downloaded messages across folders and runs
+
+    Messages are keyed by Message-ID, or by the SHA-256 of the raw
+    message when they have none, and remember where their one saved copy
+    is. Every folder (and UID) a message was seen in is recorded as a
+    membership, so a message that is also in Archive or under a label is
+    stored once. An entry whose saved copy no longer exists on disk does
+    not count, and the message is downloaded again.
+    """
+
+    def __init__(self, db_path=DEDUP_INDEX_FILE):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        import sqlite3
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS messages (rowid INTEGER PRIMARY KEY, message_id TEXT UNIQUE, sha256 TEXT UNIQUE, "
+                        "location TEXT NOT NULL, added TEXT)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS memberships (message INTEGER NOT NULL, folder TEXT NOT NULL, "
+                        "uidvalidity INTEGER NOT NULL DEFAULT 0, uid INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (message, folder, uidvalidity, uid))")
+        self.db.execute("CREATE INDEX IF NOT EXISTS memberships_by_folder ON memberships (folder, uidvalidity, uid)")
+        self.db.commit()
+
+    def keys(self, message_id=None, raw_email=None):
+        """(message_id, sha256) lookup keys; the hash is only used without a Message-ID"""
+        message_id = " ".join((message_id or "").split())
+        if message_id:
+            return message_id, None
+        if raw_email:
+            import hashlib
+            return None, hashlib.sha256(raw_email).hexdigest()
+        return None, None
+
+    def find(self, message_id=None, raw_email=None):
+        """Return (rowid, location) of the saved copy of a message, or None"""
+        message_id, sha256 = self.keys(message_id, raw_email)
+        if not message_id and not sha256:
+            return None
+        with self.lock:
+            if message_id:
+                row = self.db.execute("SELECT rowid, location FROM messages WHERE message_id = ?", (message_id,)).fetchone()
+            else:
+                row = self.db.execute("SELECT rowid, location FROM messages WHERE sha256 = ?", (sha256,)).fetchone()
+        # "<archive_dir>#<key>" locations point into an archive
+        if row and os.path.exists(row[1].split("#", 1)[0]):
+            return row
+        return None
+
+    def add(self, message_id, raw_email, location, folder, uid=0, uidvalidity=0, commit=True):
+        """Record the saved copy of a message and its folder; returns False if it has no usable key"""
+        message_id, sha256 = self.keys(message_id, raw_email)
+        if not message_id and not sha256:
+            return False
+        with self.lock:
+            # A stale entry (its copy was deleted) is pointed at the new copy
+            self.db.execute("INSERT INTO messages (message_id, sha256, location, added) VALUES (?, ?, ?, ?) "
+                            f"ON CONFLICT ({'message_id' if message_id else 'sha256'}) DO UPDATE SET location = excluded.location",
+                            (message_id, sha256, location, datetime.now().isoformat(timespec='seconds')))
+            if message_id:
+                rowid = self.db.execute("SELECT rowid FROM messages WHERE message_id = ?", (message_id,)).fetchone()[0]
+            else:
+                rowid = self.db.execute("SELECT rowid FROM messages WHERE sha256 = ?", (sha256,)).fetchone()[0]
+            self.db.execute("INSERT OR IGNORE INTO memberships (message, folder, uidvalidity, uid) VALUES (?, ?, ?, ?)",
+                            (rowid, folder, uidvalidity or 0, uid or 0))
+            if commit:
+                self.db.commit()
+        return True
+
+    def add_membership(self, rowid, folder, uid=0, uidvalidity=0, commit=True):
+        """Record that an already saved message is also in folder"""
+        with self.lock:
+            self.db.execute("INSERT OR IGNORE INTO memberships (message, folder, uidvalidity, uid) VALUES (?, ?, ?, ?)",
+                            (rowid, folder, uidvalidity or 0, uid or 0))
+            if commit:
+                self.db.commit()
+
+    def folders(self, message_id=None, raw_email=None):
+        """Folders a message has been seen in, as (folder, uid) pairs"""
+        message_id, sha256 = self.keys(message_id, raw_email)
+        with self.lock:
+            return self.db.execute("SELECT m.folder, m.uid FROM memberships m JOIN messages ON messages.rowid = m.message "
+                                   "WHERE messages.message_id = ? OR messages.sha256 = ? ORDER BY m.folder, m.uid",
+                                   (message_id, sha256)).fetchall()
+
+    def member_uids(self, folder, uidvalidity, uids):
+        """The subset of uids recorded as memberships of folder"""
+        uids = set(uids)
+        with self.lock:
+            rows = self.db.execute("SELECT uid FROM memberships WHERE folder = ? AND uidvalidity = ?", (folder, uidvalidity or 0)).fetchall()
+        return {uid for (uid,) in rows if uid in uids}
+
+    def commit(self):
+        with self.lock:
+            self.db.commit()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
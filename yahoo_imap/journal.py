@@ -0,0 +1,174 @@
+'''
+What a download leaves on disk to pick up from: the checkpoint and
+journal of a resumable download, and the per-folder sync and flag state.
+'''
+
+import json
+import os
+import threading
+from datetime import datetime
+
+SYNC_STATE_FILE = "sync_state.json"
+
+# Per-folder mirror of message flags and expunged UIDs (see reconcile_folder)
+FLAGS_FILE = "flags.json"
+
+# Checkpoint and journal of a resumable download (see DownloadJournal)
+PROGRESS_FILE = "progress.json"
+PROGRESS_JOURNAL_FILE = "progress.journal"
+PROGRESS_COMPACT_EVERY = 1000
+
+
+class DownloadJournal:
+    """Crash-safe record of how far a folder download got
+
+    Every saved message is appended to the journal file and fsynced
+    before the next one is saved; the checkpoint file holds the compacted
+    state and is only ever replaced atomically. Messages are committed in
+    ascending UID order, so replaying the journal over the checkpoint is
+    idempotent and a torn last line (crash mid-write) is simply dropped.
+    Messages skipped as duplicates are deferred and committed in UID order
+    among the downloaded ones. Messages the server would not return are
+    recorded as missing: the checkpoint still moves past them, but they
+    are kept in the 'missing' list until a resumed download fetches them.
+    """
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.state_file = os.path.join(output_dir, PROGRESS_FILE)
+        self.journal_file = os.path.join(output_dir, PROGRESS_JOURNAL_FILE)
+        self.lock = threading.Lock()
+        self.journal = None
+        self.uncompacted = 0
+        self.deferred = []
+        self.state = {}
+        if os.path.exists(self.state_file):
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                self.state = json.load(f)
+        if os.path.exists(self.journal_file):
+            with open(self.journal_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    self.apply(record)
+
+    @property
+    def last_uid(self):
+        return self.state.get('last_uid', 0)
+
+    @property
+    def next_index(self):
+        return self.state.get('next_index', 1)
+
+    @property
+    def missing(self):
+        return self.state.get('missing', [])
+
+    def apply(self, record):
+        uid = record['uid']
+        if record.get('missing') or record.get('expunged'):
+            missing = set(self.missing)
+            if record.get('missing'):
+                missing.add(uid)
+            else:
+                missing.discard(uid)
+            self.state['missing'] = sorted(missing)
+            return
+        if uid in self.missing:
+            # Fetched at last; the checkpoint already moved past it
+            self.state['missing'].remove(uid)
+        elif uid <= self.last_uid:
+            return
+        self.state['last_uid'] = max(self.last_uid, uid)
+        self.state['next_index'] = max(self.next_index, record['index'] + 1)
+        if record.get('error'):
+            self.state.setdefault('failed', []).append(record['uid'])
+        elif record.get('duplicate'):
+            self.state['duplicates'] = self.state.get('duplicates', 0) + 1
+        else:
+            self.state['saved'] = self.state.get('saved', 0) + 1
+
+    def start(self, folder, uidvalidity, options):
+        """Begin a new download (or keep the one already recorded)"""
+        if not self.state.get('folder'):
+            self.state.update({'folder': folder, 'uidvalidity': uidvalidity, 'last_uid': 0, 'next_index': 1, 'saved': 0,
+                               'options': options})
+            self.checkpoint()
+
+    def commit(self, uid, index, error=None):
+        """Durably record that message uid (saved as file number index) is done"""
+        record = {'uid': int(uid), 'index': index}
+        if error:
+            record['error'] = error
+        with self.lock:
+            while self.deferred and self.deferred[0] < record['uid']:
+                self.append({'uid': self.deferred.pop(0), 'index': 0, 'duplicate': True})
+            self.append(record)
+
+    def miss(self, uid):
+        """Durably record that message uid could not be fetched, to be fetched again on resume"""
+        with self.lock:
+            self.append({'uid': int(uid), 'missing': True})
+
+    def expunged(self, uids):
+        """Forget missing uids that are no longer on the server"""
+        with self.lock:
+            for uid in uids:
+                self.append({'uid': int(uid), 'expunged': True})
+
+    def defer(self, uids):
+        """Hold skipped uids until a higher uid is committed or commit_deferred() is called
+
+        Deferred uids are not written if the download stops first, so a
+        resumed download looks at them again.
+        """
+        with self.lock:
+            self.deferred = sorted(set(self.deferred) | {int(uid) for uid in uids})
+
+    def commit_deferred(self):
+        """Commit every deferred uid (once nothing below them is left to download)"""
+        with self.lock:
+            while self.deferred:
+                self.append({'uid': self.deferred.pop(0), 'index': 0, 'duplicate': True})
+
+    def append(self, record):
+        """Write one record to the journal and apply it (lock held)"""
+        if self.journal is None:
+            os.makedirs(self.output_dir, exist_ok=True)
+            self.journal = open(self.journal_file, 'a', encoding='utf-8')
+        self.journal.write(json.dumps(record) + "\n")
+        self.journal.flush()
+        os.fsync(self.journal.fileno())
+        self.apply(record)
+        self.uncompacted += 1
+        if self.uncompacted >= PROGRESS_COMPACT_EVERY:
+            self.compact()
+
+    def checkpoint(self):
+        with self.lock:
+            self.compact()
+
+    def compact(self):
+        """Atomically replace the checkpoint, then empty the journal (lock held)"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.state['updated'] = datetime.now().isoformat(timespec='seconds')
+        tmp_file = self.state_file + ".tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.state_file)
+        if self.journal:
+            self.journal.close()
+        self.journal = open(self.journal_file, 'w', encoding='utf-8')
+        self.uncompacted = 0
+
+    def close(self):
+        with self.lock:
+            if self.state:
+                self.compact()
+            if self.journal:
+                self.journal.close()
+                self.journal = None
@@ -0,0 +1,207 @@
+'''
+Run metrics: counters and latency histograms, exported as JSON and
+Prometheus text.
+'''
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+# Run metrics written next to the downloads (see Metrics)
+METRICS_FILE = "metrics.json"
+METRICS_PREFIX = "yahoo_email_"
+
+
+class Metrics:
+    """Counters and latency histograms for a download, shared by its threads
+
+    Metrics have Prometheus-style names and optional labels, e.g.
+    inc("errors_total", stage="parse") or
+    observe("imap_command_seconds", 0.2, command="FETCH"). The
+    instrumented names are imap_command_seconds{command},
+    bytes_received_total, messages_total, parse_seconds (includes
+    attachment writes), attachment_write_seconds, attachment_bytes_total,
+    save_seconds, duplicates_total, retries_total and errors_total{stage}. report() adds a
+    network/parse/disk time split to tell where a slow run spent its time.
+    """
+
+    BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.started = datetime.now()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {'buckets': [0] * len(self.BUCKETS), 'count': 0, 'sum': 0.0, 'max': 0.0}
+            for n, bound in enumerate(self.BUCKETS):
+                if seconds <= bound:
+                    histogram['buckets'][n] += 1
+                    break
+            histogram['count'] += 1
+            histogram['sum'] += seconds
+            histogram['max'] = max(histogram['max'], seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observe the duration of a with block"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def state(self):
+        """Picklable copy of the metrics, for merge() in another process"""
+        with self.lock:
+            return dict(self.counters), {key: dict(h, buckets=list(h['buckets'])) for key, h in self.histograms.items()}
+
+    def merge(self, state):
+        """Add the metrics of a state() (e.g. from a worker process)"""
+        counters, histograms = state
+        with self.lock:
+            for key, value in counters.items():
+                self.counters[key] = self.counters.get(key, 0) + value
+            for key, other in histograms.items():
+                histogram = self.histograms.setdefault(key, {'buckets': [0] * len(self.BUCKETS), 'count': 0, 'sum': 0.0, 'max': 0.0})
+                histogram['buckets'] = [a + b for a, b in zip(histogram['buckets'], other['buckets'])]
+                histogram['count'] += other['count']
+                histogram['sum'] += other['sum']
+                histogram['max'] = max(histogram['max'], other['max'])
+
+    def total(self, name, **labels):
+        """Counter value, or histogram sum, of name summed over the labels not given"""
+        wanted = set(labels.items())
+        with self.lock:
+            counted = sum(value for (key, key_labels), value in self.counters.items() if key == name and wanted <= set(key_labels))
+            timed = sum(h['sum'] for (key, key_labels), h in self.histograms.items() if key == name and wanted <= set(key_labels))
+        return counted + timed
+
+    def time_split(self):
+        """Seconds spent on the network, parsing and writing to disk"""
+        attachment_writes = self.total("attachment_write_seconds")
+        return {
+            'network': self.total("imap_command_seconds", command="FETCH"),
+            'parse': max(0.0, self.total("parse_seconds") - attachment_writes),
+            'disk': self.total("save_seconds") + attachment_writes
+        }
+
+    def progress_line(self, done, total, started):
+        """'Processed done/total' with the rate, bytes received, ETA and time split since started (a perf_counter value)"""
+        elapsed = time.perf_counter() - started
+        rate = done / elapsed if elapsed > 0 else 0
+        eta = timedelta(seconds=round((total - done) / rate)) if rate else "?"
+        split = self.time_split()
+        busy = sum(split.values()) or 1
+        return (f"Processed {done}/{total} messages ({rate:.1f} msg/s, {self.total('bytes_received_total') / 1e6:.1f} MB received, "
+                f"ETA {eta}; " + " ".join(f"{stage} {seconds / busy:.0%}" for stage, seconds in split.items()) + ")")
+
+    def series_name(self, name, labels, extra=()):
+        labels = list(labels) + list(extra)
+        if not labels:
+            return name
+        return name + "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+    def report(self):
+        """JSON-ready dict of every metric plus the time split"""
+        with self.lock:
+            counters = {self.series_name(name, labels): value for (name, labels), value in sorted(self.counters.items())}
+            histograms = {}
+            for (name, labels), h in sorted(self.histograms.items()):
+                entry = {'count': h['count'], 'sum': round(h['sum'], 6), 'mean': round(h['sum'] / h['count'], 6) if h['count'] else 0,
+                         'max': round(h['max'], 6)}
+                # Upper bucket bounds of the 50th and 95th percentile
+                for quantile in (0.5, 0.95):
+                    seen = 0
+                    for bound, count in zip(self.BUCKETS, h['buckets']):
+                        seen += count
+                        if seen >= quantile * h['count']:
+                            break
+                    else:
+                        bound = h['max']
+                    entry[f"p{int(quantile * 100)}_le"] = bound
+                histograms[self.series_name(name, labels)] = entry
+        split = self.time_split()
+        busy = sum(split.values()) or 1
+        return {
+            'started': self.started.isoformat(timespec='seconds'),
+            'seconds': round((datetime.now() - self.started).total_seconds(), 2),
+            'counters': counters,
+            'histograms': histograms,
+            'time_split': {stage: {'seconds': round(seconds, 3), 'share': round(seconds / busy, 3)} for stage, seconds in split.items()}
+        }
+
+    def prometheus_text(self, prefix=METRICS_PREFIX):
+        """The metrics in the Prometheus text exposition format"""
+        lines = []
+        with self.lock:
+            typed = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in typed:
+                    typed.add(name)
+                    lines.append(f"# TYPE {prefix}{name} counter")
+                lines.append(f"{self.series_name(prefix + name, labels)} {value}")
+            for (name, labels), h in sorted(self.histograms.items()):
+                if name not in typed:
+                    typed.add(name)
+                    lines.append(f"# TYPE {prefix}{name} histogram")
+                cumulative = 0
+                for bound, count in zip(self.BUCKETS, h['buckets']):
+                    cumulative += count
+                    lines.append(f"{self.series_name(prefix + name + '_bucket', labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{self.series_name(prefix + name + '_bucket', labels, [('le', '+Inf')])} {h['count']}")
+                lines.append(f"{self.series_name(prefix + name + '_sum', labels)} {h['sum']:.6f}")
+                lines.append(f"{self.series_name(prefix + name + '_count', labels)} {h['count']}")
+        return "\n".join(lines) + "\n"
+
+    def write_json(self, path):
+        """Write report() to path and return the path"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, indent=2)
+        return path
+
+    def write_prometheus(self, path):
+        """Write prometheus_text() to path atomically (for node_exporter's textfile collector)"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path + ".tmp", 'w', encoding='utf-8') as f:
+            f.write(self.prometheus_text())
+        os.replace(path + ".tmp", path)
+        return path
+
+    def serve(self, port, host="127.0.0.1"):
+        """Serve prometheus_text() at http://host:port/metrics from a daemon thread; returns the server"""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus_text().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
@@ -0,0 +1,148 @@
+'''
+Header decoding and Content-Transfer-Encoding helpers shared by the parsers.
+'''
+
+import binascii
+import codecs
+import re
+from functools import lru_cache
+
+# How much of each message parse_message() reads: everything, headers plus the
+# first text part (no HTML or binary decoding unless needed), or headers only
+PARSE_MODES = ("full", "text", "headers")
+
+# email package policies; "default" gives lazily parsed, already decoded header objects
+# (see load_email_policy)
+EMAIL_POLICIES = ("compat32", "default")
+
+# Decoded header values kept by decode_header_value(); newsletters repeat the same ones
+HEADER_CACHE_SIZE = 8192
+
+# Charset labels seen in mail, mapped to the codec that decodes them best (None: unknown, use UTF-8)
+CHARSET_ALIASES = {
+    'ks_c_5601-1987': 'cp949',
+    'ks_c_5601': 'cp949',
+    'ks_c_5601-1989': 'cp949',
+    'x-gbk': 'gbk',
+    'gb2312': 'gbk',
+    'x-gb2312': 'gbk',
+    'gb_2312-80': 'gbk',
+    'x-sjis': 'shift_jis',
+    'shift-jis': 'shift_jis',
+    'x-euc-jp': 'euc_jp',
+    'x-euc-kr': 'euc_kr',
+    'iso-8859-8-i': 'iso-8859-8',
+    'iso-8859-6-i': 'iso-8859-6',
+    'windows-874': 'cp874',
+    'x-mac-roman': 'mac_roman',
+    'macintosh': 'mac_roman',
+    'unicode-1-1-utf-7': 'utf-7',
+    'utf8mb4': 'utf-8',
+    'unknown-8bit': None,
+    'x-unknown': None,
+    'unknown': None,
+    'default': None,
+}
+
+
+@lru_cache(maxsize=256)
+def resolve_codec(charset):
+    """Python codec name for a MIME charset label, or None if it is unknown
+
+    Labels are normalized (case, quotes, whitespace) and mapped through
+    CHARSET_ALIASES; the result is cached, so a bogus charset repeated
+    over thousands of messages is only looked up once.
+    """
+    if not charset:
+        return None
+    label = charset.strip().strip('"\'').lower()
+    if label in CHARSET_ALIASES:
+        return CHARSET_ALIASES[label]
+    try:
+        return codecs.lookup(label).name
+    except LookupError:
+        return None
+
+
+@lru_cache(maxsize=None)
+def load_email_policy(name):
+    """email policy object for an EMAIL_POLICIES name
+
+    email.policy is slow to import, so it is imported on the first parse
+    rather than at startup.
+    """
+    from email import policy
+    return getattr(policy, name)
+
+
+@lru_cache(maxsize=HEADER_CACHE_SIZE)
+def decode_header_value(value):
+    """Decode the MIME encoded words of a header string, cached by value
+
+    Values without encoded words are returned as they are.
+    """
+    if "=?" not in value:
+        return value
+    return decode_encoded_words(value)
+
+
+def decode_encoded_words(value):
+    """Decode a header string or Header object with decode_header()
+
+    Parts in an unknown charset, or that do not decode in theirs, fall
+    back to UTF-8.
+    """
+    from email.header import decode_header
+    decoded_parts = []
+    for part, encoding in decode_header(value):
+        if isinstance(part, bytes):
+            codec = resolve_codec(encoding)
+            if codec:
+                try:
+                    decoded_parts.append(part.decode(codec))
+                    continue
+                except UnicodeDecodeError:
+                    pass
+            decoded_parts.append(part.decode('utf-8', errors='ignore'))
+        else:
+            decoded_parts.append(str(part))
+    return ''.join(decoded_parts)
+
+
+class TransferDecoder:
+    """Incremental Content-Transfer-Encoding decoder for arbitrary chunks
+
+    decode() can be fed a part's body in pieces split anywhere (e.g.
+    BODY[n]<offset.length> ranges); flush() returns whatever is left.
+    """
+
+    def __init__(self, encoding):
+        self.encoding = (encoding or "7bit").lower()
+        self.leftover = b''
+
+    def decode(self, data):
+        if self.encoding == 'base64':
+            data = self.leftover + re.sub(rb'[^A-Za-z0-9+/=]', b'', data)
+            usable = len(data) - len(data) % 4
+            self.leftover = data[usable:]
+            return binascii.a2b_base64(data[:usable]) if usable else b''
+        if self.encoding == 'quoted-printable':
+            # Only decode complete lines so "=XX" and soft breaks are never split
+            data = self.leftover + data
+            end = data.rfind(b'\n') + 1
+            self.leftover = data[end:]
+            return binascii.a2b_qp(data[:end])
+        return data
+
+    def flush(self):
+        data, self.leftover = self.leftover, b''
+        if not data:
+            return b''
+        if self.encoding == 'base64':
+            try:
+                return binascii.a2b_base64(data + b'=' * (-len(data) % 4))
+            except binascii.Error:
+                return b''
+        if self.encoding == 'quoted-printable':
+            return binascii.a2b_qp(data)
+        return data
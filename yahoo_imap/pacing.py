@@ -0,0 +1,223 @@
+'''
+How hard and how often an account is talked to: connection limits,
+reconnect backoff, IDLE renewal, and adaptive FETCH sizing with an
+optional rate cap.
+'''
+
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from .metrics import Metrics
+
+# Reconnect backoff: 2s, 4s, 8s ... capped at 5 minutes
+RECONNECT_BASE_DELAY = 2
+RECONNECT_MAX_DELAY = 300
+RECONNECT_MAX_RETRIES = 10
+
+# --watch: IDLE is renewed this often (RFC 2177 allows 29 minutes, NAT
+# gateways often drop quiet connections sooner); without IDLE the
+# selected folder is polled with NOOP every POLL_INTERVAL seconds
+IDLE_TIMEOUT = 9 * 60
+IDLE_RESPONSE_TIMEOUT = 30
+POLL_INTERVAL = 60
+
+# Yahoo starts refusing or dropping sessions beyond a handful per account
+MAX_CONNECTIONS_PER_ACCOUNT = 8
+
+# --adaptive (see AdaptiveFetchController): FETCH batch sizes stay within these
+# bounds and are tuned so one FETCH takes about ADAPTIVE_TARGET_SECONDS
+ADAPTIVE_MIN_BATCH = 1
+ADAPTIVE_MAX_BATCH = 500
+ADAPTIVE_TARGET_SECONDS = 2.0
+# Weight of the newest sample in the round-trip and bytes/sec averages
+ADAPTIVE_SMOOTHING = 0.3
+
+# Response codes of servers that want a client to slow down (RFC 5530 and Yahoo's own)
+THROTTLE_CODES = ("UNAVAILABLE", "LIMIT", "THROTTLED", "OVERQUOTA")
+
+
+class TokenBucket:
+    """Byte-rate limit shared by connections, threads or asyncio tasks
+
+    Taking n tokens puts the bucket in debt once it is empty, and the
+    caller then waits until the debt is paid back at rate bytes per
+    second: wait(n) sleeps, consume(n) is the asyncio version. burst is
+    how many bytes may go through at full speed after an idle period.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self, n):
+        """Take n tokens and return how many seconds the caller has to wait"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= n
+            return -self.tokens / self.rate if self.tokens < 0 else 0
+
+    def wait(self, n):
+        delay = self.take(n)
+        if delay:
+            time.sleep(delay)
+
+    async def consume(self, n):
+        delay = self.take(n)
+        if delay:
+            import asyncio
+            await asyncio.sleep(delay)
+
+
+class AdaptiveFetchController:
+    """Tunes the FETCH batch size and FETCH commands in flight of one account
+
+    Works like TCP congestion control, driven by what the server does:
+
+    - Batch size. It doubles after every FETCH answered within
+      target_seconds (slow start) and grows by a tenth once it has been
+      throttled before (additive increase).
+    - Slow answers. A FETCH slower than target_seconds shrinks the batch
+      in proportion to how much too slow it was.
+    - Throttling. A throttling response (THROTTLE_CODES, or BYE and
+      dropped connections, see throttled()) halves the batch size and the
+      commands in flight, and pauses all FETCHes of the account with
+      exponential backoff (multiplicative decrease). [LIMIT] only says
+      the FETCH was too big, so it halves the batch and caps it below the
+      refused size without pausing.
+    - Commands in flight. The number of FETCHes in flight (in_flight) is
+      raised by one while the averaged bytes/sec keeps improving, up to
+      max_in_flight. The threaded connections of an account share it
+      through slot(); the asyncio backend uses it as its pipeline depth.
+    - Rate cap. bucket is an optional TokenBucket capping the account's
+      bytes per second.
+
+    One controller is shared by all connections of an account and is
+    thread-safe.
+    """
+
+    def __init__(self, batch_size=10, min_batch=ADAPTIVE_MIN_BATCH, max_batch=ADAPTIVE_MAX_BATCH, max_in_flight=MAX_CONNECTIONS_PER_ACCOUNT,
+                 target_seconds=ADAPTIVE_TARGET_SECONDS, bucket=None, metrics=None):
+        self.min_batch = max(1, min_batch)
+        self.max_batch = max(self.min_batch, max_batch)
+        self.batch = float(min(self.max_batch, max(self.min_batch, batch_size or 1)))
+        # Slow start ends here; lowered by every throttling response
+        self.threshold = float(self.max_batch)
+        self.max_in_flight = max(1, max_in_flight)
+        self.in_flight = 1
+        self.target_seconds = target_seconds
+        self.bucket = bucket
+        self.metrics = metrics or Metrics()
+        self.rtt = None
+        self.rate = None
+        self.last_record = None
+        self.rate_at_raise = 0
+        self.throttles = 0
+        self.consecutive_throttles = 0
+        self.resume_at = 0
+        self.active = 0
+        self.condition = threading.Condition()
+
+    @property
+    def batch_size(self):
+        return int(self.batch)
+
+    @staticmethod
+    def throttle_reason(response):
+        """The THROTTLE_CODES code in a response text (str, bytes or a list of them), or None"""
+        if isinstance(response, (list, tuple)):
+            response = b" ".join(item if isinstance(item, bytes) else str(item).encode() for item in response if item is not None)
+        if isinstance(response, bytes):
+            response = response.decode(errors='replace')
+        match = re.search(r'\[(' + "|".join(THROTTLE_CODES) + r')[\] ]', str(response or ""))
+        return match.group(1) if match else None
+
+    def pause(self):
+        """Seconds left of the pause after the last throttling response"""
+        return max(0, self.resume_at - time.monotonic())
+
+    @contextmanager
+    def slot(self):
+        """Hold one of the account's in_flight FETCH slots, waiting for a free one and for any pause"""
+        with self.condition:
+            while self.active >= self.in_flight:
+                self.condition.wait()
+            self.active += 1
+        try:
+            delay = self.pause()
+            if delay:
+                time.sleep(delay)
+            yield
+        finally:
+            with self.condition:
+                self.active -= 1
+                self.condition.notify_all()
+
+    def record(self, messages, nbytes, seconds):
+        """Feed back a FETCH of messages messages (nbytes) that took seconds"""
+        with self.condition:
+            self.consecutive_throttles = 0
+            smoothing = ADAPTIVE_SMOOTHING
+            self.rtt = seconds if self.rtt is None else (1 - smoothing) * self.rtt + smoothing * seconds
+            # Bytes/sec of the whole account, so time spent parsing and waiting counts too
+            now = time.monotonic()
+            elapsed = now - self.last_record if self.last_record else seconds
+            self.last_record = now
+            if elapsed > 0:
+                rate = nbytes / elapsed
+                self.rate = rate if self.rate is None else (1 - smoothing) * self.rate + smoothing * rate
+
+            if seconds > self.target_seconds:
+                # Aim for a FETCH that takes target_seconds; messages can be smaller than the batch at the end of a folder
+                self.batch = max(self.min_batch, min(self.batch, messages * self.target_seconds / seconds))
+                self.threshold = self.batch
+            elif messages >= self.batch_size:
+                if self.batch < self.threshold:
+                    self.batch = min(self.threshold, self.batch * 2)
+                else:
+                    self.batch += max(1.0, self.batch / 10)
+                self.batch = min(self.batch, self.max_batch)
+
+            # One more command in flight while that keeps paying off in bytes/sec
+            if self.rate is not None and seconds <= self.target_seconds:
+                if self.in_flight < self.max_in_flight and self.rate > self.rate_at_raise * 1.1:
+                    self.rate_at_raise = self.rate
+                    self.in_flight += 1
+                    self.condition.notify_all()
+                elif self.in_flight > 1 and self.rate < self.rate_at_raise * 0.8:
+                    self.in_flight -= 1
+                    self.rate_at_raise = self.rate
+
+    def throttled(self, reason, messages=None):
+        """React to a throttling response (a THROTTLE_CODES code, or "BYE") to a FETCH of messages messages"""
+        with self.condition:
+            self.throttles += 1
+            self.threshold = max(self.min_batch, min(self.batch, messages or self.batch) / 2)
+            self.batch = self.threshold
+            delay = 0
+            if reason == "LIMIT":
+                # The FETCH was too big, not too fast: stay below its size from now on, no pause
+                if messages:
+                    self.max_batch = max(self.min_batch, min(self.max_batch, messages - 1))
+            else:
+                self.consecutive_throttles += 1
+                self.in_flight = max(1, self.in_flight // 2)
+                self.rate_at_raise = self.rate or 0
+                delay = min(RECONNECT_MAX_DELAY, RECONNECT_BASE_DELAY * 2 ** (self.consecutive_throttles - 1))
+                self.resume_at = max(self.resume_at, time.monotonic() + delay)
+        self.metrics.inc("throttled_total", reason=reason)
+        print(f"Server throttling ({reason}): batch size {self.batch_size}, {self.in_flight} FETCH in flight"
+              + (f", pausing {delay:.0f}s" if delay else ""))
+
+    def describe(self):
+        """One line with the current settings and averages"""
+        rtt = f"{self.rtt:.2f}s" if self.rtt is not None else "-"
+        rate = f"{self.rate / 1e6:.2f} MB/s" if self.rate is not None else "-"
+        return (f"Adaptive fetch: batch size {self.batch_size}, {self.in_flight} FETCH in flight, round trip {rtt}, {rate}, "
+                f"throttled {self.throttles} time(s)")
@@ -0,0 +1,231 @@
+'''
+Attachment post-processing: the plugins behind --postprocess and the
+pool that runs them as attachments are parsed.
+'''
+
+import fnmatch
+import importlib.util
+import io
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+# Attachment post-processing (see AttachmentPostProcessor): bigger attachments are
+# skipped, extracted text is cut off, results of this many distinct blobs are cached
+POSTPROCESS_MAX_SIZE = 50 * 1024 * 1024
+POSTPROCESS_TEXT_LIMIT = 100_000
+POSTPROCESS_CACHE_SIZE = 1024
+THUMBNAIL_SIZE = (256, 256)
+THUMBNAIL_SUFFIX = ".thumb.jpg"
+
+
+class AttachmentPlugin(ABC):
+    """Base class for attachment post-processing plugins (see AttachmentPostProcessor)
+
+    process(data, info) gets the decoded bytes of an attachment and its
+    metadata dict and returns something JSON-serialisable, or None to
+    record nothing; the result is stored under the plugin's name in the
+    attachment's 'processed' dict. content_types are shell patterns of
+    the content types the plugin wants. Plugins run concurrently in
+    worker threads or processes, so process() must not change shared state.
+    Subclasses that do not define process() cannot be instantiated.
+    """
+
+    name = None
+    content_types = ("*",)
+
+    def available(self):
+        """False when an optional dependency is missing"""
+        return True
+
+    def matches(self, info):
+        return any(fnmatch.fnmatch(info['content_type'], pattern) for pattern in self.content_types)
+
+    @abstractmethod
+    def process(self, data, info):
+        """The plugin's result for one attachment, or None"""
+
+
+class HashPlugin(AttachmentPlugin):
+    """Hex digest of the attachment with a hashlib algorithm"""
+
+    def __init__(self, algorithm):
+        self.name = algorithm
+        self.algorithm = algorithm
+
+    def process(self, data, info):
+        import hashlib
+        return hashlib.new(self.algorithm, data).hexdigest()
+
+
+class TextPlugin(AttachmentPlugin):
+    """Plain text of text/* attachments, and of PDFs when pypdf is installed"""
+
+    name = "text"
+    content_types = ("text/*", "application/pdf")
+
+    def process(self, data, info):
+        if info['content_type'] != "application/pdf":
+            return bytes(data[:POSTPROCESS_TEXT_LIMIT * 4]).decode('utf-8', errors='replace')[:POSTPROCESS_TEXT_LIMIT]
+        try:
+            import pypdf
+        except ImportError:
+            return None
+        text = ""
+        for page in pypdf.PdfReader(io.BytesIO(data)).pages:
+            text += (page.extract_text() or "") + "\n"
+            if len(text) >= POSTPROCESS_TEXT_LIMIT:
+                break
+        return text[:POSTPROCESS_TEXT_LIMIT]
+
+
+class ThumbnailPlugin(AttachmentPlugin):
+    """JPEG thumbnail of images, saved next to the stored blob; needs Pillow
+
+    Returns the thumbnail's path. Attachments that are not being saved
+    get no thumbnail.
+    """
+
+    name = "thumbnail"
+    content_types = ("image/*",)
+
+    def available(self):
+        return importlib.util.find_spec("PIL") is not None
+
+    def process(self, data, info):
+        if not info.get('saved_path'):
+            return None
+        from PIL import Image
+        path = info['saved_path'] + THUMBNAIL_SUFFIX
+        if not os.path.exists(path):
+            with Image.open(io.BytesIO(data)) as image:
+                image.thumbnail(THUMBNAIL_SIZE)
+                image.convert("RGB").save(path + ".tmp", "JPEG")
+            os.replace(path + ".tmp", path)
+        return path
+
+
+# --postprocess names
+ATTACHMENT_PLUGINS = {
+    "md5": lambda: HashPlugin("md5"),
+    "sha1": lambda: HashPlugin("sha1"),
+    "blake2b": lambda: HashPlugin("blake2b"),
+    "text": TextPlugin,
+    "thumbnail": ThumbnailPlugin,
+}
+
+
+def run_attachment_plugins(plugins, data, info):
+    """Pool task for AttachmentPostProcessor: return {name: (result, seconds, error)}"""
+    results = {}
+    for plugin in plugins:
+        started = time.perf_counter()
+        try:
+            results[plugin.name] = (plugin.process(data, info), time.perf_counter() - started, None)
+        except Exception as e:
+            results[plugin.name] = (None, time.perf_counter() - started, f"{type(e).__name__}: {e}")
+    return results
+
+
+class AttachmentPostProcessor:
+    """Runs AttachmentPlugins on attachments as they come out of the parser
+
+    The parsers call submit() with the decoded bytes of every attachment,
+    so attachments are never read back from disk, and the matching
+    plugins run on a pool of workers threads (processes with
+    processes=True; workers=0 runs them inline). resolve() waits for an
+    email's attachments and records the results in their 'processed'
+    dicts; save_email() calls it before writing the email. Results are
+    cached by SHA-256, so an attachment repeated across messages is
+    processed once. Attachments over max_size bytes are skipped.
+    """
+
+    def __init__(self, plugins, workers=4, processes=False, max_size=POSTPROCESS_MAX_SIZE, metrics=None):
+        self.plugins = []
+        for plugin in plugins:
+            if plugin.available():
+                self.plugins.append(plugin)
+            else:
+                print(f"Attachment plugin {plugin.name} is not available (missing optional dependency), skipping it")
+        self.workers = workers
+        self.max_size = max_size
+        self.metrics = metrics
+        self.executor = None
+        if workers and processes:
+            from concurrent.futures import ProcessPoolExecutor
+            self.executor = ProcessPoolExecutor(max_workers=workers)
+        elif workers:
+            from concurrent.futures import ThreadPoolExecutor
+            self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_names(cls, names, **kwargs):
+        """Build a post-processor from ATTACHMENT_PLUGINS names"""
+        return cls([ATTACHMENT_PLUGINS[name]() for name in names], **kwargs)
+
+    @property
+    def names(self):
+        return [plugin.name for plugin in self.plugins]
+
+    def wants(self, info, size=None):
+        """True if some plugin would process this attachment"""
+        if size is not None and size > self.max_size:
+            return False
+        return any(plugin.matches(info) for plugin in self.plugins)
+
+    def submit(self, info, data):
+        """Schedule the plugins for one attachment's bytes (info is its metadata dict)"""
+        plugins = [plugin for plugin in self.plugins if plugin.matches(info)]
+        if not plugins or not data or len(data) > self.max_size:
+            return
+        key = info.get('sha256')
+        with self.lock:
+            future = self.cache.get(key) if key else None
+            cached = future is not None
+            if cached:
+                self.cache.move_to_end(key)
+            else:
+                if self.executor:
+                    future = self.executor.submit(run_attachment_plugins, plugins, data, dict(info))
+                else:
+                    from concurrent.futures import Future
+                    future = Future()
+                    future.set_result(run_attachment_plugins(plugins, data, info))
+                if key:
+                    self.cache[key] = future
+                    if len(self.cache) > POSTPROCESS_CACHE_SIZE:
+                        self.cache.popitem(last=False)
+        # Collected by resolve() before the email is saved
+        info['_postprocess'] = (future, cached)
+
+    def resolve(self, attachments):
+        """Wait for the attachments' plugins and store their results in info['processed']"""
+        for info in attachments:
+            pending = info.pop('_postprocess', None)
+            if pending is None:
+                continue
+            future, cached = pending
+            try:
+                results = future.result()
+            except Exception as e:
+                print(f"  Error post-processing {info['filename']}: {e}")
+                if self.metrics:
+                    self.metrics.inc("errors_total", stage="postprocess")
+                continue
+            for name, (result, seconds, error) in results.items():
+                if self.metrics and not cached:
+                    self.metrics.observe("postprocess_seconds", seconds, plugin=name)
+                if error:
+                    print(f"  Error running {name} on {info['filename']}: {error}")
+                    if self.metrics:
+                        self.metrics.inc("errors_total", stage="postprocess")
+                elif result is not None:
+                    info.setdefault('processed', {})[name] = result
+
+    def close(self):
+        if self.executor:
+            self.executor.shutdown()
@@ -0,0 +1,309 @@
+'''
+Several connections to one account: the parallel folder downloader and
+the --watch daemon.
+'''
+
+import imaplib
+import os
+import queue
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from datetime import datetime
+
+from .archive import ArchiveWriter, SummaryWriter
+from .client import YahooEmailRetriever
+from .metrics import Metrics
+from .pacing import (IDLE_TIMEOUT, MAX_CONNECTIONS_PER_ACCOUNT, POLL_INTERVAL, RECONNECT_BASE_DELAY, RECONNECT_MAX_DELAY,
+                     RECONNECT_MAX_RETRIES)
+from .store import AttachmentStore
+
+
+class RetrieverPool:
+    """A capped pool of authenticated connections to one account
+
+    Each pooled YahooEmailRetriever keeps its own selected folder. The
+    download_folders scheduler spreads folders and UID ranges over the
+    pool's connections with one worker thread per connection.
+    """
+
+    def __init__(self, username, password, *, size=4, max_connections=MAX_CONNECTIONS_PER_ACCOUNT, metrics=None, parse_mode="full",
+                 email_policy="compat32", postprocessor=None, controller=None):
+        self.username = username
+        self.password = password
+        self.metrics = metrics or Metrics()
+        self.parse_mode = parse_mode
+        self.email_policy = email_policy
+        self.postprocessor = postprocessor
+        self.controller = controller
+        if size > max_connections:
+            print(f"Capping connection pool at {max_connections} connections per account")
+        self.size = max(1, min(size, max_connections))
+        self.retrievers = []
+        self.idle = queue.Queue()
+
+    def create_retriever(self):
+        """Create an (unconnected) retriever for the pool"""
+        return YahooEmailRetriever(metrics=self.metrics, parse_mode=self.parse_mode, email_policy=self.email_policy,
+                                   postprocessor=self.postprocessor, controller=self.controller)
+
+    def open(self):
+        """Open and authenticate the pool's connections, return how many succeeded"""
+        def open_one(_):
+            retriever = self.create_retriever()
+            return retriever if retriever.connect(self.username, self.password) else None
+
+        with ThreadPoolExecutor(max_workers=self.size) as executor:
+            for retriever in executor.map(open_one, range(self.size)):
+                if retriever:
+                    self.retrievers.append(retriever)
+                    self.idle.put(retriever)
+        print(f"Opened {len(self.retrievers)}/{self.size} pooled connections")
+        return len(self.retrievers)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a retriever from the pool for the duration of a with block"""
+        retriever = self.idle.get()
+        try:
+            yield retriever
+        finally:
+            self.idle.put(retriever)
+
+    def close(self):
+        """Disconnect every pooled connection"""
+        for retriever in self.retrievers:
+            retriever.disconnect()
+        self.retrievers = []
+        self.idle = queue.Queue()
+
+    def list_uids(self, folder, criteria=None):
+        """Return the UIDs in a folder matching criteria, in ascending order"""
+        with self.connection() as retriever:
+            if retriever.select_folder(folder) is None:
+                print(f"Error selecting folder {folder}")
+                return []
+            data = retriever.search_messages(criteria, use_uid=True)
+            if data is None:
+                print(f"Error searching for messages in {folder}")
+                return []
+            return sorted(int(uid) for uid in data)
+
+    def download_chunk(self, folder, uids, start_index, output_dir, *, save_attachments, batch_size, streaming=False, store=None,
+                       archive=None, search_index=None, dedup=None, summary=None):
+        """Download one UID range of a folder on whichever connection is free
+
+        Each saved email is added to summary (a SummaryWriter) instead of
+        being kept; returns how many emails were saved.
+        """
+        saved = 0
+        with self.connection() as retriever:
+            for email_data in retriever.iter_emails(
+                folder=folder,
+                output_dir=output_dir,
+                save_attachments=save_attachments,
+                batch_size=batch_size,
+                streaming=streaming,
+                uids=uids,
+                start_index=start_index,
+                save_summary=False,
+                store=store,
+                archive=archive,
+                search_index=search_index,
+                dedup=dedup
+            ):
+                if summary:
+                    summary.add(email_data)
+                saved += 1
+        return saved
+
+    def download_folders(self, folders, output_dir, *, chunk_size=1000, save_attachments=True, batch_size=100, streaming=False,
+                         criteria=None, archive_format="json", search_index=None, dedup=None):
+        """Download several folders in parallel
+
+        Every folder is split into UID ranges of chunk_size messages and the
+        ranges are spread across the pool. Each folder is written to its own
+        subdirectory of output_dir with a summary covering all its ranges,
+        written as the messages are saved (so in that order). Returns a
+        dict of folder -> number of emails saved.
+        """
+        if not self.retrievers:
+            print("Connection pool is not open")
+            return {}
+
+        workers = len(self.retrievers)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            folder_uids = dict(zip(folders, executor.map(lambda folder: self.list_uids(folder, criteria), folders)))
+
+        folder_dirs = {}
+        tasks = []
+        for folder, uids in folder_uids.items():
+            folder_dirs[folder] = os.path.join(output_dir, self.retrievers[0].folder_dir_name(folder))
+            for start in range(0, len(uids), chunk_size):
+                tasks.append((folder, uids[start:start + chunk_size], start + 1))
+        print(f"Downloading {sum(len(uids) for uids in folder_uids.values())} messages from {len(folders)} folders "
+              f"in {len(tasks)} ranges over {workers} connections")
+
+        # One attachment store shared by all folders and connections, one archive per folder
+        store = AttachmentStore(os.path.join(output_dir, "attachments"), self.metrics) if save_attachments else None
+        archives = {}
+        if archive_format != "json":
+            archives = {folder: ArchiveWriter(os.path.join(folder_dirs[folder], "archive"), archive_format) for folder in folders}
+        summaries = {folder: SummaryWriter(folder_dirs[folder], folder, save_attachments) for folder in folders}
+        results = {folder: 0 for folder in folders}
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {
+                    executor.submit(self.download_chunk, folder, uids, start_index, folder_dirs[folder], save_attachments=save_attachments,
+                                    batch_size=batch_size, streaming=streaming, store=store, archive=archives.get(folder),
+                                    search_index=search_index, dedup=dedup, summary=summaries[folder]): (folder, start_index)
+                    for folder, uids, start_index in tasks
+                }
+                for future in as_completed(futures):
+                    folder, start_index = futures[future]
+                    try:
+                        results[folder] += future.result()
+                    except Exception as e:
+                        print(f"Error downloading {folder} from message {start_index}: {e}")
+        finally:
+            if store:
+                store.close()
+            for archive in archives.values():
+                archive.close()
+            for folder, summary in summaries.items():
+                summary_file = summary.close()
+                print(f"{folder}: {results[folder]} emails, summary saved to {summary_file}")
+        return results
+
+
+class SyncDaemon:
+    """Keep folders of one account in sync as new mail arrives (--watch)
+
+    Every folder gets its own connection, since IDLE only watches the
+    selected folder. Each connection catches up with sync_folder() and
+    then waits for new mail (see wait_for_mail), running sync_folder()
+    again whenever the folder grows; that only asks the server for UIDs
+    above the high-water mark. With reconcile, every sync and every IDLE
+    renewal is followed by reconcile_folder(), so flag changes and
+    deletions are mirrored too. Dropped connections are reopened with
+    exponential backoff. stop() ends the watch loops at their next
+    wake-up.
+    """
+
+    def __init__(self, username, password, folders, *, output_dir="yahoo_emails", save_attachments=True, batch_size=100, streaming=False,
+                 criteria=None, archive_format="json", search_index=None, workers=0, dedup=None, idle_timeout=IDLE_TIMEOUT,
+                 poll_interval=POLL_INTERVAL, max_connections=MAX_CONNECTIONS_PER_ACCOUNT, max_retries=RECONNECT_MAX_RETRIES, metrics=None,
+                 parse_mode="full", email_policy="compat32", reconcile=False, postprocessor=None, controller=None):
+        self.username = username
+        self.password = password
+        if len(folders) > max_connections:
+            print(f"Watching only the first {max_connections} folders ({max_connections} connections per account)")
+        self.folders = list(folders)[:max_connections]
+        self.output_dir = output_dir
+        self.save_attachments = save_attachments
+        self.batch_size = batch_size
+        self.streaming = streaming
+        self.criteria = criteria
+        self.archive_format = archive_format
+        self.search_index = search_index
+        self.workers = workers
+        self.dedup = dedup
+        self.idle_timeout = idle_timeout
+        self.poll_interval = poll_interval
+        self.max_retries = max_retries
+        self.metrics = metrics or Metrics()
+        self.parse_mode = parse_mode
+        self.email_policy = email_policy
+        self.reconcile = reconcile
+        self.postprocessor = postprocessor
+        self.controller = controller
+        self.stopping = threading.Event()
+        self.store = None
+
+    def create_retriever(self):
+        """Create an (unconnected) retriever for one watched folder"""
+        return YahooEmailRetriever(metrics=self.metrics, parse_mode=self.parse_mode, email_policy=self.email_policy,
+                                   postprocessor=self.postprocessor, controller=self.controller)
+
+    def watch(self, folder):
+        """Sync one folder, then keep syncing it whenever new mail arrives"""
+        retriever = self.create_retriever()
+        attempt = 0
+        synced = False
+        try:
+            while not self.stopping.is_set():
+                try:
+                    if not synced:
+                        if not retriever.is_alive():
+                            connected = retriever.reconnect() if retriever.credentials else retriever.connect(self.username, self.password)
+                            if not connected:
+                                raise ConnectionError("Login failed")
+                        new_messages = sum(1 for _ in retriever.iter_sync_folder(
+                            folder=folder,
+                            output_dir=self.output_dir,
+                            save_attachments=self.save_attachments,
+                            batch_size=self.batch_size,
+                            streaming=self.streaming,
+                            criteria=self.criteria,
+                            archive_format=self.archive_format,
+                            search_index=self.search_index,
+                            workers=self.workers,
+                            dedup=self.dedup,
+                            store=self.store
+                        ))
+                        if new_messages:
+                            print(f"{datetime.now():%H:%M:%S} {folder}: {new_messages} new messages")
+                        if retriever.selected_folder != folder:
+                            # sync_folder() could not select the folder (or lost the connection)
+                            raise ConnectionError(f"Could not sync {folder}")
+                        if self.reconcile:
+                            result = retriever.reconcile_folder(folder, self.output_dir)
+                            if result and (result['changed'] or result['expunged']):
+                                print(f"{datetime.now():%H:%M:%S} {folder}: {result['changed']} flag changes, {result['expunged']} expunged")
+                        synced = True
+                        attempt = 0
+                    new_mail = retriever.wait_for_mail(self.idle_timeout, self.poll_interval, self.stopping)
+                    # Flag changes do not wake IDLE, so reconcile at least every idle_timeout
+                    synced = not new_mail and not self.reconcile
+
+                except (imaplib.IMAP4.error, OSError) as e:
+                    synced = False
+                    attempt += 1
+                    self.metrics.inc("retries_total")
+                    if attempt > self.max_retries:
+                        print(f"{folder}: giving up after {self.max_retries} reconnect attempts: {e}")
+                        return
+                    delay = min(RECONNECT_MAX_DELAY, RECONNECT_BASE_DELAY * 2 ** (attempt - 1)) * random.uniform(0.5, 1)
+                    print(f"{folder}: connection problem ({e}); reconnecting in {delay:.1f}s (attempt {attempt}/{self.max_retries})")
+                    if self.stopping.wait(delay):
+                        return
+        finally:
+            retriever.disconnect()
+
+    def run(self):
+        """Watch every folder until stop() is called or Ctrl-C is pressed"""
+        if self.save_attachments:
+            # Shared by all folders, like RetrieverPool.download_folders()
+            self.store = AttachmentStore(os.path.join(self.output_dir, "attachments"), self.metrics)
+        threads = [threading.Thread(target=self.watch, args=(folder,), name=f"watch {folder}", daemon=True) for folder in self.folders]
+        print(f"Watching {', '.join(self.folders)} for new mail (Ctrl-C to stop)")
+        try:
+            for thread in threads:
+                thread.start()
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(1)
+        except KeyboardInterrupt:
+            print("Stopping...")
+            self.stop()
+            for thread in threads:
+                thread.join()
+        finally:
+            if self.store:
+                self.store.close()
+                self.store = None
+
+    def stop(self):
+        """Ask the watch loops to finish"""
+        self.stopping.set()
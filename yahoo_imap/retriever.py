@@ -0,0 +1,411 @@
+'''
+lsvhbavjzyyjtzcn
+'''
+
+import argparse
+import importlib
+import os
+from datetime import datetime, timedelta
+import getpass
+import time
+
+# Only modules that import nothing heavy: imaplib, ssl, sqlite3 and concurrent.futures are
+# imported by main() and the classes that use them, so --help and --search start quickly
+from .index import DEDUP_INDEX_FILE, SEARCH_INDEX_FILE, DedupIndex, MailSearchIndex
+from .journal import FLAGS_FILE
+from .metrics import METRICS_FILE
+from .mime import EMAIL_POLICIES, PARSE_MODES
+from .pacing import MAX_CONNECTIONS_PER_ACCOUNT, POLL_INTERVAL, AdaptiveFetchController, TokenBucket
+from .plugins import ATTACHMENT_PLUGINS, AttachmentPostProcessor
+
+# Classes and helpers that used to be defined in this module, by the module they live in now;
+# they can still be imported from here, which imports their module the first time one is used
+# (yahoo_imap.batch holds the asyncio backend, so runs without --config skip asyncio)
+MOVED_NAMES = {
+    "archive": ("SummaryWriter", "ArchiveWriter", "ArchiveReader"),
+    "batch": ("AsyncYahooEmailRetriever", "archive_accounts", "BatchRunner", "BATCH_REPORT_FILE", "ASYNC_LINE_LIMIT"),
+    "client": ("YahooEmailRetriever", "AttachmentRules", "TeeWriter", "parse_message_worker"),
+    "index": ("MailSearchIndex", "DedupIndex"),
+    "journal": ("DownloadJournal",),
+    "metrics": ("Metrics",),
+    "mime": ("resolve_codec", "load_email_policy", "decode_header_value", "decode_encoded_words", "TransferDecoder"),
+    "pacing": ("TokenBucket", "AdaptiveFetchController"),
+    "plugins": ("AttachmentPlugin", "HashPlugin", "TextPlugin", "ThumbnailPlugin", "run_attachment_plugins", "AttachmentPostProcessor"),
+    "pool": ("RetrieverPool", "SyncDaemon"),
+    "store": ("AttachmentStore", "BlobWriter", "DeferredRefStore"),
+}
+
+
+def __getattr__(name):
+    for module_name, names in MOVED_NAMES.items():
+        if name in names:
+            return getattr(importlib.import_module(f".{module_name}", __package__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def parse_args(argv=None):
+    """Parse the command line; without --config everything else is asked interactively"""
+    parser = argparse.ArgumentParser(description="Download Yahoo email over IMAP")
+    filters = parser.add_argument_group("server-side filters", "applied with IMAP SEARCH before anything is downloaded")
+    filters.add_argument("--since", help="only mail on or after this date (YYYY-MM-DD)")
+    filters.add_argument("--before", help="only mail before this date (YYYY-MM-DD)")
+    filters.add_argument("--last-days", type=int, help="only mail from the last N days")
+    filters.add_argument("--from", dest="sender", help="only mail whose From contains this text")
+    filters.add_argument("--subject", help="only mail whose Subject contains this text")
+    filters.add_argument("--unseen", action="store_true", help="only unread mail")
+    filters.add_argument("--flagged", action="store_true", help="only flagged mail")
+    filters.add_argument("--min-size", type=int, help="only mail of at least this many bytes")
+    filters.add_argument("--max-size", type=int, help="only mail of at most this many bytes")
+    partial = parser.add_argument_group("partial fetch", "read BODYSTRUCTURE first, then fetch only text bodies and matching attachments")
+    partial.add_argument("--partial", action="store_true", help="fetch single-folder downloads section by section")
+    partial.add_argument("--attach-max-size", type=int, metavar="BYTES", help="only download attachments up to this size")
+    partial.add_argument("--attach-type", action="append", metavar="PATTERN", help="only download attachments of this type, e.g. 'image/*' (repeatable)")
+    partial.add_argument("--attach-name", action="append", metavar="PATTERN", help="only download attachments named like this, e.g. '*.pdf' (repeatable)")
+    watch = parser.add_argument_group("watch", "keep running and sync new mail into yahoo_emails/ as it arrives")
+    watch.add_argument("--watch", action="store_true", help="sync the chosen folder (or all, up to one connection each) and wait for new mail with IMAP IDLE")
+    watch.add_argument("--reconcile", action="store_true",
+                       help=f"mirror flag changes and deletions of the chosen folder(s) into {FLAGS_FILE} without downloading bodies; "
+                            "with --watch, after every sync")
+    watch.add_argument("--poll-interval", type=int, default=POLL_INTERVAL, metavar="SECONDS",
+                       help=f"check for new mail this often on servers without IDLE (default {POLL_INTERVAL})")
+    parser.add_argument("--resume", metavar="DIR", help="resume the interrupted download in DIR (prompts only for the login)")
+    parser.add_argument("--config", help="download the accounts listed in this JSON file without prompting (see README) and exit")
+    local = parser.add_argument_group("local search", "full-text index of downloaded mail, no connection needed")
+    local.add_argument("--search", metavar="QUERY", help="search the index (FTS5 syntax, e.g. 'invoice AND sender:flickr') and exit")
+    local.add_argument("--reindex", metavar="DIR", help="add the mail already downloaded in DIR to the index and exit")
+    local.add_argument("--index", default=SEARCH_INDEX_FILE, help=f"search index file (default {SEARCH_INDEX_FILE})")
+    local.add_argument("--no-index", action="store_true", help="do not index mail while downloading")
+    local.add_argument("--results", type=int, default=20, help="number of search results to show (default 20)")
+    parser.add_argument("--dedup", action="store_true", help="skip messages already downloaded by an earlier --dedup run, in any folder")
+    parser.add_argument("--dedup-index", default=DEDUP_INDEX_FILE, help=f"index of already downloaded messages (default {DEDUP_INDEX_FILE})")
+    # Deduplication used to be on by default
+    parser.add_argument("--no-dedup", action="store_false", dest="dedup", help=argparse.SUPPRESS)
+    parsing = parser.add_argument_group("parsing", "how much of each message to parse")
+    parsing.add_argument("--parse", choices=PARSE_MODES, default="full",
+                         help="full: everything; text: headers and the first text part, attachments only if saved; "
+                              "headers: headers only (default full)")
+    parsing.add_argument("--email-policy", choices=list(EMAIL_POLICIES), default="compat32",
+                         help="email package policy for header parsing (default compat32)")
+    postprocess = parser.add_argument_group("attachment post-processing", "run plugins on attachments as they are parsed; "
+                                            "results go in each attachment's 'processed' metadata")
+    postprocess.add_argument("--postprocess", action="append", choices=list(ATTACHMENT_PLUGINS), metavar="PLUGIN",
+                             help=f"plugin to run, one of {', '.join(ATTACHMENT_PLUGINS)} (repeatable)")
+    postprocess.add_argument("--postprocess-workers", type=int, default=4, metavar="N",
+                             help="plugin worker threads, 0 to run them in the parser (default 4)")
+    postprocess.add_argument("--postprocess-processes", action="store_true",
+                             help="run the plugin workers as processes (for CPU-heavy plugins like text and thumbnail)")
+    adaptive = parser.add_argument_group("adaptive fetching", "tune FETCH to what the server allows instead of a fixed batch size")
+    adaptive.add_argument("--adaptive", action="store_true",
+                          help="grow and shrink the FETCH batch size (starting from the one asked for) and the FETCHes in flight "
+                               "from round-trip times, bytes/sec and throttling responses ([UNAVAILABLE], [LIMIT], BYE)")
+    adaptive.add_argument("--max-rate", type=int, metavar="BYTES_PER_SEC", help="cap the account's download rate (implies --adaptive)")
+    metrics = parser.add_argument_group("metrics", f"timings and counters are always saved to {METRICS_FILE} in the output directory")
+    metrics.add_argument("--metrics-port", type=int, metavar="PORT", help="serve Prometheus metrics at http://127.0.0.1:PORT/metrics while running")
+    metrics.add_argument("--metrics-file", metavar="PATH", help="also write the metrics in Prometheus text format to PATH at the end")
+    return parser.parse_args(argv)
+
+def run_search(args):
+    """Handle --reindex and --search against the local index"""
+    import sqlite3
+    search_index = MailSearchIndex(args.index)
+    try:
+        if args.reindex:
+            added = search_index.index_directory(args.reindex)
+            print(f"Indexed {added} new emails from {args.reindex} into {args.index}")
+        if args.search:
+            started = time.perf_counter()
+            try:
+                results = search_index.search(args.search, limit=args.results)
+            except sqlite3.OperationalError as e:
+                print(f"Invalid search query: {e}")
+                return
+            print(f"{len(results)} result(s) in {(time.perf_counter() - started) * 1000:.1f} ms")
+            for result in results:
+                print(f"\n{result['date']}  {result['folder']}/{result['id']}  {result['from']}")
+                print(f"  {result['subject']}")
+                print(f"  {' '.join(result['snippet'].split())}")
+                print(f"  {result['location']}")
+    finally:
+        search_index.close()
+
+def build_controller(args, batch_size, max_in_flight, metrics):
+    """AdaptiveFetchController for --adaptive / --max-rate, or None"""
+    if not (args.adaptive or args.max_rate):
+        return None
+    return AdaptiveFetchController(batch_size, max_in_flight=max_in_flight, bucket=TokenBucket(args.max_rate) if args.max_rate else None,
+                                   metrics=metrics)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.search or args.reindex:
+        run_search(args)
+        return
+    if args.config:
+        if args.resume:
+            # The asyncio backend has no download journal to resume from
+            print("--resume cannot be combined with --config")
+            return
+        import asyncio
+        from .batch import BatchRunner
+        try:
+            runner = BatchRunner.from_file(args.config)
+        except (OSError, ValueError) as e:
+            print(f"Error reading config {args.config}: {e}")
+            return
+        asyncio.run(runner.run())
+        return
+    from .client import AttachmentRules, YahooEmailRetriever
+    from .pool import RetrieverPool, SyncDaemon
+    retriever = YahooEmailRetriever(parse_mode=args.parse, email_policy=args.email_policy)
+
+    since = args.since
+    if args.last_days:
+        since = datetime.now() - timedelta(days=args.last_days)
+    criteria = retriever.build_search_criteria(
+        since=since,
+        before=args.before,
+        sender=args.sender,
+        subject=args.subject,
+        unseen=args.unseen,
+        flagged=args.flagged,
+        min_size=args.min_size,
+        max_size=args.max_size
+    )
+    
+    # Get credentials
+    print("Yahoo Email Retriever")
+    print("Note: You'll need to use an App Password, not your regular Yahoo password")
+    print("Generate one at: https://login.yahoo.com/account/security")
+    print()
+    
+    username = input("Enter your Yahoo email address: ")
+    password = getpass.getpass("Enter your App Password: ")
+    
+    # Connect to Yahoo
+    if not retriever.connect(username, password):
+        return
+
+    search_index = None if args.no_index else MailSearchIndex(args.index)
+    dedup = DedupIndex(args.dedup_index) if args.dedup else None
+    metrics_server = retriever.metrics.serve(args.metrics_port) if args.metrics_port else None
+    if args.postprocess:
+        retriever.postprocessor = AttachmentPostProcessor.from_names(
+            args.postprocess, workers=args.postprocess_workers, processes=args.postprocess_processes, metrics=retriever.metrics)
+    output_dir = args.resume
+
+    if criteria:
+        print(f"Server-side filter: {' '.join(c if isinstance(c, str) else c.decode() for c in criteria)}")
+    
+    try:
+        if args.resume:
+            retriever.controller = build_controller(args, 10, 1, retriever.metrics)
+            retrieved = sum(1 for _ in retriever.iter_resumable(output_dir=args.resume, search_index=search_index, dedup=dedup))
+            print(f"\nRetrieved {retrieved} emails successfully!")
+            return
+
+        # List available folders
+        print("\nAvailable folders:")
+        folders = retriever.list_folders()
+        for i, folder in enumerate(folders, 1):
+            print(f"{i}. {folder}")
+        
+        # Select folder
+        folder_choice = input(f"\nSelect folder (1-{len(folders)}), 'a' for all folders, or press Enter for INBOX: ").strip().lower()
+        all_folders = folder_choice == 'a'
+        if folder_choice.isdigit() and 1 <= int(folder_choice) <= len(folders):
+            selected_folder = folders[int(folder_choice) - 1]
+        else:
+            selected_folder = "INBOX"
+        
+        print(f"Selected folder: {'all folders' if all_folders else selected_folder}")
+
+        if args.reconcile and not args.watch:
+            output_dir = "yahoo_emails"
+            for folder in (folders if all_folders else [selected_folder]):
+                result = retriever.reconcile_folder(folder, output_dir)
+                if result:
+                    print(f"{folder}: {result['changed']} flag changes, {result['expunged']} expunged, "
+                          f"{result['messages']} messages ({result['mode']})")
+            return
+
+        # Ask for incremental sync (watching always syncs incrementally)
+        incremental = args.watch
+        if not all_folders and not args.watch:
+            incremental_input = input("Incremental sync into yahoo_emails/ (only new mail)? (y/n, default=n): ").strip().lower()
+            incremental = incremental_input == 'y'
+        
+        # Ask for headers-only index mode
+        headers_only = False
+        if not incremental and not all_folders:
+            headers_input = input("Index headers only and pick which bodies to download? (y/n, default=n): ").strip().lower()
+            headers_only = headers_input == 'y'
+
+        # Ask for limit
+        limit = None
+        if not incremental and not all_folders and not headers_only:
+            limit_input = input("Enter number of emails to retrieve (or press Enter for all): ").strip()
+            limit = int(limit_input) if limit_input.isdigit() else None
+        
+        # Ask for attachment download preference
+        download_attachments = input("Download attachments? (y/n, default=y): ").strip().lower()
+        save_attachments = download_attachments != 'n'
+
+        # Ask for fetch batch size
+        batch_input = input("Messages per FETCH request (default=100): ").strip()
+        batch_size = int(batch_input) if batch_input.isdigit() and int(batch_input) > 0 else 100
+
+        # Ask for the low-memory parser
+        streaming_input = input("Stream attachments straight to disk (low memory)? (y/n, default=y): ").strip().lower()
+        streaming = streaming_input != 'n'
+
+        # Ask for the storage format
+        format_input = input("Save as (j)son files, (s)egmented archive, (m)box or maildir (d)? (default=j): ").strip().lower()
+        archive_format = {'s': "segments", 'm': "mbox", 'd': "maildir"}.get(format_input, "json")
+
+        # Ask for number of parallel connections
+        connections = 1
+        workers = 0
+        if all_folders and not args.watch:
+            connections_input = input(f"Parallel connections (default=4, max={MAX_CONNECTIONS_PER_ACCOUNT}): ").strip()
+            connections = int(connections_input) if connections_input.isdigit() and int(connections_input) > 0 else 4
+        else:
+            # Ask for parser processes
+            workers_input = input(f"Parser processes (0 = parse in this process, default=0, cores={os.cpu_count()}): ").strip()
+            workers = int(workers_input) if workers_input.isdigit() else 0
+
+        # Connections fetching at the same time: one per pool connection, or per watched folder
+        in_flight = 1
+        if all_folders:
+            in_flight = min(len(folders) if args.watch else connections, MAX_CONNECTIONS_PER_ACCOUNT)
+        retriever.controller = build_controller(args, batch_size, in_flight, retriever.metrics)
+
+        # Retrieve emails
+        output_dir = "yahoo_emails" if incremental else f"yahoo_emails_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        if args.watch:
+            # The daemon opens one connection per folder
+            retriever.disconnect()
+            daemon = SyncDaemon(
+                username,
+                password,
+                folders if all_folders else [selected_folder],
+                output_dir=output_dir,
+                save_attachments=save_attachments,
+                batch_size=batch_size,
+                streaming=streaming,
+                criteria=criteria,
+                archive_format=archive_format,
+                search_index=search_index,
+                workers=workers,
+                dedup=dedup,
+                poll_interval=args.poll_interval,
+                reconcile=args.reconcile,
+                metrics=retriever.metrics,
+                parse_mode=args.parse,
+                email_policy=args.email_policy,
+                postprocessor=retriever.postprocessor,
+                controller=retriever.controller
+            )
+            daemon.run()
+            return
+        if all_folders:
+            pool = RetrieverPool(username, password, size=connections, metrics=retriever.metrics, parse_mode=args.parse,
+                                 email_policy=args.email_policy, postprocessor=retriever.postprocessor, controller=retriever.controller)
+            try:
+                if not pool.open():
+                    return
+                results = pool.download_folders(
+                    folders,
+                    output_dir=output_dir,
+                    save_attachments=save_attachments,
+                    batch_size=batch_size,
+                    streaming=streaming,
+                    criteria=criteria,
+                    archive_format=archive_format,
+                    search_index=search_index,
+                    dedup=dedup
+                )
+            finally:
+                pool.close()
+            retrieved = sum(results.values())
+        elif headers_only:
+            entries = retriever.index_folder(folder=selected_folder, output_dir=output_dir, batch_size=max(batch_size, 500), criteria=criteria)
+            match_text = input("Download bodies of messages whose subject/sender contains (Enter for none, * for all): ").strip().lower()
+            attachments_input = input("Only messages with attachments? (y/n, default=n): ").strip().lower()
+            retrieved = 0
+            if match_text:
+                retrieved = len(retriever.download_selected(
+                    selected_folder,
+                    entries,
+                    lambda entry: (match_text == '*' or match_text in entry['subject'].lower() or match_text in entry['from'].lower())
+                    and (attachments_input != 'y' or entry['attachment_count'] > 0),
+                    output_dir=output_dir,
+                    save_attachments=save_attachments,
+                    batch_size=batch_size,
+                    streaming=streaming,
+                    archive_format=archive_format,
+                    search_index=search_index,
+                    workers=workers,
+                    dedup=dedup
+                ))
+            print(f"\nIndexed {len(entries)} emails")
+        elif incremental:
+            retrieved = sum(1 for _ in retriever.iter_sync_folder(
+                folder=selected_folder,
+                output_dir=output_dir,
+                save_attachments=save_attachments,
+                batch_size=batch_size,
+                streaming=streaming,
+                criteria=criteria,
+                archive_format=archive_format,
+                search_index=search_index,
+                workers=workers,
+                dedup=dedup
+            ))
+        elif args.partial:
+            retrieved = sum(1 for _ in retriever.iter_partial(
+                folder=selected_folder,
+                limit=limit,
+                output_dir=output_dir,
+                rules=AttachmentRules(args.attach_max_size, args.attach_type, args.attach_name, download=save_attachments),
+                batch_size=batch_size,
+                criteria=criteria,
+                search_index=search_index,
+                dedup=dedup
+            ))
+        else:
+            # Only counted, so memory does not grow with the folder
+            retrieved = sum(1 for _ in retriever.iter_resumable(
+                folder=selected_folder,
+                limit=limit,
+                output_dir=output_dir,
+                save_attachments=save_attachments,
+                batch_size=batch_size,
+                streaming=streaming,
+                criteria=criteria,
+                archive_format=archive_format,
+                search_index=search_index,
+                workers=workers,
+                dedup=dedup
+            ))
+        
+        print(f"\nRetrieved {retrieved} emails successfully!")
+        
+    finally:
+        retriever.disconnect()
+        if retriever.controller:
+            print(retriever.controller.describe())
+        if retriever.postprocessor:
+            retriever.postprocessor.close()
+        if search_index:
+            search_index.close()
+        if dedup:
+            dedup.close()
+        if metrics_server:
+            metrics_server.shutdown()
+        if output_dir and os.path.isdir(output_dir):
+            print(f"Metrics saved to {retriever.metrics.write_json(os.path.join(output_dir, METRICS_FILE))}")
+        if args.metrics_file:
+            retriever.metrics.write_prometheus(args.metrics_file)
+
+if __name__ == "__main__":
+    main()
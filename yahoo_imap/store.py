@@ -0,0 +1,169 @@
+'''
+Content-addressed attachment store with a reference-count index.
+'''
+
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from .plugins import THUMBNAIL_SUFFIX
+
+# SQLite reference index kept inside the attachment store
+ATTACHMENT_INDEX_FILE = "index.sqlite"
+
+
+class AttachmentStore:
+    """Content-addressed attachment storage with reference counting
+
+    Attachments are stored once per distinct content at
+    <root>/<aa>/<bb>/<sha256>, where aa and bb are the first two byte pairs
+    of the hash. A SQLite index records which emails reference each blob,
+    so blobs nobody references any more can be garbage collected.
+    """
+
+    def __init__(self, root, metrics=None):
+        self.root = root
+        self.metrics = metrics
+        os.makedirs(os.path.join(root, "tmp"), exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(os.path.join(root, ATTACHMENT_INDEX_FILE), check_same_thread=False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS blobs (sha256 TEXT PRIMARY KEY, size INTEGER, refcount INTEGER NOT NULL DEFAULT 0)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS refs (sha256 TEXT NOT NULL, ref TEXT NOT NULL, PRIMARY KEY (sha256, ref))")
+        self.db.execute("CREATE INDEX IF NOT EXISTS refs_by_ref ON refs (ref)")
+        self.db.commit()
+
+    def blob_path(self, sha256):
+        """Path of the blob with the given hash"""
+        return os.path.join(self.root, sha256[:2], sha256[2:4], sha256)
+
+    def open_writer(self):
+        """Return a BlobWriter that hashes data while spooling it to a temp file"""
+        return BlobWriter(self)
+
+    def put(self, data, ref=None):
+        """Store bytes and return (sha256, path, stored) where stored is False for duplicates"""
+        writer = self.open_writer()
+        writer.write(data)
+        sha256, path, stored = writer.commit()
+        if ref:
+            self.add_ref(sha256, len(data), ref)
+        return sha256, path, stored
+
+    def add_ref(self, sha256, size, ref):
+        """Record that ref (e.g. an email JSON path) uses the blob"""
+        with self.lock:
+            self.db.execute("INSERT OR IGNORE INTO blobs (sha256, size) VALUES (?, ?)", (sha256, size))
+            cursor = self.db.execute("INSERT OR IGNORE INTO refs (sha256, ref) VALUES (?, ?)", (sha256, ref))
+            if cursor.rowcount:
+                self.db.execute("UPDATE blobs SET refcount = refcount + 1 WHERE sha256 = ?", (sha256,))
+            self.db.commit()
+
+    def release(self, ref):
+        """Drop every reference held by ref, return the number released"""
+        with self.lock:
+            rows = self.db.execute("SELECT sha256 FROM refs WHERE ref = ?", (ref,)).fetchall()
+            for (sha256,) in rows:
+                self.db.execute("UPDATE blobs SET refcount = refcount - 1 WHERE sha256 = ?", (sha256,))
+            self.db.execute("DELETE FROM refs WHERE ref = ?", (ref,))
+            self.db.commit()
+        return len(rows)
+
+    def gc(self, check_refs=False):
+        """Delete blobs with no references, return the number deleted
+
+        With check_refs, references that are file paths which no longer
+        exist are released first (for archive entries, "<archive_dir>#<key>",
+        the archive directory is checked).
+        """
+        if check_refs:
+            with self.lock:
+                refs = [ref for (ref,) in self.db.execute("SELECT DISTINCT ref FROM refs")]
+            for ref in refs:
+                if not os.path.exists(ref.split("#", 1)[0]):
+                    self.release(ref)
+
+        with self.lock:
+            unreferenced = [sha256 for (sha256,) in self.db.execute("SELECT sha256 FROM blobs WHERE refcount <= 0")]
+            for sha256 in unreferenced:
+                # The blob and its thumbnail, if the thumbnail plugin made one
+                for path in (self.blob_path(sha256), self.blob_path(sha256) + THUMBNAIL_SUFFIX):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                self.db.execute("DELETE FROM blobs WHERE sha256 = ?", (sha256,))
+            self.db.commit()
+        return len(unreferenced)
+
+    def close(self):
+        """Close the index database"""
+        with self.lock:
+            self.db.close()
+
+
+class BlobWriter:
+    """Incremental writer for one AttachmentStore blob"""
+
+    def __init__(self, store):
+        self.store = store
+        self.hasher = hashlib.sha256()
+        self.size = 0
+        self.seconds = 0.0
+        fd, self.tmp_path = tempfile.mkstemp(dir=os.path.join(store.root, "tmp"))
+        self.file = os.fdopen(fd, 'wb')
+
+    def write(self, data):
+        started = time.perf_counter()
+        self.hasher.update(data)
+        self.size += len(data)
+        self.file.write(data)
+        self.seconds += time.perf_counter() - started
+
+    def commit(self):
+        """Move the data into place and return (sha256, path, stored)
+
+        stored is False when an identical blob already existed. The write
+        time and size go to the store's metrics, if it has any.
+        """
+        started = time.perf_counter()
+        self.file.close()
+        sha256 = self.hasher.hexdigest()
+        path = self.store.blob_path(sha256)
+        stored = not os.path.exists(path)
+        if stored:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(self.tmp_path, path)
+        else:
+            os.remove(self.tmp_path)
+        if self.store.metrics:
+            self.store.metrics.observe("attachment_write_seconds", self.seconds + time.perf_counter() - started)
+            self.store.metrics.inc("attachment_bytes_total", self.size)
+        return sha256, path, stored
+
+    def abort(self):
+        """Throw the data away"""
+        self.file.close()
+        os.remove(self.tmp_path)
+
+
+class DeferredRefStore(AttachmentStore):
+    """AttachmentStore view for worker processes
+
+    Blobs are written to the shared store directory as usual (moves into
+    place are atomic), but references are only collected in refs so the
+    parent process can record them in the index.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.refs = []
+        self.metrics = None
+
+    def add_ref(self, sha256, size, ref):
+        self.refs.append((sha256, size, ref))
+
+    def close(self):
+        pass